@@ -1,69 +1,116 @@
 from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.utils.functional import SimpleLazyObject
+from .tenant import carregar_tenant
+import re
+
+# Rotas públicas: atendidas sem sessão nem usuário (tráfego anônimo de agendamento)
+ROTAS_PUBLICAS = [
+    '/agendamento/',
+    '/static/',
+    '/media/',
+]
+
+# Rotas que dispensam o controle por tipo de usuário, mas usam a sessão
+ROTAS_LIVRES = [
+    '/login/',
+    '/logout/',
+    '/password-reset/',
+    '/django-admin/',
+]
+
+# Prefixos permitidos para cada tipo de usuário e para onde redirecionar fora deles
+ROTAS_POR_TIPO = {
+    # Administradores podem acessar apenas o painel admin
+    'admin': (['/admin-panel/'], 'admin_panel:dashboard'),
+    # Comerciantes podem acessar apenas o painel comerciante
+    'comerciante': (['/comerciante/'], 'comerciante_panel:dashboard'),
+    # Funcionários podem acessar apenas algumas partes do painel comerciante
+    'funcionario': (
+        [
+            '/comerciante/funcionario-dashboard/',
+            '/comerciante/agendamentos/',
+            '/profile/',
+        ],
+        'comerciante_panel:funcionario_dashboard'
+    ),
+}
+
+
+def _compilar(prefixos):
+    """Uma única expressão regular ancorada no início do caminho para a lista de prefixos"""
+    return re.compile('|'.join(re.escape(prefixo) for prefixo in prefixos))
+
+
+# Compilado uma vez na carga do módulo: cada requisição faz um único match por verificação
+_POLITICAS = re.compile(
+    f'(?P<publica>{_compilar(ROTAS_PUBLICAS).pattern})|(?P<livre>{_compilar(ROTAS_LIVRES).pattern})'
+)
+_ACESSO_POR_TIPO = {
+    tipo: (_compilar(prefixos), destino)
+    for tipo, (prefixos, destino) in ROTAS_POR_TIPO.items()
+}
+
+
+def politica_rota(path):
+    """'publica', 'livre' ou None (rota que exige usuário autenticado do tipo certo)"""
+    match = _POLITICAS.match(path)
+    return match.lastgroup if match else None
+
+
+class PublicPathSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware que não regrava a sessão nas rotas públicas. Com
+    SESSION_SAVE_EVERY_REQUEST, um visitante logado abrindo a página de agendamento
+    custaria uma leitura e uma escrita na tabela de sessões a cada requisição.
+    """
+
+    def process_response(self, request, response):
+        if politica_rota(request.path) == 'publica' and not request.session.modified:
+            return response
+        return super().process_response(request, response)
+
 
 class UserTypeMiddleware:
     """
     Middleware para controlar acesso baseado no tipo de usuário
     """
-    
+
     def __init__(self, get_response):
         self.get_response = get_response
-    
+
     def __call__(self, request):
-        # URLs que não precisam de verificação
-        allowed_urls = [
-            '/login/',
-            '/logout/',
-            '/password-reset/',
-            '/django-admin/',
-            '/static/',
-            '/media/',
-        ]
-        
-        # URLs que começam com agendamento são públicas
-        public_urls = ['/agendamento/']
-        
-        # Verificar se a URL atual está nas permitidas
-        current_path = request.path
-        
-        # Permitir URLs específicas
-        if any(current_path.startswith(url) for url in allowed_urls + public_urls):
-            response = self.get_response(request)
-            return response
-        
+        politica = politica_rota(request.path)
+
+        # Rotas públicas são tratadas como anônimas antes de qualquer consulta de sessão ou usuário
+        if politica == 'publica':
+            request.user = AnonymousUser()
+            return self.get_response(request)
+
+        # Contexto do estabelecimento, carregado no primeiro uso e no máximo uma vez por requisição
+        request.tenant = SimpleLazyObject(lambda: carregar_tenant(request.user))
+
+        if politica == 'livre':
+            return self.get_response(request)
+
         # Se usuário não está logado, redirecionar para login
         if not request.user.is_authenticated:
             return redirect('accounts:login')
-        
+
         # Verificar se usuário está ativo
         if not request.user.ativo:
             messages.error(request, 'Sua conta está desativada.')
             return redirect('accounts:logout')
-        
+
         # Controle de acesso baseado no tipo de usuário
-        user_type = request.user.tipo_usuario
-        
-        # Administradores podem acessar apenas o painel admin
-        if user_type == 'admin':
-            if not current_path.startswith('/admin-panel/'):
-                return redirect('admin_panel:dashboard')
-        
-        # Comerciantes podem acessar apenas o painel comerciante
-        elif user_type == 'comerciante':
-            if not current_path.startswith('/comerciante/'):
-                return redirect('comerciante_panel:dashboard')
-        
-        # Funcionários podem acessar apenas algumas partes do painel comerciante
-        elif user_type == 'funcionario':
-            allowed_funcionario_urls = [
-                '/comerciante/funcionario-dashboard/',
-                '/comerciante/agendamentos/',
-                '/profile/',
-            ]
-            if not any(current_path.startswith(url) for url in allowed_funcionario_urls):
-                return redirect('comerciante_panel:funcionario_dashboard')
-        
+        acesso = _ACESSO_POR_TIPO.get(request.user.tipo_usuario)
+        if acesso is not None:
+            prefixos, destino = acesso
+            if not prefixos.match(request.path):
+                return redirect(destino)
+
         response = self.get_response(request)
         return response
-
@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from salao_agendamento.replicas import ler_do_primario
+from salao_agendamento.shards import primeiro_nos_shards
+
+
+class Tenant:
+    """
+    Contexto do estabelecimento do usuário autenticado: o papel (tipo_usuario), o
+    comerciante e, para funcionários, o registro de funcionário. Carregado uma vez
+    por requisição pelo UserTypeMiddleware e disponível em request.tenant.
+    """
+
+    def __init__(self, papel=None, comerciante=None, funcionario=None):
+        self.papel = papel
+        self.comerciante = comerciante
+        self.funcionario = funcionario
+
+    @property
+    def comerciante_id(self):
+        return self.comerciante.id if self.comerciante else None
+
+    def __repr__(self):
+        return f"<Tenant {self.papel} comerciante={self.comerciante_id}>"
+
+
+def _chave(user_id):
+    return f'tenant_usuario_{user_id}'
+
+
+def _buscar_tenant(user):
+    """
+    Uma consulta por papel: o funcionário já vem com o comerciante (select_related).
+    No modo de shards, procura em cada shard até encontrar o estabelecimento.
+    """
+    from agendamento.models import Comerciante, Funcionario
+
+    if user.is_comerciante():
+        comerciante = primeiro_nos_shards(lambda: Comerciante.objects.filter(user_id=user.id).first())
+        return Tenant(user.tipo_usuario, comerciante=comerciante)
+    if user.is_funcionario():
+        funcionario = primeiro_nos_shards(
+            lambda: Funcionario.objects.select_related('comerciante').filter(user_id=user.id).first()
+        )
+        return Tenant(
+            user.tipo_usuario,
+            comerciante=funcionario.comerciante if funcionario else None,
+            funcionario=funcionario,
+        )
+    return Tenant(user.tipo_usuario)
+
+
+def carregar_tenant(user):
+    """
+    Tenant do usuário, do cache quando possível. As relações user.comerciante e
+    user.funcionario ficam preenchidas para que views e templates não consultem de novo.
+    """
+    if not user.is_authenticated:
+        return Tenant()
+
+    tenant = cache.get(_chave(user.id))
+    if tenant is None or tenant.papel != user.tipo_usuario:
+        # Sempre do principal, mesmo em uma view @leitura_replica: o tenant fica em cache e
+        # o _state.db do comerciante decide o shard e o banco das transações de escrita
+        with ler_do_primario():
+            tenant = _buscar_tenant(user)
+        cache.set(_chave(user.id), tenant, getattr(settings, 'TENANT_CACHE_SEGUNDOS', 300))
+
+    if tenant.funcionario is not None:
+        user.funcionario = tenant.funcionario
+    elif tenant.comerciante is not None and user.is_comerciante():
+        user.comerciante = tenant.comerciante
+    return tenant
+
+
+def invalidar_tenant(*user_ids):
+    """Descarta o tenant em cache dos usuários (ex.: funcionário editado)"""
+    cache.delete_many([_chave(user_id) for user_id in user_ids])
+
+
+def invalidar_tenant_comerciante(comerciante):
+    """Descarta o tenant do comerciante e de toda a equipe, que carregam o mesmo estabelecimento"""
+    invalidar_tenant(comerciante.user_id, *comerciante.funcionarios.values_list('user_id', flat=True))
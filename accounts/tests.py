@@ -1,3 +1,207 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from agendamento.suporte_testes import criar_estabelecimento
+from . import tenant
+from .middleware import UserTypeMiddleware
+from .models import User
+from .websocket_middleware import CachedAuthMiddlewareStack, _chave_sessao, invalidar_usuario
+
+
+class EcoUsuarioConsumer(AsyncJsonWebsocketConsumer):
+    """Devolve o usuário e o estabelecimento resolvidos pelo middleware"""
+
+    async def connect(self):
+        await self.accept()
+        await self.send_json({
+            'user_id': self.scope['user'].id,
+            'comerciante_id': self.scope['comerciante_id'],
+        })
+
+
+class CachedSessionAuthMiddlewareTests(TransactionTestCase):
+    """Autenticação dos websockets com a sessão resolvida pelo cache"""
+
+    def setUp(self):
+        cache.clear()
+        self.comerciante, _, self.funcionario = criar_estabelecimento()
+        self.client.force_login(self.funcionario.user)
+        self.session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def conectar(self):
+        async def conectar():
+            comunicador = WebsocketCommunicator(
+                CachedAuthMiddlewareStack(EcoUsuarioConsumer.as_asgi()),
+                '/ws/notifications/',
+                headers=[(b'cookie', f'{settings.SESSION_COOKIE_NAME}={self.session_key}'.encode())],
+            )
+            conectado, _ = await comunicador.connect()
+            self.assertTrue(conectado)
+            dados = await comunicador.receive_json_from()
+            await comunicador.disconnect()
+            return dados
+
+        return async_to_sync(conectar)()
+
+    def test_sessao_em_cache_nao_consulta_o_banco(self):
+        esperado = {'user_id': self.funcionario.user_id, 'comerciante_id': self.comerciante.id}
+        self.assertEqual(self.conectar(), esperado)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.conectar(), esperado)
+
+    def test_logout_descarta_a_sessao_do_cache(self):
+        self.conectar()
+        self.assertIsNotNone(cache.get(_chave_sessao(self.session_key)))
+
+        self.client.get('/logout/')
+
+        self.assertIsNone(cache.get(_chave_sessao(self.session_key)))
+        self.assertIsNone(self.conectar()['user_id'])
+
+    def test_nova_versao_do_usuario_volta_ao_banco(self):
+        self.conectar()
+        invalidar_usuario(self.funcionario.user_id)
+
+        with self.assertNumQueries(3):
+            self.assertEqual(self.conectar()['user_id'], self.funcionario.user_id)
+
+    def test_usuario_desativado_e_recusado(self):
+        self.conectar()
+        user = self.funcionario.user
+        user.ativo = False
+        user.save()
+        invalidar_usuario(user.id)
+
+        self.assertIsNone(self.conectar()['user_id'])
+
+
+class UserTypeMiddlewareTests(TestCase):
+    """Acesso por tipo de usuário: (tipo, caminho) -> None (atendido) ou destino do redirecionamento"""
+
+    ACESSOS = [
+        ('admin', '/admin-panel/', None),
+        ('admin', '/comerciante/', '/admin-panel/'),
+        ('admin', '/agendamento/1/', None),
+        ('comerciante', '/admin-panel/', '/comerciante/'),
+        ('comerciante', '/comerciante/', None),
+        ('comerciante', '/agendamento/1/', None),
+        ('funcionario', '/admin-panel/', '/comerciante/funcionario-dashboard/'),
+        ('funcionario', '/comerciante/', '/comerciante/funcionario-dashboard/'),
+        ('funcionario', '/comerciante/agendamentos/', None),
+        ('funcionario', '/agendamento/1/', None),
+        # Tipos sem regra própria só passam pelo login; as views fazem o resto
+        ('cliente', '/admin-panel/', None),
+        ('cliente', '/comerciante/', None),
+        ('cliente', '/agendamento/1/', None),
+        (None, '/admin-panel/', '/login/'),
+        (None, '/comerciante/', '/login/'),
+        (None, '/agendamento/1/', None),
+        (None, '/login/', None),
+    ]
+
+    def atender(self, user, caminho):
+        request = RequestFactory().get(caminho)
+        request.user = user
+        return request, UserTypeMiddleware(lambda request: HttpResponse('ok'))(request)
+
+    def test_acesso_por_tipo(self):
+        for tipo, caminho, destino in self.ACESSOS:
+            with self.subTest(tipo=tipo, caminho=caminho):
+                user = User(username=f'u_{tipo}', tipo_usuario=tipo) if tipo else AnonymousUser()
+                _, resposta = self.atender(user, caminho)
+                if destino is None:
+                    self.assertEqual(resposta.status_code, 200)
+                else:
+                    self.assertEqual((resposta.status_code, resposta['Location']), (302, destino))
+
+    def test_usuario_desativado_vai_para_o_logout(self):
+        user = User.objects.create_user(username='inativo', tipo_usuario='comerciante', ativo=False)
+        self.client.force_login(user)
+
+        resposta = self.client.get('/comerciante/')
+
+        self.assertRedirects(resposta, '/logout/', fetch_redirect_response=False)
+
+    def test_rota_publica_nao_consulta_sessao(self):
+        comerciante, _, _ = criar_estabelecimento()
+        self.client.force_login(comerciante.user)
+
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(f'/agendamento/{comerciante.id}/')
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIsInstance(resposta.wsgi_request.user, AnonymousUser)
+        tabelas = ' '.join(consulta['sql'] for consulta in consultas.captured_queries)
+        self.assertNotIn('django_session', tabelas)
+        self.assertNotIn('accounts_user', tabelas)
+
+
+class TenantTests(TestCase):
+    """request.tenant: carregado sob demanda, em cache entre requisições e invalidado nas edições"""
+
+    def setUp(self):
+        cache.clear()
+        self.comerciante, _, self.funcionario = criar_estabelecimento()
+
+    def buscas(self):
+        return mock.patch('accounts.tenant._buscar_tenant', wraps=tenant._buscar_tenant)
+
+    def aquecer(self, user, url):
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIsNotNone(cache.get(tenant._chave(user.id)))
+
+    def test_uma_busca_por_requisicao_e_cache_na_seguinte(self):
+        self.client.force_login(self.comerciante.user)
+        with self.buscas() as buscar:
+            self.assertEqual(self.client.get('/comerciante/').status_code, 200)
+            self.assertEqual(buscar.call_count, 1)
+            self.assertEqual(self.client.get('/comerciante/servicos/').status_code, 200)
+            self.assertEqual(buscar.call_count, 1)
+
+    def test_edicao_do_funcionario_invalida(self):
+        self.aquecer(self.funcionario.user, '/comerciante/funcionario-dashboard/')
+
+        self.client.force_login(self.comerciante.user)
+        resposta = self.client.post(f'/comerciante/funcionarios/{self.funcionario.pk}/edit/', {
+            'username': 'funcionario', 'email': 'f@teste.com', 'first_name': 'Ana', 'last_name': 'Lima',
+            'especialidades': 'Coloração', 'horario_trabalho': '08:00-18:00', 'ativo': 'on',
+        })
+
+        self.assertEqual(resposta.status_code, 302)
+        self.assertIsNone(cache.get(tenant._chave(self.funcionario.user_id)))
+        self.assertEqual(tenant.carregar_tenant(self.funcionario.user).funcionario.especialidades, 'Coloração')
+
+    def test_edicao_do_comerciante_invalida_a_equipe(self):
+        self.aquecer(self.funcionario.user, '/comerciante/funcionario-dashboard/')
+        self.aquecer(self.comerciante.user, '/comerciante/')
+
+        resposta = self.client.post('/comerciante/configuracoes/', {
+            'nome_salao': 'Salão Novo', 'endereco': 'Rua B', 'telefone_comercial': '1', 'horario_funcionamento': '-',
+        })
+
+        self.assertEqual(resposta.status_code, 302)
+        for user in (self.comerciante.user, self.funcionario.user):
+            self.assertIsNone(cache.get(tenant._chave(user.id)))
+            self.assertEqual(tenant.carregar_tenant(user).comerciante.nome_salao, 'Salão Novo')
+
+    def test_comerciante_desativado_nao_vem_do_cache(self):
+        self.aquecer(self.funcionario.user, '/comerciante/funcionario-dashboard/')
+        self.assertTrue(tenant.carregar_tenant(self.funcionario.user).comerciante.ativo)
+
+        self.client.force_login(User.objects.create_user(username='admin', tipo_usuario='admin'))
+        with mock.patch('admin_panel.views.desconectar_usuarios'):
+            self.client.post(f'/admin-panel/comerciantes/{self.comerciante.pk}/delete/')
+
+        self.assertFalse(tenant.carregar_tenant(self.funcionario.user).comerciante.ativo)
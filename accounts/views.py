@@ -12,6 +12,7 @@ from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.http import HttpResponse
 from .models import User
+from .websocket_middleware import invalidar_sessao
 from agendamento.models import Comerciante
 
 def login_view(request):
@@ -42,6 +43,8 @@ def logout_view(request):
     """
     View para logout do usuário
     """
+    # A sessão deixa de autenticar websockets imediatamente, sem esperar o TTL do cache
+    invalidar_sessao(request.session.session_key)
     logout(request)
     messages.success(request, 'Você foi desconectado com sucesso.')
     return redirect('accounts:login')
@@ -0,0 +1,120 @@
+from channels.auth import get_user
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from channels.sessions import CookieMiddleware, SessionMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+import uuid
+
+from .models import User
+from salao_agendamento.shards import primeiro_nos_shards
+
+
+def _cache():
+    return caches[getattr(settings, 'WEBSOCKET_AUTH_CACHE', 'default')]
+
+
+def _chave_sessao(session_key):
+    return f'ws_auth_sessao_{session_key}'
+
+
+def _chave_versao(user_id):
+    return f'ws_auth_versao_{user_id}'
+
+
+def invalidar_sessao(session_key):
+    """Descarta o usuário em cache de uma sessão (ex.: no logout)"""
+    if session_key:
+        _cache().delete(_chave_sessao(session_key))
+
+
+def invalidar_usuario(user_id):
+    """Invalida todas as sessões em cache de um usuário (ex.: conta desativada)"""
+    _cache().set(_chave_versao(user_id), uuid.uuid4().hex, None)
+
+
+async def _versao_usuario(cache, user_id):
+    # A versão nunca fica vazia: se for descartada do cache, as entradas antigas deixam de valer
+    await cache.aadd(_chave_versao(user_id), uuid.uuid4().hex, None)
+    return await cache.aget(_chave_versao(user_id))
+
+
+@database_sync_to_async
+def _resolver_comerciante_id(user):
+    """Id do estabelecimento do usuário (comerciante ou funcionário)"""
+    from agendamento.models import Comerciante, Funcionario
+
+    if user.is_comerciante():
+        return primeiro_nos_shards(lambda: Comerciante.objects.filter(user=user).values_list('id', flat=True).first())
+    if user.is_funcionario():
+        return primeiro_nos_shards(
+            lambda: Funcionario.objects.filter(user=user).values_list('comerciante_id', flat=True).first()
+        )
+    return None
+
+
+class CachedSessionAuthMiddleware(BaseMiddleware):
+    """
+    Autenticação dos websockets com cache de curta duração da sessão para o usuário
+    (id, tipo_usuario e estabelecimento). Em uma rajada de reconexões, cada sessão
+    consulta a tabela de sessões e a de usuários no máximo uma vez por TTL.
+    Também preenche scope['comerciante_id'].
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        session_key = scope.get('cookies', {}).get(settings.SESSION_COOKIE_NAME)
+
+        dados = await self._do_cache(session_key) if session_key else None
+        if dados is None and session_key:
+            dados = await self._resolver(scope, session_key)
+
+        if dados is None:
+            scope['user'] = AnonymousUser()
+            scope['comerciante_id'] = None
+        else:
+            scope['user'] = User(
+                id=dados['id'],
+                username=dados['username'],
+                tipo_usuario=dados['tipo_usuario'],
+                ativo=True,
+            )
+            scope['comerciante_id'] = dados['comerciante_id']
+
+        return await super().__call__(scope, receive, send)
+
+    async def _do_cache(self, session_key):
+        cache = _cache()
+        dados = await cache.aget(_chave_sessao(session_key))
+        if dados is None:
+            return None
+        if await cache.aget(_chave_versao(dados['id'])) != dados['versao']:
+            return None
+        return dados
+
+    async def _resolver(self, scope, session_key):
+        """Caminho sem cache: sessão e usuário vêm do banco, como no AuthMiddleware"""
+        user = await get_user(scope)
+        if not user.is_authenticated or not user.ativo:
+            return None
+
+        cache = _cache()
+        dados = {
+            'id': user.id,
+            'username': user.username,
+            'tipo_usuario': user.tipo_usuario,
+            'comerciante_id': await _resolver_comerciante_id(user),
+            'versao': await _versao_usuario(cache, user.id),
+        }
+        await cache.aset(
+            _chave_sessao(session_key),
+            dados,
+            getattr(settings, 'WEBSOCKET_AUTH_CACHE_SEGUNDOS', 30)
+        )
+        return dados
+
+
+def CachedAuthMiddlewareStack(inner):
+    """Equivalente ao AuthMiddlewareStack do Channels, com a sessão resolvida pelo cache"""
+    return CookieMiddleware(SessionMiddleware(CachedSessionAuthMiddleware(inner)))
@@ -1,3 +1,23 @@
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import User
+from agendamento.suporte_testes import criar_estabelecimento
+
+
+class ComercianteDeleteTests(TestCase):
+    """Desativação de um comerciante pelo painel admin"""
+
+    def setUp(self):
+        self.comerciante, _, self.funcionario = criar_estabelecimento()
+        self.client.force_login(User.objects.create_user(username='admin', tipo_usuario='admin'))
+
+    def test_desconecta_comerciante_e_equipe(self):
+        with mock.patch('admin_panel.views.desconectar_usuarios') as desconectar:
+            resposta = self.client.post(f'/admin-panel/comerciantes/{self.comerciante.pk}/delete/')
+
+        self.assertEqual(resposta.status_code, 302)
+        desconectar.assert_called_once_with([self.comerciante.user_id, self.funcionario.user_id])
+        self.comerciante.refresh_from_db()
+        self.assertFalse(self.comerciante.ativo)
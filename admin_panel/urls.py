@@ -9,5 +9,7 @@ urlpatterns = [
     path('comerciantes/create/', views.comerciante_create, name='comerciante_create'),
     path('comerciantes/<int:pk>/edit/', views.comerciante_edit, name='comerciante_edit'),
     path('comerciantes/<int:pk>/delete/', views.comerciante_delete, name='comerciante_delete'),
+    path('metricas/', views.metricas, name='metricas'),
+    path('metricas/prometheus/', views.metricas_prometheus, name='metricas_prometheus'),
 ]
 
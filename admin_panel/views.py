@@ -3,31 +3,49 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.db.models import Count, Q
 from django.core.paginator import Paginator
+from django.http import HttpResponse, JsonResponse
 from accounts.models import User
 from agendamento.models import Comerciante, Agendamento
+from agendamento.presenca import metricas_presenca
+from agendamento.canais import metricas_canais
+from agendamento.consumers import desconectar_usuarios
+from accounts.websocket_middleware import invalidar_usuario
+from accounts.tenant import invalidar_tenant_comerciante
+from salao_agendamento import perfil
+from salao_agendamento.replicas import leitura_replica
+from salao_agendamento.shards import (
+    ativo as shards_ativos, consultar_shards, escolher_shard_novo, fixar_shard, registrar_comerciante,
+    shard_do_comerciante, usar_shard,
+)
 from django.db import transaction
+from itertools import chain
 
 def is_admin(user):
     return user.is_authenticated and user.is_admin()
 
 @login_required
 @user_passes_test(is_admin)
+@leitura_replica
 def dashboard(request):
     """
     Dashboard principal do administrador
     """
-    # Estatísticas gerais
-    total_comerciantes = Comerciante.objects.filter(ativo=True).count()
+    # Estatísticas gerais (somadas entre os shards, com sharding ativo)
+    total_comerciantes = sum(consultar_shards(lambda: Comerciante.objects.filter(ativo=True).count()))
     total_usuarios = User.objects.filter(ativo=True).count()
-    total_agendamentos = Agendamento.objects.count()
+    total_agendamentos = sum(consultar_shards(lambda: Agendamento.objects.count()))
     
     # Comerciantes recentes
-    comerciantes_recentes = Comerciante.objects.filter(ativo=True).order_by('-data_criacao')[:5]
+    comerciantes_recentes = _mais_recentes(consultar_shards(
+        lambda: list(Comerciante.objects.filter(ativo=True).order_by('-data_criacao')[:5])
+    ), 5)
     
     # Agendamentos recentes
-    agendamentos_recentes = Agendamento.objects.select_related(
-        'comerciante', 'cliente', 'servico'
-    ).order_by('-data_criacao')[:10]
+    agendamentos_recentes = _mais_recentes(consultar_shards(
+        lambda: list(Agendamento.objects.select_related(
+            'comerciante', 'cliente', 'servico'
+        ).order_by('-data_criacao')[:10])
+    ), 10)
     
     context = {
         'total_comerciantes': total_comerciantes,
@@ -39,8 +57,17 @@ def dashboard(request):
     
     return render(request, 'admin_panel/dashboard.html', context)
 
+def _mais_recentes(listas, limite):
+    """
+    Junta as listas de cada shard pela data de criação (sem sharding há uma só lista)
+    """
+    if len(listas) == 1:
+        return listas[0]
+    return sorted(chain.from_iterable(listas), key=lambda obj: obj.data_criacao, reverse=True)[:limite]
+
 @login_required
 @user_passes_test(is_admin)
+@leitura_replica
 def comerciantes_list(request):
     """
     Lista todos os comerciantes com filtros e paginação
@@ -66,6 +93,10 @@ def comerciantes_list(request):
     
     comerciantes = comerciantes.order_by('-data_criacao')
     
+    if shards_ativos():
+        # Com sharding, pagina a lista já reunida dos shards
+        comerciantes = _mais_recentes(consultar_shards(lambda: list(comerciantes.all())), None)
+    
     # Paginação
     paginator = Paginator(comerciantes, 10)
     page_number = request.GET.get('page')
@@ -87,7 +118,9 @@ def comerciante_create(request):
     """
     if request.method == 'POST':
         try:
-            with transaction.atomic():
+            # O comerciante vai para o shard com menos comerciantes; o usuário, para o principal
+            shard = escolher_shard_novo()
+            with transaction.atomic(), transaction.atomic(using=shard), usar_shard(shard):
                 # Criar usuário
                 user = User.objects.create_user(
                     username=request.POST['username'],
@@ -108,6 +141,7 @@ def comerciante_create(request):
                     telefone_comercial=request.POST['telefone_comercial'],
                     horario_funcionamento=request.POST['horario_funcionamento']
                 )
+                registrar_comerciante(comerciante)
                 
                 messages.success(request, f'Comerciante {comerciante.nome_salao} criado com sucesso!')
                 return redirect('admin_panel:comerciantes_list')
@@ -126,11 +160,12 @@ def comerciante_edit(request, pk):
     """
     Edita um comerciante existente
     """
+    fixar_shard(shard_do_comerciante(pk))
     comerciante = get_object_or_404(Comerciante, pk=pk)
     
     if request.method == 'POST':
         try:
-            with transaction.atomic():
+            with transaction.atomic(), transaction.atomic(using=comerciante._state.db):
                 # Atualizar usuário
                 user = comerciante.user
                 user.username = request.POST['username']
@@ -153,6 +188,7 @@ def comerciante_edit(request, pk):
                 comerciante.horario_funcionamento = request.POST['horario_funcionamento']
                 comerciante.ativo = request.POST.get('ativo') == 'on'
                 comerciante.save()
+                invalidar_tenant_comerciante(comerciante)
                 
                 messages.success(request, f'Comerciante {comerciante.nome_salao} atualizado com sucesso!')
                 return redirect('admin_panel:comerciantes_list')
@@ -172,6 +208,7 @@ def comerciante_delete(request, pk):
     """
     Desativa um comerciante (soft delete)
     """
+    fixar_shard(shard_do_comerciante(pk))
     comerciante = get_object_or_404(Comerciante, pk=pk)
     
     if request.method == 'POST':
@@ -180,9 +217,38 @@ def comerciante_delete(request, pk):
         comerciante.save()
         comerciante.user.save()
         
+        # Cache de sessão dos websockets invalidado para o comerciante e a equipe;
+        # os sockets abertos de todos eles são encerrados
+        user_ids = [comerciante.user_id, *comerciante.funcionarios.values_list('user_id', flat=True)]
+        for user_id in user_ids:
+            invalidar_usuario(user_id)
+        desconectar_usuarios(user_ids)
+        invalidar_tenant_comerciante(comerciante)
+        
         messages.success(request, f'Comerciante {comerciante.nome_salao} foi desativado.')
         return redirect('admin_panel:comerciantes_list')
     
     return render(request, 'admin_panel/comerciante_delete.html', {
         'comerciante': comerciante
     })
+
+@login_required
+@user_passes_test(is_admin)
+def metricas(request):
+    """
+    Métricas de tempo real em JSON: conexões websocket vivas (total, por worker e por
+    estabelecimento) e envios por canal de notificação deste processo
+    """
+    return JsonResponse({
+        'websockets': metricas_presenca(),
+        'canais': metricas_canais(),
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def metricas_prometheus(request):
+    """
+    Histogramas de consultas, tempo de banco, tempo de templates e latência por view
+    deste processo, em formato texto do Prometheus (requer PERFIL_REQUISICOES)
+    """
+    return HttpResponse(perfil.registro.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class AgendamentoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'agendamento'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_delete, post_migrate, post_save
+
+        from salao_agendamento import shards
+
+        # Modo de shards: cópia dos usuários nos shards e faixas de ids separadas
+        post_save.connect(shards.replicar_usuario, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(shards.remover_usuario, sender=settings.AUTH_USER_MODEL)
+        post_migrate.connect(shards.reservar_faixa_ids, sender=self)
@@ -0,0 +1,104 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Por quanto tempo o resumo do último evento de cada agendamento é lembrado para descartar regravações sem mudança
+TEMPO_ULTIMO_EVENTO = 24 * 60 * 60
+
+
+def cor_funcionario(funcionario_id):
+    """Gera cor determinística e com bom contraste para funcionário, igual em todos os processos"""
+    hash_value = int(hashlib.md5(str(funcionario_id).encode()).hexdigest(), 16)
+    hue = hash_value % 360  # 0-359 graus no círculo de cores
+    # Usar saturação alta e luminosidade média para boa visibilidade
+    saturation = 70  # 70%
+    lightness = 45   # 45%
+    return f"hsl({hue}, {saturation}%, {lightness}%)"
+
+
+def evento_calendario(agendamento):
+    """
+    Converte um agendamento para o formato de evento do FullCalendar.
+    Espera cliente, servico e funcionario__user já carregados (select_related).
+    """
+    color = cor_funcionario(agendamento.funcionario_id)
+
+    # Status do agendamento define o estilo
+    class_names = ['agendamento']
+    if agendamento.status == 'confirmado':
+        class_names.append('confirmado')
+    elif agendamento.status == 'cancelado':
+        class_names.append('cancelado')
+    elif agendamento.status == 'concluido':
+        class_names.append('concluido')
+
+    return {
+        'id': agendamento.id,
+        'title': f"{agendamento.cliente.nome} - {agendamento.servico.nome}",
+        'start': agendamento.data_agendamento.isoformat(),
+        'end': agendamento.get_data_fim().isoformat(),
+        'backgroundColor': color,
+        'borderColor': color,
+        'extendedProps': {
+            'cliente': agendamento.cliente.nome,
+            'servico': agendamento.servico.nome,
+            'funcionario': agendamento.funcionario.user.get_full_name(),
+            'funcionario_id': agendamento.funcionario_id,
+            'preco': str(agendamento.servico.preco),
+            'status': agendamento.status,
+            'status_display': agendamento.get_status_display(),
+            'telefone': agendamento.cliente.telefone,
+            'observacoes': agendamento.observacoes or ''
+        },
+        'classNames': class_names
+    }
+
+
+def notificacoes_evento_calendario(agendamento):
+    """
+    Pares (user_id, notificação) com o evento atualizado para quem vê o agendamento
+    no calendário: o comerciante e o funcionário responsável.
+    """
+    notificacao = {
+        'type': 'calendario_evento',
+        'acao': 'atualizar',
+        'evento': evento_calendario(agendamento),
+    }
+    destinatarios = {agendamento.comerciante.user_id, agendamento.funcionario.user_id}
+    return [(user_id, notificacao) for user_id in destinatarios]
+
+
+def _chave_ultimo_evento(agendamento_id):
+    return f'calendario_ultimo_evento_{agendamento_id}'
+
+
+def registrar_evento_calendario(agendamento):
+    """
+    Grava no outbox o evento atualizado do calendário. Deve ser chamada na mesma
+    transação da alteração do agendamento. Regravar o agendamento sem mudar o evento
+    não gera novo envio: o resumo do último evento registrado fica em cache após o commit.
+    """
+    from .outbox import registrar_notificacao_tempo_real
+
+    notificacoes = notificacoes_evento_calendario(agendamento)
+    resumo = hashlib.md5(
+        json.dumps(sorted(notificacoes, key=lambda par: par[0]), sort_keys=True, default=str).encode()
+    ).hexdigest()
+    chave_cache = _chave_ultimo_evento(agendamento.id)
+    if cache.get(chave_cache) == resumo:
+        return
+
+    # A versão (data_atualizacao) diferencia alterações sucessivas do mesmo agendamento
+    versao = agendamento.data_atualizacao.isoformat() if agendamento.data_atualizacao else ''
+    for user_id, notificacao in notificacoes:
+        registrar_notificacao_tempo_real(
+            user_id,
+            f'calendario:{agendamento.id}:{versao}:{user_id}',
+            notificacao,
+            agendamento=agendamento,
+        )
+    transaction.on_commit(
+        lambda: cache.set(chave_cache, resumo, TEMPO_ULTIMO_EVENTO), using=agendamento._state.db
+    )
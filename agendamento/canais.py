@@ -0,0 +1,293 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils.module_loading import import_string
+from asgiref.sync import async_to_sync, sync_to_async
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from functools import lru_cache
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Um envio a ser feito por um canal; a chave identifica o resultado (ex.: id do agendamento).
+# html é a versão formatada da mensagem, usada apenas pelos canais que a suportam (email).
+Envio = namedtuple('Envio', ['chave', 'canal', 'destinatario', 'assunto', 'mensagem', 'html'], defaults=[None])
+
+
+class LimitadorTaxa:
+    """
+    Limita a quantidade de envios por segundo de um canal, espaçando as chamadas.
+    Não guarda objetos do event loop, então pode ser reaproveitado entre lotes.
+    """
+
+    def __init__(self, por_segundo=None):
+        self.intervalo = 1 / por_segundo if por_segundo else 0
+        self._proximo = 0.0
+
+    async def aguardar(self):
+        if not self.intervalo:
+            return
+        agora = time.monotonic()
+        espera = self._proximo - agora
+        self._proximo = max(agora, self._proximo) + self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+class MetricasCanal:
+    """Contadores de envio de um canal, acumulados durante a vida do processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enviados = 0
+        self.falhas = 0
+        self.tempo_total = 0.0
+
+    def registrar(self, sucesso, duracao):
+        with self._lock:
+            if sucesso:
+                self.enviados += 1
+            else:
+                self.falhas += 1
+            self.tempo_total += duracao
+
+    def resumo(self):
+        with self._lock:
+            total = self.enviados + self.falhas
+            return {
+                'enviados': self.enviados,
+                'falhas': self.falhas,
+                'latencia_media_ms': round(self.tempo_total / total * 1000, 2) if total else 0,
+            }
+
+
+class CanalNotificacao:
+    """
+    Canal de envio de notificações. Subclasses implementam enviar() e, se necessário,
+    destinatario() para extrair o endereço do cliente e sessao() para compartilhar
+    recursos (ex.: conexões) entre os envios de um lote.
+    """
+
+    def __init__(self, nome, max_concorrencia=5, limite_por_segundo=None, **opcoes):
+        self.nome = nome
+        self.max_concorrencia = max_concorrencia
+        self.limitador = LimitadorTaxa(limite_por_segundo)
+        self.metricas = MetricasCanal()
+        self.opcoes = opcoes
+
+    def destinatario(self, cliente):
+        return cliente.email
+
+    @asynccontextmanager
+    async def sessao(self):
+        """Recursos compartilhados pelos envios de um lote; o padrão não tem nenhum"""
+        yield None
+
+    async def enviar(self, destinatario, assunto, mensagem, html=None, sessao=None):
+        raise NotImplementedError
+
+
+class CanalEmail(CanalNotificacao):
+    """
+    Envio por email usando o EMAIL_BACKEND configurado. Em um lote, cada envio simultâneo
+    usa uma conexão e a devolve para os seguintes, então o lote abre no máximo
+    max_concorrencia conexões em vez de uma por mensagem.
+    """
+
+    @asynccontextmanager
+    async def sessao(self):
+        livres = []
+        try:
+            yield livres
+        finally:
+            for conexao in livres:
+                try:
+                    await sync_to_async(conexao.close, thread_sensitive=False)()
+                except Exception as e:
+                    logger.error(f"Erro ao fechar conexão de email: {str(e)}")
+
+    async def enviar(self, destinatario, assunto, mensagem, html=None, sessao=None):
+        # Fora de um lote o próprio send_messages abre e fecha a conexão
+        conexao = sessao.pop() if sessao else get_connection(fail_silently=False)
+        email = EmailMultiAlternatives(
+            assunto, mensagem, settings.DEFAULT_FROM_EMAIL, [destinatario], connection=conexao
+        )
+        if html:
+            email.attach_alternative(html, 'text/html')
+        try:
+            await sync_to_async(self._enviar_por, thread_sensitive=False)(conexao, email, sessao is not None)
+        except Exception:
+            # A conexão pode ter ficado inutilizável: é descartada em vez de devolvida ao lote
+            await sync_to_async(conexao.close, thread_sensitive=False)()
+            raise
+        if sessao is not None:
+            sessao.append(conexao)
+
+    @staticmethod
+    def _enviar_por(conexao, email, manter_aberta):
+        if manter_aberta:
+            # Aberta antes do envio, a conexão continua aberta para as próximas mensagens
+            # (open() não faz nada se ela já estiver aberta)
+            conexao.open()
+        conexao.send_messages([email])
+
+
+class CanalTwilio(CanalNotificacao):
+    """
+    Envio de SMS ou WhatsApp pela API da Twilio.
+    Opções: remetente (número de origem) e whatsapp (True para usar o prefixo whatsapp:).
+    """
+
+    def __init__(self, nome, **kwargs):
+        super().__init__(nome, **kwargs)
+        try:
+            from twilio.rest import Client
+        except ImportError:
+            raise ImproperlyConfigured('O pacote twilio é necessário para o canal %s' % nome)
+
+        account_sid = getattr(settings, 'TWILIO_ACCOUNT_SID', None)
+        auth_token = getattr(settings, 'TWILIO_AUTH_TOKEN', None)
+        if not account_sid or not auth_token:
+            raise ImproperlyConfigured('TWILIO_ACCOUNT_SID e TWILIO_AUTH_TOKEN são obrigatórios para o canal %s' % nome)
+
+        self.client = Client(account_sid, auth_token)
+        self.prefixo = 'whatsapp:' if self.opcoes.get('whatsapp') else ''
+
+    def destinatario(self, cliente):
+        return cliente.telefone
+
+    async def enviar(self, destinatario, assunto, mensagem, html=None, sessao=None):
+        await sync_to_async(self.client.messages.create, thread_sensitive=False)(
+            from_=f"{self.prefixo}{self.opcoes.get('remetente', '')}",
+            to=f"{self.prefixo}{destinatario}",
+            body=mensagem,
+        )
+
+
+class CanalFake(CanalNotificacao):
+    """
+    Canal local para testes e benchmarks: guarda os envios em memória.
+    Opções: campo (atributo do cliente usado como destinatário), atraso (segundos
+    simulados por envio) e falhar (sempre lança erro).
+    """
+
+    def __init__(self, nome, **kwargs):
+        super().__init__(nome, **kwargs)
+        self.enviados = []
+
+    def destinatario(self, cliente):
+        return getattr(cliente, self.opcoes.get('campo', 'email'))
+
+    async def enviar(self, destinatario, assunto, mensagem, html=None, sessao=None):
+        if self.opcoes.get('atraso'):
+            await asyncio.sleep(self.opcoes['atraso'])
+        if self.opcoes.get('falhar'):
+            raise RuntimeError(f'Falha simulada no canal {self.nome}')
+        self.enviados.append((destinatario, assunto, mensagem))
+
+
+@lru_cache(maxsize=None)
+def obter_canais():
+    """Instancia os canais configurados em NOTIFICACAO_CANAIS (uma vez por processo)"""
+    canais = {}
+    for nome, config in getattr(settings, 'NOTIFICACAO_CANAIS', {}).items():
+        try:
+            classe = import_string(config['BACKEND'])
+            canais[nome] = classe(
+                nome,
+                max_concorrencia=config.get('MAX_CONCORRENCIA', 5),
+                limite_por_segundo=config.get('LIMITE_POR_SEGUNDO'),
+                **config.get('OPCOES', {})
+            )
+        except ImproperlyConfigured as e:
+            logger.error(f"Canal de notificação {nome} desabilitado: {str(e)}")
+    return canais
+
+
+@receiver(setting_changed)
+def _recarregar_canais(setting, **kwargs):
+    """Recria os canais quando a configuração muda (override_settings nos testes)"""
+    if setting == 'NOTIFICACAO_CANAIS':
+        obter_canais.cache_clear()
+
+
+def metricas_canais():
+    """Resumo das métricas de envio de cada canal configurado"""
+    return {nome: canal.metricas.resumo() for nome, canal in obter_canais().items()}
+
+
+def canal_do_cliente(cliente):
+    """Canal preferido do cliente, ou email quando o preferido não está configurado"""
+    canal = cliente.canal_preferido
+    return canal if canal in obter_canais() else 'email'
+
+
+def opcoes_canal_preferido():
+    """Opções de canal preferido oferecidas ao cliente: apenas os canais configurados"""
+    from .models import Cliente
+
+    canais = obter_canais()
+    return [(valor, rotulo) for valor, rotulo in Cliente.CANAL_CHOICES if valor in canais]
+
+
+async def _enviar_pelo_canal(nome, canal, envios):
+    """Envia os envios de um canal dentro de uma sessão própria, com a concorrência do canal"""
+    if canal is None:
+        return [(envio.chave, f'Canal {nome} não configurado') for envio in envios]
+
+    semaforo = asyncio.Semaphore(canal.max_concorrencia)
+
+    async def _enviar(envio, sessao):
+        async with semaforo:
+            await canal.limitador.aguardar()
+            inicio = time.monotonic()
+            try:
+                await canal.enviar(
+                    envio.destinatario, envio.assunto, envio.mensagem, html=envio.html, sessao=sessao
+                )
+                canal.metricas.registrar(True, time.monotonic() - inicio)
+                return envio.chave, None
+            except Exception as e:
+                canal.metricas.registrar(False, time.monotonic() - inicio)
+                logger.error(f"Erro ao enviar pelo canal {nome} ({envio.chave}): {str(e)}")
+                return envio.chave, str(e)
+
+    try:
+        async with canal.sessao() as sessao:
+            return await asyncio.gather(*(_enviar(envio, sessao) for envio in envios))
+    except Exception as e:
+        logger.error(f"Erro na sessão do canal {nome}: {str(e)}")
+        return [(envio.chave, str(e)) for envio in envios]
+
+
+async def _enviar_em_canais(envios):
+    canais = obter_canais()
+    por_canal = {}
+    for envio in envios:
+        por_canal.setdefault(envio.canal, []).append(envio)
+
+    # Cada canal é despachado por uma tarefa própria: um canal lento ou limitado por taxa
+    # (SMS a 1/s) não atrasa os envios dos demais
+    resultados = {}
+    for parciais in await asyncio.gather(*(
+        _enviar_pelo_canal(nome, canais.get(nome), envios_canal)
+        for nome, envios_canal in por_canal.items()
+    )):
+        resultados.update(parciais)
+    return resultados
+
+
+def enviar_em_canais(envios):
+    """
+    Envia uma lista de Envio concorrentemente, cada canal de forma independente e
+    respeitando a própria concorrência e limite de taxa. Retorna {chave: mensagem de erro ou None}.
+    """
+    if not envios:
+        return {}
+    return async_to_sync(_enviar_em_canais)(envios)
@@ -1,82 +1,595 @@
-
+import asyncio
 import json
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
 from django.contrib.auth import get_user_model
-from asgiref.sync import async_to_sync
+from django.db import transaction
+from django.db.models import Case, F, PositiveBigIntegerField, Value, When
+from django.utils import timezone
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.layers import get_channel_layer
+from .models import Comerciante, Funcionario, NotificacaoUsuario, SequenciaNotificacao
+from .disponibilidade import grupo_disponibilidade
+from .presenca import registrar_conexao, atualizar_sinal, remover_conexao, usuarios_conectados
+from salao_agendamento.shards import primeiro_nos_shards
 
 User = get_user_model()
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+# Mensagens dos quadros de resumo, por tipo de notificação
+MENSAGENS_AGRUPADAS = {
+    'novo_agendamento': '{total} novos agendamentos',
+    'agendamento_confirmado': '{total} agendamentos confirmados',
+    'agendamento_cancelado': '{total} agendamentos cancelados',
+    'lembrete_agendamento': '{total} agendamentos em breve',
+    'cliente_nao_compareceu': '{total} clientes não compareceram',
+}
+
+# Por quanto tempo uma chave de notificação já entregue é lembrada para descartar duplicatas
+TEMPO_CHAVES_RECENTES = 60
+
+
+def grupo_comerciante(comerciante_id, tipo_usuario=None):
+    """
+    Nome do grupo de todos os sockets de um estabelecimento ou, com tipo_usuario,
+    apenas dos usuários daquele papel (ex.: todos os funcionários do salão)
+    """
+    if tipo_usuario:
+        return f'comerciante_{comerciante_id}_{tipo_usuario}'
+    return f'comerciante_{comerciante_id}'
+
+
+def chave_notificacao(notificacao):
+    """Chave de idempotência da notificação: a informada em 'chave' ou o próprio conteúdo (sem a sequência)"""
+    if notificacao.get('chave'):
+        return notificacao['chave']
+    return json.dumps({k: v for k, v in notificacao.items() if k != 'seq'}, sort_keys=True, default=str)
+
+
+def agrupar_notificacoes(notificacoes):
+    """
+    Descarta duplicatas exatas e junta as notificações de mesmo tipo em um único quadro
+    de resumo com o total e os ids dos agendamentos. Notificações únicas seguem como estão.
+    """
+    vistas = set()
+    por_tipo = {}
+    eventos = {}
+    for notificacao in notificacoes:
+        chave = chave_notificacao(notificacao)
+        if chave in vistas:
+            continue
+        vistas.add(chave)
+        if notificacao.get('type') == 'calendario_evento':
+            # Eventos do calendário não viram resumo: vale apenas o estado mais recente de cada um
+            eventos[notificacao['evento']['id']] = notificacao
+            continue
+        por_tipo.setdefault(notificacao.get('type'), []).append(notificacao)
+
+    quadros = list(eventos.values())
+    for tipo, lista in por_tipo.items():
+        if len(lista) == 1:
+            quadros.append(lista[0])
+            continue
+        quadro = {
+            'type': tipo,
+            'agrupada': True,
+            'total': len(lista),
+            'agendamento_ids': [n['agendamento_id'] for n in lista if n.get('agendamento_id') is not None],
+            'message': MENSAGENS_AGRUPADAS.get(tipo, '{total} notificações').format(total=len(lista)),
+        }
+        # O resumo carrega a maior sequência incluída, para o cliente saber de onde retomar
+        sequencias = [n['seq'] for n in lista if n.get('seq') is not None]
+        if sequencias:
+            quadro['seq'] = max(sequencias)
+        quadros.append(quadro)
+
+    # Em ordem de sequência, já que o cliente descarta quadros com sequência menor que a última vista
+    quadros.sort(key=lambda q: q.get('seq') or 0)
+    return quadros
+
+
+class BatimentoMixin:
+    """
+    Heartbeat conduzido pelo servidor: a cada intervalo envia {'type': 'heartbeat'} e
+    fecha o socket (código 4408) se o cliente não deu sinal de vida dentro do tempo
+    ocioso. Qualquer mensagem do cliente conta como sinal.
+    """
+
+    def iniciar_batimentos(self):
+        self.ultimo_sinal = time.monotonic()
+        self.sinal_pendente = False
+        self.tarefa_batimento = asyncio.create_task(self._batimentos())
+
+    def parar_batimentos(self):
+        if getattr(self, 'tarefa_batimento', None):
+            self.tarefa_batimento.cancel()
+
+    def registrar_sinal(self):
+        self.ultimo_sinal = time.monotonic()
+        self.sinal_pendente = True
+
+    async def _batimentos(self):
+        intervalo = getattr(settings, 'WEBSOCKET_HEARTBEAT_SEGUNDOS', 25)
+        tempo_ocioso = getattr(settings, 'WEBSOCKET_TIMEOUT_OCIOSO_SEGUNDOS', 75)
+        while True:
+            await asyncio.sleep(intervalo)
+            if time.monotonic() - self.ultimo_sinal > tempo_ocioso:
+                await self.close(code=4408)
+                return
+            await self.send(text_data=json.dumps({'type': 'heartbeat'}))
+            if self.sinal_pendente:
+                self.sinal_pendente = False
+                await self.sinal_recebido(time.monotonic() - self.ultimo_sinal)
+
+    async def sinal_recebido(self, segundos_atras):
+        """Chamado a cada ciclo em que o cliente deu sinal de vida; subclasses podem persistir"""
+        pass
+
+
+class NotificationConsumer(BatimentoMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.user = self.scope["user"]
-        
+
         if self.user.is_anonymous:
             await self.close()
             return
-        
+
         self.room_group_name = f'notifications_{self.user.id}'
-        
-        # Entrar no grupo de notificações do usuário
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
-        
+
+        # Além do grupo pessoal, o socket entra no grupo do estabelecimento e no do papel
+        # do usuário nele, para broadcasts com um único group_send
+        self.grupos = [self.room_group_name]
+        # O middleware de autenticação já traz o estabelecimento em cache
+        if 'comerciante_id' in self.scope:
+            comerciante_id = self.scope['comerciante_id']
+        else:
+            comerciante_id = await self._obter_comerciante_id()
+        if comerciante_id is not None:
+            self.grupos.append(grupo_comerciante(comerciante_id))
+            self.grupos.append(grupo_comerciante(comerciante_id, self.user.tipo_usuario))
+
+        # Notificações recebidas dentro da janela são enviadas juntas, já agrupadas
+        self.janela_agrupamento = getattr(settings, 'NOTIFICACOES_JANELA_AGRUPAMENTO_MS', 0) / 1000
+        self.notificacoes_pendentes = []
+        self.tarefa_envio = None
+        self.chaves_recentes = {}
+
+        # Presença registrada antes de entrar nos grupos, para que nenhum envio
+        # feito a partir daqui considere o usuário desconectado
+        await database_sync_to_async(registrar_conexao)(self.channel_name, self.user.id, comerciante_id, self.grupos)
+        self.presenca_registrada = True
+
+        # Entrar nos grupos de notificações do usuário
+        for grupo in self.grupos:
+            await self.channel_layer.group_add(grupo, self.channel_name)
+
         await self.accept()
-        
-        # Enviar confirmação de conexão
+        self.iniciar_batimentos()
+
+        # Enviar confirmação de conexão com a sequência atual, de onde o cliente retomará
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
-            'message': 'Conectado às notificações em tempo real'
+            'message': 'Conectado às notificações em tempo real',
+            'seq': await self._obter_ultima_sequencia()
         }))
-    
+
+        # Reconexão: reenviar apenas o que foi perdido depois da sequência informada
+        resume_from = parse_qs(self.scope.get('query_string', b'').decode()).get('resume_from')
+        if resume_from and resume_from[0].isdigit():
+            await self._reenviar_perdidas(int(resume_from[0]))
+
     async def disconnect(self, close_code):
-        if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
+        self.parar_batimentos()
+        if getattr(self, 'tarefa_envio', None):
+            self.tarefa_envio.cancel()
+        for grupo in getattr(self, 'grupos', []):
+            await self.channel_layer.group_discard(grupo, self.channel_name)
+        if getattr(self, 'presenca_registrada', False):
+            await database_sync_to_async(remover_conexao)(self.channel_name)
+
+    async def forcar_desconexao(self, event):
+        """Conta desativada: encerra o socket; a reconexão será recusada pelo middleware"""
+        await self.close(code=4401)
+
+    async def sinal_recebido(self, segundos_atras):
+        await database_sync_to_async(atualizar_sinal)(
+            self.channel_name,
+            timezone.now() - timedelta(seconds=segundos_atras)
+        )
+
+    @database_sync_to_async
+    def _obter_comerciante_id(self):
+        """Id do estabelecimento do usuário (comerciante ou funcionário)"""
+        if self.user.is_comerciante():
+            return primeiro_nos_shards(
+                lambda: Comerciante.objects.filter(user=self.user).values_list('id', flat=True).first()
             )
-    
+        if self.user.is_funcionario():
+            return primeiro_nos_shards(
+                lambda: Funcionario.objects.filter(user=self.user).values_list('comerciante_id', flat=True).first()
+            )
+        return None
+
+    @database_sync_to_async
+    def _obter_ultima_sequencia(self):
+        return SequenciaNotificacao.objects.filter(user=self.user).values_list('ultima', flat=True).first() or 0
+
+    @database_sync_to_async
+    def _buscar_perdidas(self, resume_from):
+        limite = getattr(settings, 'NOTIFICACOES_REPLAY_LIMITE', 500)
+        registros = list(
+            NotificacaoUsuario.objects.filter(
+                user=self.user,
+                sequencia__gt=resume_from
+            ).order_by('sequencia').values_list('sequencia', 'dados')[:limite + 1]
+        )
+        return registros[:limite], len(registros) > limite
+
+    async def _reenviar_perdidas(self, resume_from):
+        registros, excedeu_limite = await self._buscar_perdidas(resume_from)
+
+        # Lacuna: o início do intervalo já foi removido pela retenção ou há mais que o limite
+        if excedeu_limite or (registros and registros[0][0] > resume_from + 1):
+            await self.send(text_data=json.dumps({'type': 'replay_incompleto', 'resume_from': resume_from}))
+            return
+
+        for quadro in agrupar_notificacoes([{**dados, 'seq': sequencia} for sequencia, dados in registros]):
+            await self.send(text_data=json.dumps(quadro))
+
     async def receive(self, text_data):
+        # Qualquer mensagem (inclusive a resposta ao heartbeat) mostra que o cliente está vivo
+        self.registrar_sinal()
         try:
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type')
-            
+
             if message_type == 'ping':
                 await self.send(text_data=json.dumps({
                     'type': 'pong',
                     'timestamp': text_data_json.get('timestamp')
                 }))
-                
+
         except json.JSONDecodeError:
             pass
-    
+
     # Receber notificação do grupo
     async def notification_message(self, event):
-        await self.send(text_data=json.dumps(event))
+        notificacao = event['notificacao']
+
+        # Descartar duplicatas exatas entregues recentemente (ex.: reenvios do outbox)
+        agora = time.monotonic()
+        self.chaves_recentes = {c: v for c, v in self.chaves_recentes.items() if v > agora}
+        chave = chave_notificacao(notificacao)
+        if chave in self.chaves_recentes:
+            return
+        self.chaves_recentes[chave] = agora + TEMPO_CHAVES_RECENTES
+
+        if self.janela_agrupamento <= 0:
+            await self.send(text_data=json.dumps(notificacao))
+            return
+
+        self.notificacoes_pendentes.append(notificacao)
+        if self.tarefa_envio is None:
+            self.tarefa_envio = asyncio.ensure_future(self._enviar_apos_janela())
+
+    async def _enviar_apos_janela(self):
+        await asyncio.sleep(self.janela_agrupamento)
+        pendentes, self.notificacoes_pendentes = self.notificacoes_pendentes, []
+        self.tarefa_envio = None
+        for quadro in agrupar_notificacoes(pendentes):
+            await self.send(text_data=json.dumps(quadro))
+
+
+def ip_do_cliente(scope):
+    """
+    IP do cliente de um socket. Quando a conexão vem de um proxy listado em
+    PROXIES_CONFIAVEIS vale o endereço mais à direita do X-Forwarded-For que não é
+    de um proxy confiável; nos demais casos o cabeçalho é ignorado, pois o próprio
+    cliente poderia forjá-lo.
+    """
+    ip = (scope.get('client') or ['desconhecido'])[0]
+    confiaveis = set(getattr(settings, 'PROXIES_CONFIAVEIS', []))
+    if ip not in confiaveis:
+        return ip
+
+    encaminhados = [
+        endereco.strip()
+        for nome, valor in scope.get('headers', [])
+        if nome == b'x-forwarded-for'
+        for endereco in valor.decode('latin1').split(',')
+        if endereco.strip()
+    ]
+    for endereco in reversed(encaminhados):
+        if endereco not in confiaveis:
+            return endereco
+    return encaminhados[0] if encaminhados else ip
+
+
+def _cache_disponibilidade():
+    return caches[getattr(settings, 'DISPONIBILIDADE_CACHE', 'default')]
+
+
+def _chave_conexoes_ip(ip):
+    return f'disponibilidade_conexoes_ip_{ip}'
+
+
+def _validade_conexoes_ip():
+    """
+    Validade do contador de um IP, renovada a cada sinal de vida dos sockets: contagens
+    de um worker que caiu sem fechar as conexões expiram sozinhas.
+    """
+    return 2 * getattr(settings, 'WEBSOCKET_TIMEOUT_OCIOSO_SEGUNDOS', 75)
+
+
+def reservar_conexao_ip(ip, limite):
+    """
+    Reserva uma vaga de socket para o IP no contador compartilhado entre os workers.
+    O incremento é atômico: de conexões simultâneas, apenas `limite` obtêm vaga.
+    """
+    cache_ip, chave = _cache_disponibilidade(), _chave_conexoes_ip(ip)
+    try:
+        total = cache_ip.incr(chave)
+    except ValueError:
+        cache_ip.add(chave, 0, _validade_conexoes_ip())
+        total = cache_ip.incr(chave)
+    if total > limite:
+        liberar_conexao_ip(ip)
+        return False
+    return True
+
+
+def liberar_conexao_ip(ip):
+    try:
+        _cache_disponibilidade().decr(_chave_conexoes_ip(ip))
+    except ValueError:
+        # Contador já expirado: não há vaga a devolver
+        pass
+
+
+def renovar_conexoes_ip(ip):
+    _cache_disponibilidade().touch(_chave_conexoes_ip(ip), _validade_conexoes_ip())
+
+
+class DisponibilidadeConsumer(BatimentoMixin, AsyncWebsocketConsumer):
+    """
+    Socket anônimo e somente leitura da página pública de agendamento: recebe os
+    horários ocupados e liberados de um funcionário em um dia enquanto o cliente escolhe.
+    """
+
+    async def connect(self):
+        self.grupo = None
+        self.ip = ip_do_cliente(self.scope)
+
+        # Limite de sockets por IP, para que um único cliente não esgote as conexões. A vaga
+        # é reservada antes de qualquer espera, para que conexões simultâneas não passem juntas
+        limite = getattr(settings, 'DISPONIBILIDADE_MAX_CONEXOES_POR_IP', 10)
+        self.vaga_reservada = await sync_to_async(reservar_conexao_ip)(self.ip, limite)
+        if not self.vaga_reservada:
+            await self.close(code=4429)
+            return
+
+        kwargs = self.scope['url_route']['kwargs']
+        try:
+            data = datetime.strptime(kwargs['data'], '%Y-%m-%d').date()
+        except ValueError:
+            await self._recusar(4400)
+            return
+
+        funcionario_id = int(kwargs['funcionario_id'])
+        if not await self._funcionario_valido(int(kwargs['comerciante_id']), funcionario_id):
+            await self._recusar(4404)
+            return
+
+        self.grupo = grupo_disponibilidade(funcionario_id, data)
+        await self.channel_layer.group_add(self.grupo, self.channel_name)
+        await self.accept()
+        self.iniciar_batimentos()
+
+    async def _recusar(self, codigo):
+        await self._liberar_vaga()
+        await self.close(code=codigo)
+
+    async def _liberar_vaga(self):
+        if getattr(self, 'vaga_reservada', False):
+            self.vaga_reservada = False
+            await sync_to_async(liberar_conexao_ip)(self.ip)
+
+    async def disconnect(self, close_code):
+        self.parar_batimentos()
+        await self._liberar_vaga()
+        if getattr(self, 'grupo', None):
+            await self.channel_layer.group_discard(self.grupo, self.channel_name)
+
+    async def sinal_recebido(self, segundos_atras):
+        await sync_to_async(renovar_conexoes_ip)(self.ip)
+
+    @database_sync_to_async
+    def _funcionario_valido(self, comerciante_id, funcionario_id):
+        """Funcionário ativo de um estabelecimento ativo; o resultado fica em cache para dias concorridos"""
+        return cache.get_or_set(
+            f'disponibilidade_funcionario_{comerciante_id}_{funcionario_id}',
+            lambda: Funcionario.objects.do_comerciante(comerciante_id).filter(
+                id=funcionario_id,
+                comerciante_id=comerciante_id,
+                ativo=True,
+                comerciante__ativo=True
+            ).exists(),
+            300
+        )
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Somente leitura: mensagens do cliente valem apenas como sinal de vida
+        self.registrar_sinal()
+
+    async def notification_message(self, event):
+        await self.send(text_data=json.dumps(event['notificacao']))
+
+
+class AgregadorNotificacoes:
+    """
+    Acumula as notificações geradas por um job em lote e, ao final, envia um único
+    quadro por usuário e tipo em vez de um por agendamento.
+
+        with AgregadorNotificacoes() as agregador:
+            for agendamento in agendamentos:
+                agregador.adicionar(user_id, {...})
+    """
+
+    def __init__(self):
+        self.por_usuario = {}
+
+    def adicionar(self, user_id, notification_data):
+        self.por_usuario.setdefault(user_id, []).append(notification_data)
+
+    def enviar(self):
+        por_usuario, self.por_usuario = self.por_usuario, {}
+        send_notifications_batch([
+            (user_id, quadro)
+            for user_id, notificacoes in por_usuario.items()
+            for quadro in agrupar_notificacoes(notificacoes)
+        ])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.enviar()
+        return False
+
+
+def _reservar_sequencias(quantidades):
+    """
+    Reserva, para cada usuário em `quantidades` ({user_id: quantidade}), sequências
+    consecutivas e retorna {user_id: primeira}. Número fixo de consultas para qualquer
+    quantidade de usuários: cria os contadores que faltam, incrementa todos com um único
+    UPDATE e lê os valores de volta na mesma transação.
+    """
+    with transaction.atomic():
+        SequenciaNotificacao.objects.bulk_create(
+            [SequenciaNotificacao(user_id=user_id, ultima=0) for user_id in quantidades],
+            ignore_conflicts=True
+        )
+        SequenciaNotificacao.objects.filter(user_id__in=quantidades).update(
+            ultima=F('ultima') + Case(
+                *(When(user_id=user_id, then=Value(quantidade)) for user_id, quantidade in quantidades.items()),
+                output_field=PositiveBigIntegerField()
+            )
+        )
+        ultimas = dict(
+            SequenciaNotificacao.objects.filter(user_id__in=quantidades).values_list('user_id', 'ultima')
+        )
+    return {user_id: ultimas[user_id] - quantidade + 1 for user_id, quantidade in quantidades.items()}
+
+def registrar_no_historico(notificacoes):
+    """
+    Grava pares (user_id, notification_data) no histórico, atribuindo a cada um a próxima
+    sequência do usuário. Retorna os pares com a sequência incluída em 'seq'.
+    """
+    por_usuario = {}
+    for user_id, notification_data in notificacoes:
+        por_usuario.setdefault(user_id, []).append(notification_data)
+
+    if not por_usuario:
+        return []
+
+    sequencias = _reservar_sequencias({user_id: len(lista) for user_id, lista in por_usuario.items()})
+    registros = []
+    for user_id, lista in por_usuario.items():
+        inicio = sequencias[user_id]
+        registros.extend(
+            NotificacaoUsuario(user_id=user_id, sequencia=inicio + i, dados=notification_data)
+            for i, notification_data in enumerate(lista)
+        )
+    NotificacaoUsuario.objects.bulk_create(registros)
+
+    resultado = []
+    for user_id, notification_data in notificacoes:
+        resultado.append((user_id, {**notification_data, 'seq': sequencias[user_id]}))
+        sequencias[user_id] += 1
+    return resultado
 
 def send_notification_to_user(user_id, notification_data):
     """Função para enviar notificação para um usuário específico"""
-    channel_layer = get_channel_layer()
-    
-    async_to_sync(channel_layer.group_send)(
-        f'notifications_{user_id}',
-        {
-            'type': 'notification_message',
-            **notification_data
-        }
-    )
+    send_notifications_batch([(user_id, notification_data)])
 
 def send_notification_to_group(group_name, notification_data):
     """Função para enviar notificação para um grupo"""
     channel_layer = get_channel_layer()
-    
+
+    # A notificação vai num envelope: seu campo 'type' não pode substituir o do handler
     async_to_sync(channel_layer.group_send)(
         group_name,
         {
             'type': 'notification_message',
-            **notification_data
+            'notificacao': notification_data
         }
     )
+
+def desconectar_usuarios(user_ids):
+    """Encerra todos os sockets de notificações dos usuários informados"""
+    channel_layer = get_channel_layer()
+
+    async def _desconectar():
+        await asyncio.gather(*(
+            channel_layer.group_send(f'notifications_{user_id}', {'type': 'forcar_desconexao'})
+            for user_id in user_ids
+        ), return_exceptions=True)
+
+    async_to_sync(_desconectar)()
+
+def send_notification_to_comerciante(comerciante_id, notification_data, tipo_usuario=None):
+    """Envia uma notificação para toda a equipe conectada de um estabelecimento (ou de um papel)"""
+    send_notification_to_group(grupo_comerciante(comerciante_id, tipo_usuario), notification_data)
+
+def send_notifications_batch(notificacoes):
+    """
+    Envia vários pares (user_id, notification_data) numa única passagem pelo event loop:
+    todos os group_send rodam concorrentemente dentro do mesmo contexto assíncrono.
+    As notificações são gravadas no histórico antes, para reenvio após reconexão;
+    usuários sem nenhum socket vivo ficam só com o histórico.
+    Retorna uma lista com None ou a exceção de cada envio, na ordem recebida.
+    """
+    registradas = registrar_no_historico(notificacoes)
+    conectados = usuarios_conectados_para_envio([user_id for user_id, _ in registradas])
+    indices = [i for i, (user_id, _) in enumerate(registradas) if user_id in conectados]
+    erros = send_notifications_to_groups([
+        (f'notifications_{registradas[i][0]}', registradas[i][1]) for i in indices
+    ])
+    resultado = [None] * len(registradas)
+    for i, erro in zip(indices, erros):
+        resultado[i] = erro
+    return resultado
+
+def usuarios_conectados_para_envio(user_ids):
+    """Usuários que devem receber pelo channel layer (todos, se NOTIFICACOES_APENAS_CONECTADOS=False)"""
+    if not getattr(settings, 'NOTIFICACOES_APENAS_CONECTADOS', True):
+        return set(user_ids)
+    return usuarios_conectados(user_ids)
+
+def send_notifications_to_groups(notificacoes):
+    """Versão em lote de send_notification_to_group para pares (group_name, notification_data)"""
+    if not notificacoes:
+        return []
+
+    channel_layer = get_channel_layer()
+
+    async def _enviar_todos():
+        return await asyncio.gather(*(
+            channel_layer.group_send(
+                group_name,
+                {
+                    'type': 'notification_message',
+                    'notificacao': notification_data
+                }
+            )
+            for group_name, notification_data in notificacoes
+        ), return_exceptions=True)
+
+    return [
+        resultado if isinstance(resultado, Exception) else None
+        for resultado in async_to_sync(_enviar_todos)()
+    ]
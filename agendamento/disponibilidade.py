@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.utils import timezone
+from datetime import datetime, timedelta
+from .models import Agendamento
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Horários básicos (você pode personalizar conforme necessário)
+HORARIOS_BASE = [
+    '08:00', '08:30', '09:00', '09:30', '10:00', '10:30',
+    '11:00', '11:30', '14:00', '14:30', '15:00', '15:30',
+    '16:00', '16:30', '17:00', '17:30'
+]
+
+# Assumindo duração padrão de 60 minutos para verificação
+DURACAO_PADRAO_MINUTOS = 60
+
+STATUS_OCUPAM_HORARIO = ['agendado', 'confirmado', 'em_andamento']
+
+
+def grupo_disponibilidade(funcionario_id, data):
+    """Nome do grupo dos sockets que acompanham os horários de um funcionário em um dia"""
+    return f'disponibilidade_{funcionario_id}_{data:%Y%m%d}'
+
+
+def dia_agendamento(agendamento):
+    """Chave (funcionario_id, data local) da agenda afetada pelo agendamento"""
+    return agendamento.funcionario_id, timezone.localtime(agendamento.data_agendamento).date()
+
+
+def horarios_disponiveis(funcionario_id, data):
+    """Horários livres do funcionário na data, no formato 'HH:MM'"""
+    agora = timezone.localtime()
+    if data < agora.date():
+        return []
+
+    horarios = HORARIOS_BASE
+    # Se for hoje, filtrar horários que já passaram
+    if data == agora.date():
+        horarios = [h for h in horarios if datetime.strptime(h, '%H:%M').time() > agora.time()]
+
+    # Buscar agendamentos existentes para essa data
+    ocupados = [
+        (agendamento.data_agendamento, agendamento.get_data_fim())
+        for agendamento in Agendamento.objects.filter(
+            funcionario_id=funcionario_id,
+            data_agendamento__date=data,
+            status__in=STATUS_OCUPAM_HORARIO
+        ).select_related('servico')
+    ]
+
+    disponiveis = []
+    for horario in horarios:
+        try:
+            inicio_novo = timezone.make_aware(datetime.strptime(f"{data:%Y-%m-%d} {horario}", '%Y-%m-%d %H:%M'))
+            fim_novo = inicio_novo + timedelta(minutes=DURACAO_PADRAO_MINUTOS)
+
+            # Verificar se há sobreposição com algum agendamento existente
+            if not any(inicio_novo < fim and fim_novo > inicio for inicio, fim in ocupados):
+                disponiveis.append(horario)
+        except Exception as e:
+            logger.error(f"Erro ao processar horário {horario}: {str(e)}")
+    return disponiveis
+
+
+def capturar_disponibilidade(dias):
+    """
+    Horários livres de cada (funcionario_id, data) antes de uma alteração, para que
+    publicar_disponibilidade envie apenas o que mudou.
+    """
+    return {dia: horarios_disponiveis(*dia) for dia in set(dias)}
+
+
+def publicar_disponibilidade(antes, dias=(), using=None):
+    """
+    Recalcula os dias capturados (e os novos dias informados, ex.: destino de uma
+    remarcação) e, após o commit, envia aos sockets da página pública os horários
+    ocupados e liberados, junto com a lista completa. `using` é o banco da transação
+    da alteração (o shard do comerciante); sem ele, o principal.
+    """
+    from .consumers import send_notifications_to_groups
+
+    quadros = []
+    for dia in set(antes) | set(dias):
+        funcionario_id, data = dia
+        depois = horarios_disponiveis(funcionario_id, data)
+        anteriores = antes.get(dia, depois)
+        ocupados = [h for h in anteriores if h not in depois]
+        liberados = [h for h in depois if h not in anteriores]
+        if dia in antes and not ocupados and not liberados:
+            continue
+        quadros.append((grupo_disponibilidade(funcionario_id, data), {
+            'type': 'horarios_atualizados',
+            'funcionario_id': funcionario_id,
+            'data': data.isoformat(),
+            'ocupados': ocupados,
+            'liberados': liberados,
+            'horarios': depois,
+        }))
+
+    if quadros:
+        # Sem garantia de entrega: a página recarrega a lista completa ao reconectar
+        transaction.on_commit(lambda: send_notifications_to_groups(quadros), using=using)
@@ -0,0 +1,2 @@
+# Arquivo vazio para tornar o diretório um pacote Python
+
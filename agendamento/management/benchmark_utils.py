@@ -0,0 +1,14 @@
+"""Funções compartilhadas pelos comandos de benchmark (benchmark_*)"""
+import statistics
+
+
+def percentis(valores):
+    """p50, p95, p99 e máximo de uma lista de durações em segundos, em milissegundos"""
+    valores = sorted(valores)
+    if not valores:
+        return {'p50': 0, 'p95': 0, 'p99': 0, 'max': 0}
+
+    def percentil(p):
+        return valores[min(len(valores) - 1, int(len(valores) * p))] * 1000
+
+    return {'p50': statistics.median(valores) * 1000, 'p95': percentil(0.95), 'p99': percentil(0.99), 'max': valores[-1] * 1000}
@@ -0,0 +1,281 @@
+import asyncio
+import json
+import random
+import re
+import statistics
+import subprocess
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from agendamento.models import Cliente, Comerciante, Servico
+from ..benchmark_utils import percentis
+
+ETAPAS = ('agendar_servico', 'funcionarios_servico', 'horarios_disponiveis', 'criar_agendamento')
+
+# Clientes criados pelo benchmark, para a limpeza (--limpar)
+DOMINIO_EMAIL = 'benchmark.invalid'
+
+# Resposta de criar_agendamento quando outro cliente reservou o horário antes
+CONFLITO = 'não está mais disponível'
+
+# Cabeçalho do PerfilMiddleware: db;dur=1.2;desc="7 consultas", ...
+CONSULTAS_SERVER_TIMING = re.compile(r'db;[^,]*desc="(\d+) consultas"')
+
+
+def _alvos(comerciantes_ids):
+    """Estabelecimentos ativos e seus serviços que têm ao menos um funcionário ativo"""
+    comerciantes = Comerciante.objects.filter(ativo=True)
+    if comerciantes_ids:
+        comerciantes = comerciantes.filter(id__in=comerciantes_ids)
+    servicos = (
+        Servico.objects.filter(comerciante__in=comerciantes, ativo=True)
+        .annotate(prestadores=Count('funcionarios', filter=Q(funcionarios__ativo=True)))
+        .filter(prestadores__gt=0)
+        .values_list('comerciante_id', 'id')
+    )
+    alvos = {}
+    for comerciante_id, servico_id in servicos:
+        alvos.setdefault(comerciante_id, []).append(servico_id)
+    return sorted(alvos.items())
+
+
+def _versao():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Etapa:
+    """Amostras de uma etapa do fluxo: latência, status HTTP e consultas informadas pelo servidor"""
+
+    def __init__(self):
+        self.latencias = []
+        self.consultas = []
+        self.status = {}
+        self.erros = 0
+        self.conflitos = 0
+
+    def resumo(self, duracao):
+        total = len(self.latencias)
+        return {
+            'requisicoes': total,
+            'por_segundo': round(total / duracao, 2) if duracao else 0,
+            'latencia_ms': {chave: round(valor, 2) for chave, valor in percentis(self.latencias).items()},
+            'status': {str(codigo): quantidade for codigo, quantidade in sorted(self.status.items())},
+            'taxa_erros': round(self.erros / total, 4) if total else 0,
+            'taxa_conflitos': round(self.conflitos / total, 4) if total else 0,
+            'consultas': {
+                'media': round(statistics.mean(self.consultas), 2),
+                'p95': sorted(self.consultas)[min(len(self.consultas) - 1, int(len(self.consultas) * 0.95))],
+                'max': max(self.consultas),
+            } if self.consultas else None,
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga do fluxo público de agendamento contra um servidor em execução: página, '
+        'funcionários do serviço, horários por data e criação do agendamento, com clientes HTTP '
+        'assíncronos concorrentes. Resultado em JSON, para comparar execuções.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Endereço do servidor')
+        parser.add_argument('--concorrencia', type=int, default=20, help='Clientes simultâneos')
+        parser.add_argument('--fluxos', type=int, default=500, help='Fluxos completos a executar')
+        parser.add_argument('--duracao', type=float, default=0, help='Limite em segundos (0 = sem limite)')
+        parser.add_argument('--comerciante', type=int, action='append', help='Restringe a estes comerciantes')
+        parser.add_argument('--dias', type=int, default=14, help='Janela de datas à frente para agendar')
+        parser.add_argument('--datas-por-fluxo', type=int, default=3, help='Datas consultadas em cada fluxo')
+        parser.add_argument('--timeout', type=float, default=30, help='Tempo limite por requisição (s)')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--saida', help='Arquivo JSON do resultado (padrão: imprime na saída)')
+        parser.add_argument(
+            '--limpar', action='store_true',
+            help=f'Ao final, remove os clientes criados pelo benchmark (e-mail @{DOMINIO_EMAIL}) e seus agendamentos'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            import aiohttp
+        except ImportError:
+            raise CommandError('O benchmark precisa do pacote aiohttp (requirements.txt, dependências de benchmark)')
+        self.aiohttp = aiohttp
+
+        alvos = _alvos(options['comerciante'])
+        if not alvos:
+            raise CommandError('Nenhum comerciante ativo com serviços e funcionários; gere dados com gerar_dados_sinteticos')
+
+        self.rnd = random.Random(options['semente'])
+        self.execucao = int(time.time()) % 10 ** 8
+        self.etapas = {etapa: Etapa() for etapa in ETAPAS}
+        self.fluxos = {'concluidos': 0, 'conflitos': 0, 'sem_horario': 0, 'falhos': 0}
+
+        inicio = time.perf_counter()
+        asyncio.run(self._executar(alvos, options))
+        duracao = time.perf_counter() - inicio
+
+        resultado = self._resultado(alvos, options, duracao)
+        self._relatorio(resultado)
+
+        conteudo = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                arquivo.write(conteudo + '\n')
+            self.stdout.write(f'Resultado gravado em {options["saida"]}')
+        else:
+            self.stdout.write(conteudo)
+
+        if options['limpar']:
+            removidos, _ = Cliente.objects.filter(email__endswith=f'@{DOMINIO_EMAIL}').delete()
+            self.stdout.write(f'{removidos} registros do benchmark removidos')
+
+    async def _executar(self, alvos, options):
+        aiohttp = self.aiohttp
+        limite = time.perf_counter() + options['duracao'] if options['duracao'] else None
+        restantes = iter(range(options['fluxos']))
+
+        async def cliente():
+            # Cada fluxo é um visitante anônimo; sem cookies entre fluxos
+            for numero in restantes:
+                if limite and time.perf_counter() >= limite:
+                    return
+                comerciante_id, servicos = self.rnd.choice(alvos)
+                try:
+                    desfecho = await self._fluxo(sessao, numero, comerciante_id, self.rnd.choice(servicos), options)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    desfecho = 'falhos'
+                self.fluxos[desfecho] += 1
+
+        conector = aiohttp.TCPConnector(limit=options['concorrencia'])
+        async with aiohttp.ClientSession(
+            base_url=options['url'], connector=conector, cookie_jar=aiohttp.DummyCookieJar(),
+            timeout=aiohttp.ClientTimeout(total=options['timeout'])
+        ) as sessao:
+            await asyncio.gather(*(cliente() for _ in range(options['concorrencia'])))
+
+    async def _requisicao(self, sessao, etapa, metodo, url, **kwargs):
+        """Executa e mede uma requisição; retorna (status, corpo JSON ou None)"""
+        amostras = self.etapas[etapa]
+        inicio = time.perf_counter()
+        try:
+            async with sessao.request(metodo, url, **kwargs) as resposta:
+                corpo = await resposta.read()
+                amostras.latencias.append(time.perf_counter() - inicio)
+        except (self.aiohttp.ClientError, asyncio.TimeoutError):
+            amostras.latencias.append(time.perf_counter() - inicio)
+            amostras.status['falha'] = amostras.status.get('falha', 0) + 1
+            amostras.erros += 1
+            raise
+
+        amostras.status[resposta.status] = amostras.status.get(resposta.status, 0) + 1
+        consultas = CONSULTAS_SERVER_TIMING.search(resposta.headers.get('Server-Timing', ''))
+        if consultas:
+            amostras.consultas.append(int(consultas.group(1)))
+
+        dados = None
+        if resposta.content_type == 'application/json':
+            dados = json.loads(corpo)
+        if resposta.status == 400 and dados and CONFLITO in dados.get('error', ''):
+            amostras.conflitos += 1
+        elif resposta.status >= 400:
+            amostras.erros += 1
+        return resposta.status, dados
+
+    async def _fluxo(self, sessao, numero, comerciante_id, servico_id, options):
+        """Um visitante do começo ao fim; retorna o desfecho para a contagem de fluxos"""
+        rnd = self.rnd
+        status, _ = await self._requisicao(sessao, 'agendar_servico', 'GET', f'/agendamento/{comerciante_id}/')
+        if status != 200:
+            return 'falhos'
+
+        status, dados = await self._requisicao(
+            sessao, 'funcionarios_servico', 'GET', f'/agendamento/api/{comerciante_id}/funcionarios/{servico_id}/'
+        )
+        if status != 200 or not dados['funcionarios']:
+            return 'falhos'
+        funcionario_id = rnd.choice(dados['funcionarios'])['id']
+
+        hoje = timezone.localdate()
+        datas = sorted(rnd.sample(range(1, options['dias'] + 1), min(options['datas_por_fluxo'], options['dias'])))
+        opcoes = []
+        for dias in datas:
+            data = (hoje + timedelta(days=dias)).isoformat()
+            status, dados = await self._requisicao(
+                sessao, 'horarios_disponiveis', 'GET',
+                f'/agendamento/api/{comerciante_id}/horarios/{funcionario_id}/', params={'data': data}
+            )
+            if status != 200:
+                return 'falhos'
+            opcoes.extend((data, horario) for horario in dados['horarios'])
+        if not opcoes:
+            return 'sem_horario'
+
+        data, horario = rnd.choice(opcoes)
+        status, dados = await self._requisicao(
+            sessao, 'criar_agendamento', 'POST', f'/agendamento/api/{comerciante_id}/criar/',
+            json={
+                'servico_id': servico_id,
+                'funcionario_id': funcionario_id,
+                'data': data,
+                'horario': horario,
+                'cliente_nome': f'Benchmark {numero}',
+                'cliente_email': f'{self.execucao}.{numero}@{DOMINIO_EMAIL}',
+                'cliente_telefone': f'bm{self.execucao:08d}{numero:06d}',
+            }
+        )
+        if status == 200:
+            return 'concluidos'
+        return 'conflitos' if dados and CONFLITO in dados.get('error', '') else 'falhos'
+
+    def _resultado(self, alvos, options, duracao):
+        requisicoes = sum(len(etapa.latencias) for etapa in self.etapas.values())
+        return {
+            'data': timezone.now().isoformat(),
+            'versao': _versao(),
+            'parametros': {
+                'url': options['url'],
+                'concorrencia': options['concorrencia'],
+                'fluxos': options['fluxos'],
+                'duracao_limite': options['duracao'],
+                'dias': options['dias'],
+                'datas_por_fluxo': options['datas_por_fluxo'],
+                'semente': options['semente'],
+                'comerciantes': len(alvos),
+            },
+            'duracao_segundos': round(duracao, 3),
+            'requisicoes': requisicoes,
+            'requisicoes_por_segundo': round(requisicoes / duracao, 2),
+            'fluxos': dict(self.fluxos, por_segundo=round(self.fluxos['concluidos'] / duracao, 2)),
+            'etapas': {nome: etapa.resumo(duracao) for nome, etapa in self.etapas.items()},
+        }
+
+    def _relatorio(self, resultado):
+        fluxos = resultado['fluxos']
+        self.stdout.write(
+            f'{resultado["requisicoes"]} requisições em {resultado["duracao_segundos"]:.1f}s '
+            f'({resultado["requisicoes_por_segundo"]:.0f}/s); fluxos: {fluxos["concluidos"]} concluídos '
+            f'({fluxos["por_segundo"]:.1f}/s), {fluxos["conflitos"]} com conflito, {fluxos["sem_horario"]} sem horário, {fluxos["falhos"]} falhos'
+        )
+        for nome, etapa in resultado['etapas'].items():
+            latencia = etapa['latencia_ms']
+            consultas = f'{etapa["consultas"]["media"]:.1f} consultas' if etapa['consultas'] else 'consultas n/d'
+            self.stdout.write(
+                f'  {nome}: {etapa["requisicoes"]} req, p50 {latencia["p50"]:.1f} ms, p95 {latencia["p95"]:.1f} ms, '
+                f'p99 {latencia["p99"]:.1f} ms, erros {etapa["taxa_erros"]:.1%}, '
+                f'conflitos {etapa["taxa_conflitos"]:.1%}, {consultas}'
+            )
+        if not any(etapa['consultas'] for etapa in resultado['etapas'].values()):
+            self.stdout.write(self.style.WARNING(
+                'O servidor não informou consultas (Server-Timing); inicie-o com PERFIL_REQUISICOES=1 '
+                'e PERFIL_SERVER_TIMING_PUBLICO=1'
+            ))
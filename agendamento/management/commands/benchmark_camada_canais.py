@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from salao_agendamento.camada_canais import CamadaCanaisSQLite
+
+GRUPO = 'benchmark'
+
+
+async def _ponto_a_ponto(camada, mensagens):
+    """Envia e recebe `mensagens` em um único canal específico; retorna mensagens/s"""
+    canal = await camada.new_channel()
+    inicio = time.perf_counter()
+
+    async def receber():
+        for _ in range(mensagens):
+            await camada.receive(canal)
+
+    async def enviar():
+        for i in range(mensagens):
+            await camada.send(canal, {'type': 'benchmark', 'i': i})
+
+    await asyncio.gather(receber(), enviar())
+    return mensagens / (time.perf_counter() - inicio)
+
+
+async def _fan_out(camada, mensagens, canais):
+    """group_send de `mensagens` para um grupo com `canais` membros; retorna entregas/s"""
+    nomes = [await camada.new_channel() for _ in range(canais)]
+    for nome in nomes:
+        await camada.group_add(GRUPO, nome)
+    inicio = time.perf_counter()
+
+    async def receber(nome):
+        for _ in range(mensagens):
+            await camada.receive(nome)
+
+    async def enviar():
+        for i in range(mensagens):
+            await camada.group_send(GRUPO, {'type': 'benchmark', 'i': i})
+
+    await asyncio.gather(enviar(), *(receber(nome) for nome in nomes))
+    return mensagens * canais / (time.perf_counter() - inicio)
+
+
+def _worker(caminho, canais, mensagens, pronto, resultados):
+    """Processo receptor: entra no grupo com `canais` sockets e mede a latência de cada entrega"""
+    async def executar():
+        camada = CamadaCanaisSQLite(caminho=caminho, capacity=mensagens + 1)
+        nomes = [await camada.new_channel() for _ in range(canais)]
+        for nome in nomes:
+            await camada.group_add(GRUPO, nome)
+        pronto.set()
+
+        latencias = []
+
+        async def receber(nome):
+            for _ in range(mensagens):
+                mensagem = await camada.receive(nome)
+                latencias.append(time.time() - mensagem['enviado'])
+
+        await asyncio.gather(*(receber(nome) for nome in nomes))
+        await camada.close()
+        return latencias
+
+    resultados.put(asyncio.run(executar()))
+
+
+class Command(BaseCommand):
+    help = 'Compara a vazão da camada de canais SQLite com o InMemoryChannelLayer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mensagens', type=int, default=2000, help='Mensagens por cenário')
+        parser.add_argument('--canais', type=int, default=20, help='Membros do grupo por processo no fan-out')
+        parser.add_argument('--processos', type=int, default=2, help='Processos receptores no cenário multi-processo')
+
+    def handle(self, *args, **options):
+        mensagens = options['mensagens']
+        canais = options['canais']
+        processos = options['processos']
+        mensagens_grupo = max(mensagens // canais, 1)
+
+        with tempfile.TemporaryDirectory() as diretorio:
+            caminho = os.path.join(diretorio, 'canais.sqlite3')
+            camadas = {
+                'InMemoryChannelLayer': lambda: InMemoryChannelLayer(capacity=mensagens + 1),
+                'CamadaCanaisSQLite': lambda: CamadaCanaisSQLite(caminho=caminho, capacity=mensagens + 1),
+            }
+
+            for nome, fabrica in camadas.items():
+                vazao = asyncio.run(self._medir(fabrica, _ponto_a_ponto, mensagens))
+                self.stdout.write(f'{nome:<22} ponto a ponto: {vazao:>10.0f} msg/s')
+                vazao = asyncio.run(self._medir(fabrica, _fan_out, mensagens_grupo, canais))
+                self.stdout.write(f'{nome:<22} fan-out ({canais} canais): {vazao:>10.0f} entregas/s')
+
+            self._multi_processo(caminho, processos, canais, mensagens_grupo)
+
+    async def _medir(self, fabrica, cenario, *args):
+        camada = fabrica()
+        try:
+            return await cenario(camada, *args)
+        finally:
+            await camada.flush()
+            await camada.close()
+
+    def _multi_processo(self, caminho, processos, canais, mensagens):
+        """Um processo envia ao grupo e `processos` processos recebem (impossível com InMemoryChannelLayer)"""
+        contexto = multiprocessing.get_context('spawn')
+        resultados = contexto.Queue()
+        prontos = [contexto.Event() for _ in range(processos)]
+        workers = [
+            contexto.Process(target=_worker, args=(caminho, canais, mensagens, pronto, resultados))
+            for pronto in prontos
+        ]
+        for worker in workers:
+            worker.start()
+        for pronto in prontos:
+            pronto.wait()
+
+        async def enviar():
+            camada = CamadaCanaisSQLite(caminho=caminho)
+            for i in range(mensagens):
+                await camada.group_send(GRUPO, {'type': 'benchmark', 'i': i, 'enviado': time.time()})
+            await camada.close()
+
+        inicio = time.perf_counter()
+        asyncio.run(enviar())
+        latencias = []
+        for _ in workers:
+            latencias.extend(resultados.get())
+        duracao = time.perf_counter() - inicio
+        for worker in workers:
+            worker.join()
+
+        latencias.sort()
+        self.stdout.write(
+            f'{"CamadaCanaisSQLite":<22} {processos} processos x {canais} canais: '
+            f'{len(latencias) / duracao:>10.0f} entregas/s, '
+            f'latência p50 {statistics.median(latencias) * 1000:.1f} ms, '
+            f'p95 {latencias[int(len(latencias) * 0.95) - 1] * 1000:.1f} ms'
+        )
@@ -0,0 +1,188 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.utils import timezone
+
+from agendamento.disponibilidade import STATUS_OCUPAM_HORARIO
+from agendamento.models import Agendamento, Funcionario
+from ..benchmark_utils import percentis
+
+
+def _perfis():
+    """Configuração padrão do Django e a configuração ajustada do settings"""
+    ajustado = settings.DATABASES['default']
+    return {
+        'padrao': {'ENGINE': ajustado['ENGINE'], 'CONN_MAX_AGE': 0, 'OPTIONS': {}},
+        'ajustado': {
+            'ENGINE': ajustado['ENGINE'],
+            'CONN_MAX_AGE': ajustado.get('CONN_MAX_AGE', 0),
+            'OPTIONS': ajustado.get('OPTIONS', {}),
+        },
+    }
+
+
+def _copiar_banco(origem, destino, journal_mode):
+    """Cópia consistente do banco (API de backup), já no modo de journal do perfil"""
+    with sqlite3.connect(origem) as fonte, sqlite3.connect(destino) as copia:
+        fonte.backup(copia)
+        copia.execute(f'PRAGMA journal_mode={journal_mode}')
+    fonte.close()
+    copia.close()
+
+
+def _registrar_conexao(alias, nome, perfil):
+    configuradas = connections.configure_settings({
+        'default': settings.DATABASES['default'], alias: dict(perfil, NAME=nome)
+    })
+    connections.settings[alias] = configuradas[alias]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara a vazão de leitura e escrita concorrentes no SQLite com a configuração padrão '
+        'do Django e com a ajustada do settings (WAL, busy timeout, BEGIN IMMEDIATE, conexões '
+        'persistentes), sobre cópias descartáveis do banco atual'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leitores', type=int, default=8, help='Threads consultando a agenda')
+        parser.add_argument('--escritores', type=int, default=4, help='Threads criando agendamentos')
+        parser.add_argument('--segundos', type=float, default=10, help='Duração de cada perfil')
+        parser.add_argument('--perfil', choices=['padrao', 'ajustado'], action='append', help='Padrão: os dois')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--saida', help='Arquivo JSON do resultado')
+
+    def handle(self, *args, **options):
+        banco = settings.DATABASES['default']
+        if 'sqlite3' not in banco['ENGINE']:
+            raise CommandError('O benchmark compara configurações do SQLite; o banco padrão usa outro backend')
+
+        amostra = list(
+            Funcionario.objects.filter(ativo=True, servicos__ativo=True, comerciante__clientes__isnull=False)
+            .values_list('id', 'comerciante_id', 'servicos__id', 'comerciante__clientes__id')[:500]
+        )
+        if not amostra:
+            raise CommandError('Banco sem funcionários, serviços e clientes; gere dados com gerar_dados_sinteticos')
+
+        resultado = {}
+        pasta = tempfile.mkdtemp(prefix='benchmark_sqlite_')
+        try:
+            for nome, perfil in _perfis().items():
+                if options['perfil'] and nome not in options['perfil']:
+                    continue
+                caminho = os.path.join(pasta, f'{nome}.sqlite3')
+                journal = 'WAL' if 'journal_mode=WAL' in perfil['OPTIONS'].get('init_command', '') else 'DELETE'
+                _copiar_banco(str(banco['NAME']), caminho, journal)
+                _registrar_conexao(f'benchmark_{nome}', caminho, perfil)
+                resultado[nome] = self._executar(f'benchmark_{nome}', perfil, amostra, options)
+                self._relatorio(nome, resultado[nome])
+        finally:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(
+                    {'data': timezone.now().isoformat(), 'parametros': {
+                        chave: options[chave] for chave in ('leitores', 'escritores', 'segundos', 'semente')
+                    }, 'perfis': resultado},
+                    arquivo, indent=2, ensure_ascii=False
+                )
+            self.stdout.write(f'Resultado gravado em {options["saida"]}')
+
+    def _executar(self, alias, perfil, amostra, options):
+        persistente = perfil['CONN_MAX_AGE'] != 0
+        fim = time.perf_counter() + options['segundos']
+        hoje = timezone.localdate()
+        medidas = {'leitura': [], 'escrita': []}
+        falhas = {'leitura': 0, 'escrita': 0}
+
+        def ler(rnd):
+            funcionario_id, _, _, _ = rnd.choice(amostra)
+            dia = hoje + timedelta(days=rnd.randint(-30, 30))
+            # Mesma consulta de horarios_disponiveis
+            list(Agendamento.objects.using(alias).filter(
+                funcionario_id=funcionario_id, data_agendamento__date=dia, status__in=STATUS_OCUPAM_HORARIO
+            ).select_related('servico'))
+
+        def escrever(rnd):
+            funcionario_id, comerciante_id, servico_id, cliente_id = rnd.choice(amostra)
+            inicio = timezone.now() + timedelta(days=rnd.randint(1, 60), minutes=rnd.randint(0, 600))
+            # Mesmo padrão de criar_agendamento: a consulta de conflitos do dia e a gravação
+            # na mesma transação, que no perfil ajustado começa com BEGIN IMMEDIATE
+            with transaction.atomic(using=alias):
+                list(Agendamento.objects.using(alias).filter(
+                    funcionario_id=funcionario_id, data_agendamento__date=inicio.date(),
+                    status__in=STATUS_OCUPAM_HORARIO
+                ).select_related('servico'))
+                Agendamento.objects.using(alias).create(
+                    comerciante_id=comerciante_id, cliente_id=cliente_id, funcionario_id=funcionario_id,
+                    servico_id=servico_id, data_agendamento=inicio, status='agendado'
+                )
+
+        def trabalhador(tipo, operacao, semente, fila):
+            rnd = random.Random(semente)
+            latencias = []
+            erros = 0
+            while time.perf_counter() < fim:
+                inicio = time.perf_counter()
+                try:
+                    operacao(rnd)
+                    latencias.append(time.perf_counter() - inicio)
+                except OperationalError:
+                    erros += 1
+                if not persistente:
+                    # Sem CONN_MAX_AGE o Django abre uma conexão por requisição
+                    connections[alias].close()
+            connections[alias].close()
+            fila.put((tipo, latencias, erros))
+
+        # Processos, como os workers do gunicorn (threads ficariam limitadas pelo GIL)
+        contexto = multiprocessing.get_context('fork')
+        fila = contexto.Queue()
+        connections.close_all()
+        processos = [
+            contexto.Process(target=trabalhador, args=('leitura', ler, options['semente'] + i, fila))
+            for i in range(options['leitores'])
+        ] + [
+            contexto.Process(target=trabalhador, args=('escrita', escrever, options['semente'] + 1000 + i, fila))
+            for i in range(options['escritores'])
+        ]
+        inicio = time.perf_counter()
+        for processo in processos:
+            processo.start()
+        for _ in processos:
+            tipo, latencias, erros = fila.get()
+            medidas[tipo].extend(latencias)
+            falhas[tipo] += erros
+        for processo in processos:
+            processo.join()
+        duracao = time.perf_counter() - inicio
+
+        return {
+            tipo: {
+                'operacoes': len(medidas[tipo]),
+                'por_segundo': round(len(medidas[tipo]) / duracao, 1),
+                'erros': falhas[tipo],
+                'latencia_ms': {chave: round(valor, 2) for chave, valor in percentis(medidas[tipo]).items()},
+            }
+            for tipo in medidas
+        }
+
+    def _relatorio(self, nome, resultado):
+        self.stdout.write(f'{nome}:')
+        for tipo, dados in resultado.items():
+            latencia = dados['latencia_ms']
+            self.stdout.write(
+                f'  {tipo}: {dados["operacoes"]} ({dados["por_segundo"]:.0f}/s), {dados["erros"]} erros, '
+                f'p50 {latencia["p50"]:.1f} ms, p95 {latencia["p95"]:.1f} ms, p99 {latencia["p99"]:.1f} ms'
+            )
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from accounts.models import User
+from agendamento.consumers import send_notification_to_comerciante, send_notification_to_user
+from agendamento.models import Comerciante, Funcionario
+from agendamento.routing import websocket_urlpatterns
+from ..benchmark_utils import percentis
+
+
+def _memoria_residente():
+    """Memória residente do processo em bytes (Linux, via /proc)"""
+    with open('/proc/self/statm') as arquivo:
+        return int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _criar_equipe(conexoes):
+    """Um estabelecimento com `conexoes` funcionários, cada um com o próprio socket"""
+    dono = User.objects.create_user(username='benchmark_dono', tipo_usuario='comerciante')
+    comerciante = Comerciante.objects.create(
+        user=dono, nome_salao='Benchmark', endereco='-', telefone_comercial='-', horario_funcionamento='-'
+    )
+    usuarios = User.objects.bulk_create([
+        User(username=f'benchmark_{i}', tipo_usuario='funcionario', password='!')
+        for i in range(conexoes)
+    ])
+    Funcionario.objects.bulk_create([
+        Funcionario(user=usuario, comerciante=comerciante, especialidades='-', horario_trabalho='-')
+        for usuario in usuarios
+    ])
+    return comerciante.id, list(User.objects.filter(tipo_usuario='funcionario', username__startswith='benchmark_'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Teste de carga do NotificationConsumer: abre milhares de sockets em processo com '
+        'WebsocketCommunicator e mede taxa de conexão, latência de entrega e memória por conexão'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conexoes', type=int, default=1000, help='Sockets abertos simultaneamente')
+        parser.add_argument('--lote-conexao', type=int, default=100, help='Conexões abertas concorrentemente por vez')
+        parser.add_argument('--mensagens', type=int, default=200, help='Notificações individuais (send_notification_to_user)')
+        parser.add_argument('--broadcasts', type=int, default=5, help='Broadcasts para o estabelecimento inteiro')
+        parser.add_argument('--janela-ms', type=int, default=0, help='NOTIFICACOES_JANELA_AGRUPAMENTO_MS durante o teste')
+
+    def handle(self, *args, **options):
+        try:
+            from channels.testing import WebsocketCommunicator
+        except ImportError:
+            raise CommandError('O benchmark precisa de channels.testing, que depende do pacote daphne')
+        self.WebsocketCommunicator = WebsocketCommunicator
+
+        # Banco de teste descartável: nada é gravado no banco de desenvolvimento
+        bancos = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(NOTIFICACOES_JANELA_AGRUPAMENTO_MS=options['janela_ms']):
+                asyncio.run(self._executar(options))
+        finally:
+            teardown_databases(bancos, verbosity=0)
+
+    async def _executar(self, options):
+        conexoes = options['conexoes']
+        comerciante_id, usuarios = await sync_to_async(_criar_equipe, thread_sensitive=False)(conexoes)
+        app = URLRouter(websocket_urlpatterns)
+
+        # Conexão
+        memoria_inicial = _memoria_residente()
+        sockets = []
+        inicio = time.perf_counter()
+        for i in range(0, conexoes, options['lote_conexao']):
+            lote = usuarios[i:i + options['lote_conexao']]
+            sockets.extend(await asyncio.gather(*(self._conectar(app, usuario) for usuario in lote)))
+        duracao_conexao = time.perf_counter() - inicio
+        memoria_por_conexao = (_memoria_residente() - memoria_inicial) / conexoes
+
+        self.stdout.write(f'Conexões: {conexoes} em {duracao_conexao:.2f}s ({conexoes / duracao_conexao:.0f}/s)')
+        self.stdout.write(f'Memória por conexão: {memoria_por_conexao / 1024:.1f} KiB')
+
+        # Receptores: um por socket, registrando a latência de cada quadro de benchmark
+        latencias = {'usuario': [], 'broadcast': []}
+        esperados = {'usuario': 0, 'broadcast': 0}
+        recebidos = asyncio.Event()
+
+        async def receber(comunicador):
+            while True:
+                quadro = await comunicador.receive_json_from(timeout=3600)
+                tipo = quadro.get('benchmark')
+                if tipo is None:
+                    continue
+                latencias[tipo].append(time.time() - quadro['enviado'])
+                if sum(len(v) for v in latencias.values()) >= sum(esperados.values()):
+                    recebidos.set()
+
+        receptores = [asyncio.create_task(receber(comunicador)) for comunicador in sockets]
+
+        # Notificações individuais
+        esperados['usuario'] = options['mensagens']
+        inicio = time.perf_counter()
+        for i in range(options['mensagens']):
+            usuario = random.choice(usuarios)
+            await sync_to_async(send_notification_to_user, thread_sensitive=False)(
+                usuario.id, {'type': 'benchmark', 'benchmark': 'usuario', 'i': i, 'enviado': time.time()}
+            )
+        await self._aguardar(recebidos)
+        duracao = time.perf_counter() - inicio
+        self._relatorio('send_notification_to_user', latencias['usuario'], duracao)
+
+        # Broadcasts para o grupo do estabelecimento (todos os sockets)
+        recebidos.clear()
+        esperados['broadcast'] = options['broadcasts'] * conexoes
+        inicio = time.perf_counter()
+        for i in range(options['broadcasts']):
+            await sync_to_async(send_notification_to_comerciante, thread_sensitive=False)(
+                comerciante_id, {'type': 'benchmark', 'benchmark': 'broadcast', 'i': i, 'enviado': time.time()}
+            )
+        await self._aguardar(recebidos)
+        duracao = time.perf_counter() - inicio
+        self._relatorio(f'broadcast para {conexoes} sockets', latencias['broadcast'], duracao)
+
+        for receptor in receptores:
+            receptor.cancel()
+        await asyncio.gather(*(comunicador.disconnect() for comunicador in sockets), return_exceptions=True)
+
+    async def _conectar(self, app, usuario):
+        comunicador = self.WebsocketCommunicator(app, '/ws/notifications/')
+        comunicador.scope['user'] = usuario
+        conectado, _ = await comunicador.connect(timeout=30)
+        if not conectado:
+            raise CommandError(f'Conexão recusada para {usuario.username}')
+        await comunicador.receive_json_from(timeout=30)  # connection_established
+        return comunicador
+
+    async def _aguardar(self, recebidos):
+        try:
+            await asyncio.wait_for(recebidos.wait(), timeout=120)
+        except asyncio.TimeoutError:
+            self.stdout.write(self.style.WARNING('Tempo esgotado aguardando as entregas'))
+
+    def _relatorio(self, titulo, latencias, duracao):
+        p = percentis(latencias)
+        self.stdout.write(
+            f'{titulo}: {len(latencias)} entregas em {duracao:.2f}s ({len(latencias) / duracao:.0f}/s), '
+            f'latência p50 {p["p50"]:.1f} ms, p95 {p["p95"]:.1f} ms, p99 {p["p99"]:.1f} ms, máx {p["max"]:.1f} ms'
+        )
@@ -0,0 +1,377 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, time as hora, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from accounts.models import User
+from agendamento.models import (
+    Agendamento, Cliente, Comerciante, Funcionario, LembreteAgendado, NotificacaoOutbox, Servico,
+)
+
+NOMES = [
+    'Ana', 'Bruno', 'Carla', 'Daniel', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João',
+    'Larissa', 'Marcos', 'Natália', 'Otávio', 'Patrícia', 'Rafael', 'Sabrina', 'Thiago', 'Vanessa', 'Yuri',
+]
+SOBRENOMES = [
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Ferreira', 'Almeida', 'Ribeiro',
+    'Carvalho', 'Gomes', 'Martins', 'Rocha', 'Barbosa', 'Araújo', 'Melo', 'Cardoso', 'Teixeira', 'Moreira',
+]
+# (nome, preço, duração em minutos)
+CATALOGO_SERVICOS = [
+    ('Corte feminino', 80, 60), ('Corte masculino', 45, 30), ('Barba', 35, 30), ('Escova', 60, 60),
+    ('Coloração', 180, 120), ('Mechas', 250, 180), ('Hidratação', 90, 60), ('Manicure', 35, 60),
+    ('Pedicure', 40, 60), ('Design de sobrancelha', 40, 30), ('Progressiva', 300, 180), ('Maquiagem', 150, 60),
+]
+
+# Movimento relativo por dia da semana (segunda a domingo): sexta e sábado são os mais cheios
+PESO_DIA_SEMANA = [0.7, 0.8, 0.9, 1.0, 1.4, 1.6, 0.0]
+# Horários de início (8h às 18h, de meia em meia hora), com pico no fim da manhã e no fim da tarde
+HORARIOS = [hora(8 + m // 60, m % 60) for m in range(0, 10 * 60 + 1, 30)]
+PESO_HORARIO = [0.6, 0.8, 1.0, 1.2, 1.3, 1.3, 1.1, 0.8, 0.7, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.4, 1.3, 1.2, 1.0, 0.8, 0.5]
+
+STATUS_PASSADO = (['concluido', 'cancelado', 'nao_compareceu', 'confirmado'], [0.78, 0.12, 0.08, 0.02])
+STATUS_FUTURO = (['agendado', 'confirmado', 'cancelado'], [0.6, 0.3, 0.1])
+CANAIS = (['email', 'sms', 'whatsapp'], [0.8, 0.15, 0.05])
+
+# Colunas das tabelas volumosas, na ordem das tuplas montadas em _criar_agendamentos
+COLUNAS_AGENDAMENTO = (
+    'id', 'comerciante', 'cliente', 'funcionario', 'servico', 'data_agendamento', 'status', 'observacoes',
+    'valor_pago', 'data_criacao', 'data_atualizacao', 'token_confirmacao', 'lembrete_enviado',
+    'confirmado_pelo_cliente',
+)
+COLUNAS_LEMBRETE = ('agendamento', 'antecedencia_minutos', 'enviar_em')
+
+
+@contextmanager
+def _datas_manuais(*campos):
+    """Desliga auto_now/auto_now_add nos campos para gravar datas históricas no bulk_create"""
+    originais = [(campo, campo.auto_now, campo.auto_now_add) for campo in campos]
+    for campo in campos:
+        campo.auto_now = campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, auto_now, auto_now_add in originais:
+            campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+
+def _inserir(modelo, campos, linhas):
+    """
+    INSERT com executemany de tuplas já no formato do banco. Em milhões de linhas, o
+    bulk_create gasta a maior parte do tempo instanciando modelos e preparando cada campo.
+    """
+    if not linhas:
+        return
+    qn = connection.ops.quote_name
+    colunas = [modelo._meta.get_field(campo).column for campo in campos]
+    sql = (
+        f'INSERT INTO {qn(modelo._meta.db_table)} ({", ".join(qn(coluna) for coluna in colunas)}) '
+        f'VALUES ({", ".join(["%s"] * len(colunas))})'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, linhas)
+
+
+def _excluir(modelo, **filtros):
+    """DELETE direto no banco das linhas filtradas, sem carregá-las"""
+    sql, params = modelo._base_manager.filter(**filtros).values('pk').query.sql_with_params()
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {qn(modelo._meta.db_table)} WHERE {qn(modelo._meta.pk.column)} IN ({sql})', params
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Gera estabelecimentos sintéticos (comerciantes, funcionários, serviços, clientes e anos de '
+        'agendamentos) em lotes grandes e com semente fixa, para testes de carga reproduzíveis'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comerciantes', type=int, default=10)
+        parser.add_argument('--funcionarios', type=int, default=5, help='Funcionários por comerciante')
+        parser.add_argument('--servicos', type=int, default=8, help='Serviços por comerciante (máx. 12)')
+        parser.add_argument('--clientes', type=int, default=500, help='Clientes por comerciante')
+        parser.add_argument('--agendamentos', type=int, default=10000, help='Total de agendamentos')
+        parser.add_argument('--anos', type=float, default=2, help='Anos de histórico até hoje')
+        parser.add_argument('--dias-futuros', type=int, default=30, help='Dias de agenda à frente')
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--lote', type=int, default=20000, help='Linhas por lote de inserção')
+        parser.add_argument('--prefixo', default='sint', help='Prefixo dos usernames gerados')
+        parser.add_argument('--senha', default='senha123', help='Senha de todos os usuários gerados')
+        parser.add_argument('--limpar', action='store_true', help='Remove antes os dados gerados com o mesmo prefixo')
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['semente'])
+        self.lote = options['lote']
+        self.prefixo = options['prefixo']
+        self.inicio = time.perf_counter()
+
+        if options['servicos'] > len(CATALOGO_SERVICOS):
+            raise CommandError(f'No máximo {len(CATALOGO_SERVICOS)} serviços por comerciante')
+
+        usuarios_existentes = User.objects.filter(username__startswith=f'{self.prefixo}_')
+        if usuarios_existentes.exists():
+            if not options['limpar']:
+                raise CommandError(f'Já existem dados com o prefixo "{self.prefixo}"; use --limpar ou outro --prefixo')
+            self._limpar(usuarios_existentes)
+            self._progresso('Dados anteriores removidos')
+
+        # Um único hash para todos: make_password por usuário levaria minutos
+        self.senha = make_password(options['senha'])
+
+        estabelecimentos = self._criar_estabelecimentos(options)
+        self._criar_agendamentos(estabelecimentos, options)
+        self._progresso('Concluído')
+
+    def _limpar(self, usuarios):
+        """
+        Remove os dados do prefixo tabela a tabela, das dependentes para as principais, com
+        DELETE ... WHERE id IN (subconsulta): a exclusão em cascata do ORM carregaria milhões
+        de linhas na memória e montaria listas enormes de ids. Os usuários, poucos, saem por
+        último pelo ORM, que cuida do que ainda depender deles.
+        """
+        do_prefixo = f'{self.prefixo}_'
+        with transaction.atomic():
+            for modelo, caminho in (
+                (LembreteAgendado, 'agendamento__comerciante__user__username__startswith'),
+                (NotificacaoOutbox, 'comerciante__user__username__startswith'),
+                (Agendamento, 'comerciante__user__username__startswith'),
+                (Cliente, 'comerciante__user__username__startswith'),
+                (Servico.funcionarios.through, 'servico__comerciante__user__username__startswith'),
+                (Servico, 'comerciante__user__username__startswith'),
+                (Funcionario, 'comerciante__user__username__startswith'),
+                (Comerciante, 'user__username__startswith'),
+            ):
+                _excluir(modelo, **{caminho: do_prefixo})
+            usuarios.delete()
+
+    def _progresso(self, mensagem):
+        self.stdout.write(f'[{time.perf_counter() - self.inicio:7.1f}s] {mensagem}')
+
+    def _nome(self):
+        return self.rnd.choice(NOMES), self.rnd.choice(SOBRENOMES)
+
+    def _criar_estabelecimentos(self, options):
+        """Comerciantes com funcionários, serviços (e o M2M) e clientes; retorna os dados para a agenda"""
+        rnd = self.rnd
+        agora = timezone.now()
+        abertura = agora - timedelta(days=int(options['anos'] * 365) + 30)
+
+        with transaction.atomic(), _datas_manuais(
+            Comerciante._meta.get_field('data_criacao'),
+            Servico._meta.get_field('data_criacao'),
+            Cliente._meta.get_field('data_cadastro'),
+            Funcionario._meta.get_field('data_contratacao'),
+        ):
+            donos = User.objects.bulk_create([
+                User(
+                    username=f'{self.prefixo}_dono_{i}', password=self.senha, tipo_usuario='comerciante',
+                    first_name=nome, last_name=sobrenome, email=f'{self.prefixo}_dono_{i}@exemplo.com'
+                )
+                for i, (nome, sobrenome) in ((i, self._nome()) for i in range(options['comerciantes']))
+            ], batch_size=self.lote)
+            comerciantes = Comerciante.objects.bulk_create([
+                Comerciante(
+                    user=dono, nome_salao=f'Salão {dono.last_name} {i}', endereco=f'Rua {rnd.randint(1, 2000)}',
+                    telefone_comercial=f'11{rnd.randint(30000000, 39999999)}',
+                    horario_funcionamento='Seg a Sáb, 08:00 às 19:00', data_criacao=abertura
+                )
+                for i, dono in enumerate(donos)
+            ], batch_size=self.lote)
+
+            usuarios_funcionarios = User.objects.bulk_create([
+                User(
+                    username=f'{self.prefixo}_func_{c}_{i}', password=self.senha, tipo_usuario='funcionario',
+                    first_name=nome, last_name=sobrenome
+                )
+                for c in range(len(comerciantes))
+                for i, (nome, sobrenome) in ((i, self._nome()) for i in range(options['funcionarios']))
+            ], batch_size=self.lote)
+            funcionarios = Funcionario.objects.bulk_create([
+                Funcionario(
+                    user=usuario, comerciante=comerciantes[n // options['funcionarios']],
+                    especialidades='Cabelo, unhas e estética', horario_trabalho='08:00 às 19:00',
+                    data_contratacao=(abertura + timedelta(days=rnd.randint(0, 30))).date()
+                )
+                for n, usuario in enumerate(usuarios_funcionarios)
+            ], batch_size=self.lote)
+
+            servicos = Servico.objects.bulk_create([
+                Servico(
+                    comerciante=comerciante, nome=nome, preco=Decimal(preco), duracao_minutos=duracao,
+                    data_criacao=abertura
+                )
+                for comerciante in comerciantes
+                for nome, preco, duracao in rnd.sample(CATALOGO_SERVICOS, options['servicos'])
+            ], batch_size=self.lote)
+
+            # Cada serviço é prestado por parte da equipe (ao menos um funcionário)
+            equipe = {}
+            for funcionario in funcionarios:
+                equipe.setdefault(funcionario.comerciante_id, []).append(funcionario)
+            relacoes = []
+            por_comerciante = {
+                comerciante.id: {'servicos': [], 'prestadores': {}, 'clientes': []} for comerciante in comerciantes
+            }
+            for servico in servicos:
+                time_servico = equipe[servico.comerciante_id]
+                escolhidos = rnd.sample(time_servico, rnd.randint(1, len(time_servico)))
+                por_comerciante[servico.comerciante_id]['servicos'].append(servico)
+                por_comerciante[servico.comerciante_id]['prestadores'][servico.id] = [
+                    funcionario.id for funcionario in escolhidos
+                ]
+                relacoes.extend(
+                    Servico.funcionarios.through(servico_id=servico.id, funcionario_id=funcionario.id)
+                    for funcionario in escolhidos
+                )
+            Servico.funcionarios.through.objects.bulk_create(relacoes, batch_size=self.lote)
+
+            canais, pesos_canais = CANAIS
+            clientes = Cliente.objects.bulk_create([
+                Cliente(
+                    comerciante=comerciante, nome=f'{nome} {sobrenome}', email=f'cliente{i}.{comerciante.id}@exemplo.com',
+                    telefone=f'119{rnd.randint(10000000, 99999999)}',
+                    canal_preferido=rnd.choices(canais, pesos_canais)[0],
+                    data_cadastro=abertura + timedelta(days=rnd.randint(0, 365))
+                )
+                for comerciante in comerciantes
+                for i, (nome, sobrenome) in ((i, self._nome()) for i in range(options['clientes']))
+            ], batch_size=self.lote)
+
+        self._progresso(
+            f'{len(comerciantes)} comerciantes, {len(funcionarios)} funcionários, {len(servicos)} serviços, '
+            f'{len(clientes)} clientes'
+        )
+
+        for cliente in clientes:
+            por_comerciante[cliente.comerciante_id]['clientes'].append(cliente.id)
+        return por_comerciante
+
+    def _criar_agendamentos(self, estabelecimentos, options):
+        """
+        Agendamentos distribuídos pelos dias úteis (pesos por dia da semana e horário), sem
+        dois agendamentos no mesmo horário para o mesmo funcionário; status conforme o
+        agendamento já passou ou não. Lembretes pendentes para os futuros.
+        """
+        rnd = self.rnd
+        agora = timezone.now()
+        hoje = timezone.localdate()
+        primeiro_dia = hoje - timedelta(days=int(options['anos'] * 365))
+        dias = [primeiro_dia + timedelta(days=n) for n in range((hoje - primeiro_dia).days + options['dias_futuros'] + 1)]
+        pesos_dias = [PESO_DIA_SEMANA[dia.weekday()] for dia in dias]
+
+        total = options['agendamentos']
+        quantidades = [
+            total // len(estabelecimentos) + (1 if i < total % len(estabelecimentos) else 0)
+            for i in range(len(estabelecimentos))
+        ]
+        capacidade = sum(1 for p in pesos_dias if p) * len(HORARIOS) * options['funcionarios']
+        if quantidades and quantidades[0] > capacidade * 0.8:
+            raise CommandError(
+                f'{quantidades[0]} agendamentos por comerciante excedem a agenda disponível '
+                f'({capacidade} horários); aumente --anos ou --funcionarios'
+            )
+
+        antecedencias = getattr(settings, 'LEMBRETES_ANTECEDENCIAS_MINUTOS', [24 * 60, 2 * 60])
+        status_passado, pesos_passado = STATUS_PASSADO
+        status_futuro, pesos_futuro = STATUS_FUTURO
+        fuso = timezone.get_current_timezone()
+
+        # Valores já no formato do banco; datas de agenda e preços se repetem muito
+        adaptar_data = connection.ops.adapt_datetimefield_value
+        datas_banco = {}
+        precos_banco = {}
+        campo_valor = Agendamento._meta.get_field('valor_pago')
+
+        def data_banco(valor):
+            convertido = datas_banco.get(valor)
+            if convertido is None:
+                convertido = datas_banco[valor] = adaptar_data(valor)
+            return convertido
+
+        # Ids definidos aqui para ligar os lembretes sem reler os agendamentos
+        proximo_id = (Agendamento.objects.aggregate(maximo=Max('id'))['maximo'] or 0) + 1
+        agendamentos = []
+        lembretes = []
+        criados = 0
+
+        for (comerciante_id, dados), quantidade in zip(estabelecimentos.items(), quantidades):
+            ocupados = set()
+            sorteio_dias = rnd.choices(dias, pesos_dias, k=quantidade)
+            sorteio_horarios = rnd.choices(HORARIOS, PESO_HORARIO, k=quantidade)
+
+            for dia, horario in zip(sorteio_dias, sorteio_horarios):
+                # Horário ocupado: sorteia outro serviço e horário; a cada 10 tentativas, outro dia
+                for tentativa in range(1000):
+                    servico = rnd.choice(dados['servicos'])
+                    funcionario_id = rnd.choice(dados['prestadores'][servico.id])
+                    if (funcionario_id, dia, horario) not in ocupados:
+                        break
+                    horario = rnd.choice(HORARIOS)
+                    if tentativa % 10 == 9:
+                        dia = rnd.choice(sorteio_dias)
+                else:
+                    raise CommandError('Agenda cheia demais; aumente --anos ou --funcionarios')
+                ocupados.add((funcionario_id, dia, horario))
+
+                inicio = datetime.combine(dia, horario, tzinfo=fuso)
+                passado = inicio < agora
+                if passado:
+                    status = rnd.choices(status_passado, pesos_passado)[0]
+                else:
+                    status = rnd.choices(status_futuro, pesos_futuro)[0]
+                criado_em = min(inicio - timedelta(days=rnd.randint(0, 20), minutes=rnd.randint(0, 600)), agora)
+
+                valor_pago = None
+                if status == 'concluido':
+                    valor_pago = precos_banco.get(servico.id)
+                    if valor_pago is None:
+                        valor_pago = precos_banco[servico.id] = connection.ops.adapt_decimalfield_value(
+                            servico.preco, campo_valor.max_digits, campo_valor.decimal_places
+                        )
+
+                criado_em_banco = adaptar_data(criado_em)
+                agendamentos.append((
+                    proximo_id, comerciante_id, rnd.choice(dados['clientes']), funcionario_id, servico.id,
+                    data_banco(inicio), status, '', valor_pago,
+                    criado_em_banco, data_banco(inicio) if passado else criado_em_banco,
+                    '%032x' % rnd.getrandbits(128), passado, status == 'confirmado',
+                ))
+                if not passado and status in ('agendado', 'confirmado'):
+                    for minutos in antecedencias:
+                        enviar_em = inicio - timedelta(minutes=minutos)
+                        if enviar_em > agora:
+                            lembretes.append((proximo_id, minutos, data_banco(enviar_em)))
+                proximo_id += 1
+
+                if len(agendamentos) >= self.lote:
+                    criados += self._gravar(agendamentos, lembretes)
+                    agendamentos, lembretes = [], []
+                    self._progresso(f'{criados} agendamentos')
+
+        if agendamentos:
+            criados += self._gravar(agendamentos, lembretes)
+            self._progresso(f'{criados} agendamentos')
+
+        if connection.vendor != 'sqlite':
+            # Ids explícitos não avançam as sequências do PostgreSQL/Oracle
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Agendamento, LembreteAgendado]):
+                    cursor.execute(sql)
+
+    def _gravar(self, agendamentos, lembretes):
+        with transaction.atomic():
+            _inserir(Agendamento, COLUNAS_AGENDAMENTO, agendamentos)
+            _inserir(LembreteAgendado, COLUNAS_LEMBRETE, lembretes)
+        return len(agendamentos)
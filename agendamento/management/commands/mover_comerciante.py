@@ -0,0 +1,115 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from accounts.models import User
+from accounts.tenant import invalidar_tenant_comerciante
+from accounts.websocket_middleware import invalidar_usuario
+from agendamento.consumers import desconectar_usuarios
+from agendamento.models import (
+    Agendamento, Cliente, Comerciante, Funcionario, LembreteAgendado, NotificacaoOutbox, Servico, ShardComerciante,
+)
+from salao_agendamento import shards
+
+# Tabelas do comerciante na ordem de cópia (a remoção da origem segue a ordem inversa)
+TABELAS = [
+    (Comerciante, 'id'),
+    (Funcionario, 'comerciante_id'),
+    (Servico, 'comerciante_id'),
+    (Servico.funcionarios.through, 'servico__comerciante_id'),
+    (Cliente, 'comerciante_id'),
+    (Agendamento, 'comerciante_id'),
+    (LembreteAgendado, 'agendamento__comerciante_id'),
+    (NotificacaoOutbox, 'comerciante_id'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Move um comerciante, com funcionários, serviços, clientes, agendamentos, lembretes e '
+        'notificações pendentes, para outro shard, mantendo os ids (requer DB_SHARDS)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('comerciante_id', type=int)
+        parser.add_argument('destino', help='Alias do shard de destino (default, shard_1, ...)')
+
+    def handle(self, *args, **options):
+        if not shards.ativo():
+            raise CommandError('Sharding desativado: defina DB_SHARDS')
+        comerciante_id, destino = options['comerciante_id'], options['destino']
+        if destino not in shards.todos():
+            raise CommandError(f'Shard desconhecido: {destino} (disponíveis: {", ".join(shards.todos())})')
+
+        # Lê o diretório sem o cache, que pode estar desatualizado
+        shards.invalidar_shard(comerciante_id)
+        origem = shards.shard_do_comerciante(comerciante_id)
+        comerciante = Comerciante.objects.using(origem).filter(pk=comerciante_id).first()
+        if comerciante is None:
+            raise CommandError(f'Comerciante {comerciante_id} não encontrado em {origem}')
+        if origem == destino:
+            self.stdout.write(f'{comerciante.nome_salao} já está em {destino}')
+            return
+
+        user_ids = [comerciante.user_id, *Funcionario.objects.using(origem).filter(
+            comerciante_id=comerciante_id
+        ).values_list('user_id', flat=True)]
+
+        copiados = {}
+        with (
+            transaction.atomic(using=DEFAULT_DB_ALIAS),
+            transaction.atomic(using=origem),
+            transaction.atomic(using=destino),
+        ):
+            if destino != DEFAULT_DB_ALIAS:
+                # Usuários criados antes do sharding ainda não têm cópia nos shards
+                shards.copiar_linhas(User, DEFAULT_DB_ALIAS, destino, pk__in=user_ids)
+            sequencias = self._sequencias(destino)
+            for modelo, campo in TABELAS:
+                copiados[modelo] = shards.copiar_linhas(modelo, origem, destino, **{campo: comerciante_id})
+            self._ajustar_sequencias(destino, sequencias, copiados)
+            # Só as tabelas do shard: sem a cascata do ORM, que chegaria à presença no principal
+            for modelo, campo in reversed(TABELAS):
+                shards.excluir_linhas(modelo, origem, **{campo: comerciante_id})
+            ShardComerciante.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+                comerciante_id=comerciante_id, defaults={'shard': destino}
+            )
+
+        shards.invalidar_shard(comerciante_id)
+        invalidar_tenant_comerciante(comerciante)
+        # Sockets abertos reconectam e passam a resolver o comerciante no shard novo
+        for user_id in user_ids:
+            invalidar_usuario(user_id)
+        desconectar_usuarios(user_ids)
+
+        resumo = ', '.join(f'{len(ids)} {modelo._meta.model_name}' for modelo, ids in copiados.items() if ids)
+        self.stdout.write(self.style.SUCCESS(f'{comerciante.nome_salao}: {origem} -> {destino} ({resumo})'))
+
+    def _sequencias(self, alias):
+        """AUTOINCREMENT atual de cada tabela de shard (só SQLite)"""
+        if connections[alias].vendor != 'sqlite':
+            return {}
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT name, seq FROM sqlite_sequence')
+            return dict(cursor.fetchall())
+
+    def _ajustar_sequencias(self, destino, anteriores, copiados):
+        """
+        No SQLite o próximo id é maior que o maior id da tabela: ids de uma faixa mais alta
+        copiados para o destino levariam os ids novos dele para a faixa do outro shard. Nesse
+        caso o destino passa para uma faixa nova, acima de todas as usadas. Em bancos com
+        sequências independentes dos ids gravados (PostgreSQL) nada muda.
+        """
+        if connections[destino].vendor != 'sqlite':
+            return
+        for modelo, ids in copiados.items():
+            tabela = modelo._meta.db_table
+            if not ids or max(ids) <= anteriores.get(tabela, 0):
+                continue
+            maior = max(
+                self._sequencias(alias).get(tabela, 0)
+                for alias in shards.todos() if connections[alias].vendor == 'sqlite'
+            )
+            inicio = (maior // shards.FAIXA_IDS + 1) * shards.FAIXA_IDS
+            with connections[destino].cursor() as cursor:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [inicio, tabela])
+            self.stdout.write(f'{tabela}: ids novos de {destino} a partir de {inicio + 1}')
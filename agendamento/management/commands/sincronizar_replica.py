@@ -0,0 +1,47 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from salao_agendamento.replicas import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        'Copia o banco principal SQLite para a réplica de leitura (API de backup do SQLite, '
+        'consistente mesmo com escritas em andamento). Para testar a réplica localmente.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo', type=float, default=0,
+            help='Repete a cópia a cada N segundos até ser interrompido (0 = copia uma vez)'
+        )
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError(f'Réplica não configurada: defina DB_REPLICA (DATABASES["{REPLICA_ALIAS}"])')
+        principal = settings.DATABASES['default']
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        if 'sqlite3' not in principal['ENGINE'] or 'sqlite3' not in replica['ENGINE']:
+            raise CommandError('A cópia só funciona entre bancos SQLite; use a replicação do próprio banco')
+
+        while True:
+            inicio = time.perf_counter()
+            self._copiar(str(principal['NAME']), str(replica['NAME']))
+            self.stdout.write(f'Réplica sincronizada em {(time.perf_counter() - inicio) * 1000:.0f} ms')
+            if not options['intervalo']:
+                return
+            time.sleep(options['intervalo'])
+
+    def _copiar(self, origem, destino):
+        # Cópia no próprio arquivo da réplica: conexões abertas (CONN_MAX_AGE) passam a ver
+        # os dados novos, o que não aconteceria trocando o arquivo
+        fonte = sqlite3.connect(origem)
+        copia = sqlite3.connect(destino, timeout=20)
+        try:
+            fonte.backup(copia)
+        finally:
+            copia.close()
+            fonte.close()
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0003_add_notification_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LembreteAgendado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('antecedencia_minutos', models.PositiveIntegerField(verbose_name='Antecedência (minutos)')),
+                ('enviar_em', models.DateTimeField(verbose_name='Enviar em')),
+                ('enviado_em', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+                ('agendamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lembretes_agendados', to='agendamento.agendamento', verbose_name='Agendamento')),
+            ],
+            options={
+                'verbose_name': 'Lembrete Agendado',
+                'verbose_name_plural': 'Lembretes Agendados',
+                'ordering': ['enviar_em'],
+                'indexes': [models.Index(fields=['enviado_em', 'enviar_em'], name='lembrete_pendente_idx')],
+            },
+        ),
+    ]
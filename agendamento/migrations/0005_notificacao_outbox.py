@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:14
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0004_lembrete_agendado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificacaoOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50, verbose_name='Tipo')),
+                ('chave_idempotencia', models.CharField(max_length=200, unique=True, verbose_name='Chave de Idempotência')),
+                ('payload', models.JSONField(default=dict, verbose_name='Dados')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('enviada', 'Enviada'), ('falhou', 'Falhou')], default='pendente', max_length=20, verbose_name='Status')),
+                ('tentativas', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('proxima_tentativa_em', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima Tentativa em')),
+                ('ultimo_erro', models.TextField(blank=True, verbose_name='Último Erro')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, verbose_name='Data de Criação')),
+                ('enviado_em', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+                ('agendamento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes_outbox', to='agendamento.agendamento', verbose_name='Agendamento')),
+            ],
+            options={
+                'verbose_name': 'Notificação (Outbox)',
+                'verbose_name_plural': 'Notificações (Outbox)',
+                'ordering': ['data_criacao'],
+                'indexes': [models.Index(fields=['status', 'proxima_tentativa_em'], name='outbox_pendente_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0005_notificacao_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='canal_preferido',
+            field=models.CharField(choices=[('email', 'E-mail'), ('sms', 'SMS'), ('whatsapp', 'WhatsApp')], default='email', help_text='Canal usado para lembretes', max_length=20, verbose_name='Canal Preferido'),
+        ),
+    ]
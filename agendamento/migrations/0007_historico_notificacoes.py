@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('agendamento', '0006_cliente_canal_preferido'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenciaNotificacao',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sequencia_notificacao', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+                ('ultima', models.PositiveBigIntegerField(default=0, verbose_name='Última Sequência')),
+            ],
+            options={
+                'verbose_name': 'Sequência de Notificação',
+                'verbose_name_plural': 'Sequências de Notificação',
+            },
+        ),
+        migrations.CreateModel(
+            name='NotificacaoUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequencia', models.PositiveBigIntegerField(verbose_name='Sequência')),
+                ('dados', models.JSONField(verbose_name='Dados')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Data de Criação')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Notificação do Usuário',
+                'verbose_name_plural': 'Notificações do Usuário',
+                'ordering': ['user', 'sequencia'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'sequencia'), name='notificacao_usuario_sequencia_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0007_historico_notificacoes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PresencaConexao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('canal', models.CharField(max_length=100, unique=True, verbose_name='Canal')),
+                ('grupos', models.JSONField(default=list, verbose_name='Grupos')),
+                ('processo', models.CharField(max_length=100, verbose_name='Processo')),
+                ('conectado_em', models.DateTimeField(auto_now_add=True, verbose_name='Conectado em')),
+                ('ultimo_sinal', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Último Sinal')),
+                ('comerciante', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conexoes', to='agendamento.comerciante', verbose_name='Comerciante')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conexoes', to=settings.AUTH_USER_MODEL, verbose_name='Usuário')),
+            ],
+            options={
+                'verbose_name': 'Conexão Ativa',
+                'verbose_name_plural': 'Conexões Ativas',
+                'indexes': [models.Index(fields=['user', 'ultimo_sinal'], name='presenca_usuario_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0008_presenca_conexao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShardComerciante',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comerciante_id', models.PositiveBigIntegerField(unique=True, verbose_name='Comerciante')),
+                ('shard', models.CharField(max_length=50, verbose_name='Shard')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Shard do Comerciante',
+                'verbose_name_plural': 'Shards dos Comerciantes',
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:42
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_comerciante(apps, schema_editor):
+    """Comerciante das notificações existentes: pelo agendamento ou pelo grupo do payload"""
+    NotificacaoOutbox = apps.get_model('agendamento', 'NotificacaoOutbox')
+    Agendamento = apps.get_model('agendamento', 'Agendamento')
+    Comerciante = apps.get_model('agendamento', 'Comerciante')
+    banco = schema_editor.connection.alias
+
+    NotificacaoOutbox.objects.using(banco).filter(agendamento__isnull=False).update(
+        comerciante_id=models.Subquery(
+            Agendamento.objects.using(banco).filter(pk=models.OuterRef('agendamento_id')).values('comerciante_id')[:1]
+        )
+    )
+    notificacoes = list(NotificacaoOutbox.objects.using(banco).filter(
+        agendamento__isnull=True, payload__grupo__startswith='comerciante_'
+    ))
+    ids = {n.pk: int(re.match(r'comerciante_(\d+)', n.payload['grupo']).group(1)) for n in notificacoes}
+    # Grupos de estabelecimentos já removidos ficam sem comerciante
+    existentes = set(Comerciante.objects.using(banco).filter(pk__in=ids.values()).values_list('pk', flat=True))
+    for notificacao in notificacoes:
+        if ids[notificacao.pk] in existentes:
+            notificacao.comerciante_id = ids[notificacao.pk]
+            notificacao.save(update_fields=['comerciante'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0009_shard_comerciante'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificacaooutbox',
+            name='comerciante',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes_outbox', to='agendamento.comerciante', verbose_name='Comerciante'),
+        ),
+        migrations.RunPython(preencher_comerciante, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='presencaconexao',
+            name='comerciante',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conexoes', to='agendamento.comerciante', verbose_name='Comerciante'),
+        ),
+    ]
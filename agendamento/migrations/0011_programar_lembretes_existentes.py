@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.utils import timezone
+
+from agendamento.notifications import horarios_lembretes
+
+
+def programar_lembretes(apps, schema_editor):
+    """
+    Lembretes dos agendamentos futuros criados antes da programação por agendamento:
+    sem isso eles não receberiam lembrete nenhum. Ficam de fora os que já têm lembretes
+    programados e os que já receberam o lembrete único da varredura antiga.
+    """
+    Agendamento = apps.get_model('agendamento', 'Agendamento')
+    LembreteAgendado = apps.get_model('agendamento', 'LembreteAgendado')
+    banco = schema_editor.connection.alias
+    agora = timezone.now()
+
+    agendamentos = Agendamento.objects.using(banco).filter(
+        status__in=['agendado', 'confirmado'],
+        data_agendamento__gt=agora,
+        lembrete_enviado=False,
+        lembretes_agendados__isnull=True,
+    ).values_list('pk', 'data_agendamento')
+
+    LembreteAgendado.objects.using(banco).bulk_create([
+        LembreteAgendado(agendamento_id=pk, antecedencia_minutos=antecedencia, enviar_em=enviar_em)
+        for pk, data_agendamento in agendamentos.iterator()
+        for antecedencia, enviar_em in horarios_lembretes(data_agendamento, agora)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agendamento', '0010_outbox_comerciante'),
+    ]
+
+    operations = [
+        migrations.RunPython(programar_lembretes, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
+from salao_agendamento.shards import TenantManager
+
 class Comerciante(models.Model):
     """
     Modelo para representar um comerciante (dono do estabelecimento)
@@ -58,6 +61,8 @@ class Comerciante(models.Model):
         verbose_name='Data de Criação'
     )
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = "Proprietário"
         verbose_name_plural = "Proprietários"
@@ -111,6 +116,8 @@ class Funcionario(models.Model):
         verbose_name='Data de Contratação'
     )
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = 'Funcionário'
         verbose_name_plural = 'Funcionários'
@@ -167,6 +174,8 @@ class Servico(models.Model):
         verbose_name='Data de Criação'
     )
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = 'Serviço'
         verbose_name_plural = 'Serviços'
@@ -179,6 +188,12 @@ class Cliente(models.Model):
     """
     Modelo para representar um cliente
     """
+    CANAL_CHOICES = [
+        ('email', 'E-mail'),
+        ('sms', 'SMS'),
+        ('whatsapp', 'WhatsApp'),
+    ]
+
     nome = models.CharField(
         max_length=200,
         verbose_name='Nome Completo'
@@ -212,11 +227,21 @@ class Cliente(models.Model):
         verbose_name='Proprietário'
     )
 
+    canal_preferido = models.CharField(
+        max_length=20,
+        choices=CANAL_CHOICES,
+        default='email',
+        verbose_name='Canal Preferido',
+        help_text='Canal usado para lembretes'
+    )
+
     data_cadastro = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Data de Cadastro'
     )
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = 'Cliente'
         verbose_name_plural = 'Clientes'
@@ -319,6 +344,8 @@ class Agendamento(models.Model):
         verbose_name='Confirmado pelo Cliente'
     )
 
+    objects = TenantManager()
+
     class Meta:
         verbose_name = 'Agendamento'
         verbose_name_plural = 'Agendamentos'
@@ -330,4 +357,281 @@ class Agendamento(models.Model):
     def get_data_fim(self):
         """Calcula a data/hora de fim do agendamento baseado na duração do serviço"""
         from datetime import timedelta
-        return self.data_agendamento + timedelta(minutes=self.servico.duracao_minutos)
\ No newline at end of file
+        return self.data_agendamento + timedelta(minutes=self.servico.duracao_minutos)
+
+class LembreteAgendado(models.Model):
+    """
+    Modelo para representar um lembrete de agendamento programado para um horário exato
+    """
+    agendamento = models.ForeignKey(
+        Agendamento,
+        on_delete=models.CASCADE,
+        related_name='lembretes_agendados',
+        verbose_name='Agendamento'
+    )
+
+    antecedencia_minutos = models.PositiveIntegerField(
+        verbose_name='Antecedência (minutos)'
+    )
+
+    enviar_em = models.DateTimeField(
+        verbose_name='Enviar em'
+    )
+
+    enviado_em = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name='Enviado em'
+    )
+
+    class Meta:
+        verbose_name = 'Lembrete Agendado'
+        verbose_name_plural = 'Lembretes Agendados'
+        ordering = ['enviar_em']
+        indexes = [
+            # Consulta do agendador: pendentes (enviado_em nulo) com enviar_em vencido
+            models.Index(fields=['enviado_em', 'enviar_em'], name='lembrete_pendente_idx'),
+        ]
+
+    def __str__(self):
+        return f"Lembrete {self.antecedencia_minutos}min - agendamento {self.agendamento_id}"
+
+class NotificacaoOutbox(models.Model):
+    """
+    Modelo para representar uma notificação pendente de envio (padrão transactional outbox)
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('enviada', 'Enviada'),
+        ('falhou', 'Falhou'),
+    ]
+
+    tipo = models.CharField(
+        max_length=50,
+        verbose_name='Tipo'
+    )
+
+    chave_idempotencia = models.CharField(
+        max_length=200,
+        unique=True,
+        verbose_name='Chave de Idempotência'
+    )
+
+    payload = models.JSONField(
+        default=dict,
+        verbose_name='Dados'
+    )
+
+    # Estabelecimento dono da notificação, inclusive as que não são de um agendamento;
+    # mover_comerciante leva todas para o shard novo por este campo
+    comerciante = models.ForeignKey(
+        Comerciante,
+        on_delete=models.CASCADE,
+        related_name='notificacoes_outbox',
+        blank=True,
+        null=True,
+        verbose_name='Comerciante'
+    )
+
+    agendamento = models.ForeignKey(
+        Agendamento,
+        on_delete=models.CASCADE,
+        related_name='notificacoes_outbox',
+        blank=True,
+        null=True,
+        verbose_name='Agendamento'
+    )
+
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='pendente',
+        verbose_name='Status'
+    )
+
+    tentativas = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Tentativas'
+    )
+
+    proxima_tentativa_em = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Próxima Tentativa em'
+    )
+
+    ultimo_erro = models.TextField(
+        blank=True,
+        verbose_name='Último Erro'
+    )
+
+    data_criacao = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Data de Criação'
+    )
+
+    enviado_em = models.DateTimeField(
+        blank=True,
+        null=True,
+        verbose_name='Enviado em'
+    )
+
+    class Meta:
+        verbose_name = 'Notificação (Outbox)'
+        verbose_name_plural = 'Notificações (Outbox)'
+        ordering = ['data_criacao']
+        indexes = [
+            models.Index(fields=['status', 'proxima_tentativa_em'], name='outbox_pendente_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} - {self.chave_idempotencia} ({self.status})"
+
+class SequenciaNotificacao(models.Model):
+    """
+    Modelo para guardar a última sequência de notificação atribuída a cada usuário
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='sequencia_notificacao',
+        verbose_name='Usuário'
+    )
+
+    ultima = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Última Sequência'
+    )
+
+    class Meta:
+        verbose_name = 'Sequência de Notificação'
+        verbose_name_plural = 'Sequências de Notificação'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.ultima}"
+
+class NotificacaoUsuario(models.Model):
+    """
+    Modelo para representar uma notificação em tempo real já enviada a um usuário,
+    usada para reenviar o que foi perdido enquanto o socket estava desconectado
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notificacoes',
+        verbose_name='Usuário'
+    )
+
+    sequencia = models.PositiveBigIntegerField(
+        verbose_name='Sequência'
+    )
+
+    dados = models.JSONField(
+        verbose_name='Dados'
+    )
+
+    data_criacao = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name='Data de Criação'
+    )
+
+    class Meta:
+        verbose_name = 'Notificação do Usuário'
+        verbose_name_plural = 'Notificações do Usuário'
+        ordering = ['user', 'sequencia']
+        constraints = [
+            # Também serve de índice para a leitura por intervalo no replay
+            models.UniqueConstraint(fields=['user', 'sequencia'], name='notificacao_usuario_sequencia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} #{self.sequencia}"
+
+class PresencaConexao(models.Model):
+    """
+    Modelo para representar um socket de notificações aberto, com o último sinal de vida
+    recebido do cliente. Compartilhado entre os workers ASGI.
+    """
+    canal = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Canal'
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='conexoes',
+        verbose_name='Usuário'
+    )
+
+    # Sem FOREIGN KEY no banco: com shards, o comerciante pode estar em outro banco
+    comerciante = models.ForeignKey(
+        Comerciante,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='conexoes',
+        db_constraint=False,
+        verbose_name='Comerciante'
+    )
+
+    grupos = models.JSONField(
+        default=list,
+        verbose_name='Grupos'
+    )
+
+    processo = models.CharField(
+        max_length=100,
+        verbose_name='Processo'
+    )
+
+    conectado_em = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Conectado em'
+    )
+
+    ultimo_sinal = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Último Sinal'
+    )
+
+    class Meta:
+        verbose_name = 'Conexão Ativa'
+        verbose_name_plural = 'Conexões Ativas'
+        indexes = [
+            models.Index(fields=['user', 'ultimo_sinal'], name='presenca_usuario_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} ({self.canal})"
+
+
+class ShardComerciante(models.Model):
+    """
+    Diretório do modo de shards: banco onde ficam o comerciante e os dados dele.
+    Comerciantes sem registro ficam no banco principal (ver salao_agendamento/shards.py).
+    """
+    comerciante_id = models.PositiveBigIntegerField(
+        unique=True,
+        verbose_name='Comerciante'
+    )
+
+    shard = models.CharField(
+        max_length=50,
+        verbose_name='Shard'
+    )
+
+    atualizado_em = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Atualizado em'
+    )
+
+    class Meta:
+        verbose_name = 'Shard do Comerciante'
+        verbose_name_plural = 'Shards dos Comerciantes'
+
+    def __str__(self):
+        return f"Comerciante {self.comerciante_id} -> {self.shard}"
@@ -1,106 +1,191 @@
-from django.core.mail import send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from django.urls import reverse
 from django.utils import timezone
 import uuid
-from .models import Agendamento
+from .models import Agendamento, LembreteAgendado
+from .canais import Envio, canal_do_cliente, enviar_em_canais, obter_canais
 from datetime import timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+def horarios_lembretes(data_agendamento, agora):
+    """
+    Pares (antecedencia_minutos, enviar_em) dos lembretes de um agendamento nas
+    antecedências configuradas. Antecedências já vencidas viram um único lembrete
+    imediato; agendamentos já passados não têm lembretes.
+    """
+    if data_agendamento <= agora:
+        return []
+
+    antecedencias = sorted(
+        getattr(settings, 'LEMBRETES_ANTECEDENCIAS_MINUTOS', [24 * 60]),
+        reverse=True
+    )
+
+    horarios = []
+    atrasado = None
+    for antecedencia in antecedencias:
+        enviar_em = data_agendamento - timedelta(minutes=antecedencia)
+        if enviar_em > agora:
+            horarios.append((antecedencia, enviar_em))
+        else:
+            atrasado = antecedencia
+
+    if atrasado is not None:
+        horarios.append((atrasado, agora))
+    return horarios
+
 class NotificationService:
     def __init__(self):
         pass
 
     def gerar_token_confirmacao(self, agendamento):
-        """Gera um token único para confirmação/cancelamento"""
+        """Gera um token único para confirmação/cancelamento, reaproveitando o existente"""
+        if agendamento.token_confirmacao:
+            return agendamento.token_confirmacao
         token = str(uuid.uuid4())
         agendamento.token_confirmacao = token
-        agendamento.save()
+        agendamento.save(update_fields=['token_confirmacao'])
         return token
 
-    def enviar_confirmacao_agendamento(self, agendamento):
-        """Envia confirmação de agendamento por email"""
+    def _gerar_links(self, token):
+        """Monta os links absolutos de confirmação e cancelamento para um token"""
+        base_url = getattr(settings, 'BASE_URL', 'http://localhost:5000')
+        confirm_url = f"{base_url}{reverse('agendamento:confirmar_agendamento_token', args=[token])}"
+        cancel_url = f"{base_url}{reverse('agendamento:cancelar_agendamento_token', args=[token])}"
+        return confirm_url, cancel_url
+
+    def enviar_confirmacao_agendamento(self, agendamento, propagar_erros=False):
+        """
+        Envia confirmação de agendamento pelo canal do cliente.
+        Com propagar_erros=True a falha é repassada ao chamador.
+        """
         try:
-            # Gerar token para confirmação/cancelamento
-            token = self.gerar_token_confirmacao(agendamento)
-
-            # Links de confirmação e cancelamento
-            base_url = getattr(settings, 'BASE_URL', 'http://localhost:5000')
-            confirm_url = f"{base_url}{reverse('agendamento:confirmar_agendamento_token', args=[token])}"
-            cancel_url = f"{base_url}{reverse('agendamento:cancelar_agendamento_token', args=[token])}"
-
-            # Enviar email
-            self._enviar_email_confirmacao(agendamento, confirm_url, cancel_url)
+            erro = self.enviar_confirmacoes_em_lote([agendamento]).get(agendamento.id)
+            if erro:
+                raise RuntimeError(erro)
 
             logger.info(f"Notificação de confirmação enviada para agendamento {agendamento.id}")
 
         except Exception as e:
             logger.error(f"Erro ao enviar confirmação para agendamento {agendamento.id}: {str(e)}")
+            if propagar_erros:
+                raise
+
+    def agendar_lembretes(self, agendamento):
+        """
+        (Re)programa os lembretes do agendamento nas antecedências configuradas.
+        Lembretes ainda não enviados são descartados e recriados para o horário atual.
+        """
+        LembreteAgendado.objects.filter(agendamento=agendamento, enviado_em__isnull=True).delete()
+
+        lembretes = [
+            LembreteAgendado(agendamento=agendamento, antecedencia_minutos=antecedencia, enviar_em=enviar_em)
+            for antecedencia, enviar_em in horarios_lembretes(agendamento.data_agendamento, timezone.now())
+        ]
+        return LembreteAgendado.objects.bulk_create(lembretes)
 
     def enviar_lembrete_agendamento(self, agendamento):
         """Envia lembrete do agendamento"""
         try:
-            # Calcular tempo restante
-            tempo_restante = agendamento.data_agendamento - timezone.now()
-            horas_restantes = int(tempo_restante.total_seconds() / 3600)
-
-            # Links de confirmação e cancelamento
-            base_url = getattr(settings, 'BASE_URL', 'http://localhost:5000')
-            confirm_url = f"{base_url}{reverse('agendamento:confirmar_agendamento_token', args=[agendamento.token_confirmacao])}"
-            cancel_url = f"{base_url}{reverse('agendamento:cancelar_agendamento_token', args=[agendamento.token_confirmacao])}"
-
-            # Enviar email de lembrete
-            self._enviar_email_lembrete(agendamento, horas_restantes, confirm_url, cancel_url)
+            if agendamento.id not in self.enviar_lembretes_em_lote([agendamento]):
+                raise RuntimeError('lembrete não enviado')
 
             logger.info(f"Lembrete enviado para agendamento {agendamento.id}")
 
         except Exception as e:
             logger.error(f"Erro ao enviar lembrete para agendamento {agendamento.id}: {str(e)}")
 
-    def _enviar_email_confirmacao(self, agendamento, confirm_url, cancel_url):
-        """Envia email de confirmação de agendamento"""
-        assunto = f"Agendamento Confirmado - {agendamento.comerciante.nome_salao}"
-
-        contexto = {
-            'agendamento': agendamento,
-            'confirm_url': confirm_url,
-            'cancel_url': cancel_url,
-        }
-
-        mensagem_html = render_to_string('notifications/email_confirmacao.html', contexto)
-        mensagem_texto = render_to_string('notifications/email_confirmacao.txt', contexto)
-
-        send_mail(
-            assunto,
-            mensagem_texto,
-            settings.DEFAULT_FROM_EMAIL,
-            [agendamento.cliente.email],
-            html_message=mensagem_html,
-            fail_silently=False,
+    def _renderizar(self, nome, contexto, templates):
+        """Renderiza um template, carregando-o uma única vez por lote"""
+        if nome not in templates:
+            templates[nome] = get_template(nome)
+        return templates[nome].render(contexto)
+
+    def _montar_envio(self, agendamento, tipo, assunto, contexto, templates):
+        """
+        Monta o envio no canal do cliente: por email vão as versões texto e HTML de
+        notifications/email_<tipo>; nos demais canais (SMS, WhatsApp) a versão curta
+        de notifications/sms_<tipo>.txt.
+        """
+        canal = canal_do_cliente(agendamento.cliente)
+        backend = obter_canais().get(canal)
+        destinatario = backend.destinatario(agendamento.cliente) if backend else agendamento.cliente.email
+
+        if canal == 'email':
+            return Envio(
+                agendamento.id, canal, destinatario, assunto,
+                self._renderizar(f'notifications/email_{tipo}.txt', contexto, templates),
+                self._renderizar(f'notifications/email_{tipo}.html', contexto, templates),
+            )
+        return Envio(
+            agendamento.id, canal, destinatario, assunto,
+            self._renderizar(f'notifications/sms_{tipo}.txt', contexto, templates).strip(),
         )
 
-    def _enviar_email_lembrete(self, agendamento, horas_restantes, confirm_url, cancel_url):
-        """Envia email de lembrete de agendamento"""
-        assunto = f"Lembrete: Seu agendamento em {horas_restantes}h - {agendamento.comerciante.nome_salao}"
-
-        contexto = {
-            'agendamento': agendamento,
-            'horas_restantes': horas_restantes,
-            'confirm_url': confirm_url,
-            'cancel_url': cancel_url,
-        }
-
-        mensagem_html = render_to_string('notifications/email_lembrete.html', contexto)
-        mensagem_texto = render_to_string('notifications/email_lembrete.txt', contexto)
-
-        send_mail(
-            assunto,
-            mensagem_texto,
-            settings.DEFAULT_FROM_EMAIL,
-            [agendamento.cliente.email],
-            html_message=mensagem_html,
-            fail_silently=False,
-        )
\ No newline at end of file
+    def enviar_confirmacoes_em_lote(self, agendamentos):
+        """
+        Envia confirmações de vários agendamentos pelos canais dos clientes, cada canal
+        despachado de forma independente. Templates são carregados uma vez e o assunto
+        é montado uma vez por comerciante.
+        Retorna {agendamento_id: mensagem de erro ou None}.
+        """
+        templates = {}
+        assuntos = {}
+        resultados = {}
+        envios = []
+
+        for agendamento in agendamentos:
+            try:
+                assunto = assuntos.get(agendamento.comerciante_id)
+                if assunto is None:
+                    assunto = f"Agendamento Confirmado - {agendamento.comerciante.nome_salao}"
+                    assuntos[agendamento.comerciante_id] = assunto
+
+                token = self.gerar_token_confirmacao(agendamento)
+                confirm_url, cancel_url = self._gerar_links(token)
+                envios.append(self._montar_envio(agendamento, 'confirmacao', assunto, {
+                    'agendamento': agendamento,
+                    'confirm_url': confirm_url,
+                    'cancel_url': cancel_url,
+                }, templates))
+            except Exception as e:
+                logger.error(f"Erro ao montar confirmação para agendamento {agendamento.id}: {str(e)}")
+                resultados[agendamento.id] = str(e)
+
+        resultados.update(enviar_em_canais(envios))
+        return resultados
+
+    def enviar_lembretes_em_lote(self, agendamentos):
+        """
+        Envia lembretes de vários agendamentos pelos canais dos clientes, cada canal
+        despachado de forma independente.
+        Retorna a lista de ids dos agendamentos cujo lembrete foi enviado.
+        """
+        agora = timezone.now()
+        templates = {}
+        envios = []
+
+        for agendamento in agendamentos:
+            try:
+                horas_restantes = int((agendamento.data_agendamento - agora).total_seconds() / 3600)
+                confirm_url, cancel_url = self._gerar_links(agendamento.token_confirmacao)
+                envios.append(self._montar_envio(
+                    agendamento,
+                    'lembrete',
+                    f"Lembrete: Seu agendamento em {horas_restantes}h - {agendamento.comerciante.nome_salao}",
+                    {
+                        'agendamento': agendamento,
+                        'horas_restantes': horas_restantes,
+                        'confirm_url': confirm_url,
+                        'cancel_url': cancel_url,
+                    },
+                    templates,
+                ))
+            except Exception as e:
+                logger.error(f"Erro ao montar lembrete para agendamento {agendamento.id}: {str(e)}")
+
+        resultados = enviar_em_canais(envios)
+        return [agendamento_id for agendamento_id, erro in resultados.items() if erro is None]
@@ -0,0 +1,244 @@
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+from datetime import timedelta
+from .models import Agendamento, NotificacaoOutbox
+from .notifications import NotificationService
+from .consumers import send_notifications_to_groups, grupo_comerciante, registrar_no_historico, usuarios_conectados_para_envio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tempo que um lote fica reservado para um despachante antes de poder ser reprocessado
+TEMPO_RESERVA = timedelta(minutes=5)
+
+# Intervalo entre consultas enquanto um micro-lote é acumulado
+INTERVALO_MICRO_LOTE = 0.02
+
+
+def registrar_notificacao(tipo, chave_idempotencia, payload, agendamento=None, comerciante_id=None):
+    """
+    Grava uma notificação no outbox. Deve ser chamada dentro da mesma transação
+    que altera o agendamento; chaves repetidas são ignoradas. O comerciante, quando
+    não informado, é o do agendamento.
+    """
+    if comerciante_id is None and agendamento is not None:
+        comerciante_id = agendamento.comerciante_id
+    notificacao, criada = NotificacaoOutbox.objects.get_or_create(
+        chave_idempotencia=chave_idempotencia,
+        defaults={
+            'tipo': tipo,
+            'payload': payload,
+            'agendamento': agendamento,
+            'comerciante_id': comerciante_id,
+        }
+    )
+
+    if criada:
+        banco = notificacao._state.db
+        if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+            # Sem worker (tarefas síncronas, broker em memória) nada esvaziaria o outbox:
+            # o despacho acontece logo depois do commit, na própria requisição
+            transaction.on_commit(lambda: _despachar_apos_commit(banco), using=banco)
+        else:
+            # Com um worker real, antecipa o despacho sem esperar o próximo ciclo do beat
+            from .tasks import despachar_notificacoes
+            transaction.on_commit(despachar_notificacoes.delay, using=banco)
+
+    return notificacao
+
+
+def _despachar_apos_commit(banco):
+    """
+    Despacho síncrono do modo eager. As notificações de uma mesma transação saem
+    juntas no primeiro callback; os seguintes encontram o outbox vazio. Falhas ficam
+    no outbox para nova tentativa e não afetam a requisição, já confirmada.
+    """
+    from salao_agendamento.shards import usar_shard
+
+    try:
+        with usar_shard(banco):
+            despachar_pendentes(micro_lote=False)
+    except Exception as e:
+        logger.error(f"Erro ao despachar notificações após o commit: {str(e)}")
+
+
+def registrar_notificacao_tempo_real(user_id, chave_idempotencia, notification_data, agendamento=None):
+    """Grava no outbox uma notificação websocket para um usuário"""
+    return registrar_notificacao(
+        'tempo_real',
+        chave_idempotencia,
+        {'user_id': user_id, 'data': notification_data},
+        agendamento=agendamento,
+    )
+
+
+def registrar_notificacao_comerciante(comerciante_id, chave_idempotencia, notification_data, tipo_usuario=None, agendamento=None):
+    """Grava no outbox uma notificação websocket para a equipe de um estabelecimento (ou de um papel)"""
+    return registrar_notificacao(
+        'tempo_real',
+        chave_idempotencia,
+        {'grupo': grupo_comerciante(comerciante_id, tipo_usuario), 'data': notification_data},
+        agendamento=agendamento,
+        comerciante_id=comerciante_id,
+    )
+
+
+def _aguardar_micro_lote(max_itens, janela_ms):
+    """
+    Durante rajadas, espera até janela_ms para acumular até max_itens notificações
+    antes de reservar o lote. Não espera se a mais antiga já está pendente há mais
+    que a janela, o que limita a latência adicionada a janela_ms.
+    """
+    if janela_ms <= 0:
+        return
+
+    janela = timedelta(milliseconds=janela_ms)
+    limite = time.monotonic() + janela_ms / 1000
+    while True:
+        agora = timezone.now()
+        vencidas = NotificacaoOutbox.objects.filter(status='pendente', proxima_tentativa_em__lte=agora)
+        mais_antiga = vencidas.order_by('data_criacao').values_list('data_criacao', flat=True).first()
+        if mais_antiga is None or agora - mais_antiga >= janela:
+            return
+        if vencidas[:max_itens].count() >= max_itens:
+            return
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            return
+        time.sleep(min(INTERVALO_MICRO_LOTE, restante))
+
+
+def _reservar_lote(tamanho_lote):
+    """Reserva um lote de notificações vencidas, adiando a próxima tentativa pelo tempo de reserva"""
+    agora = timezone.now()
+    # A transação precisa ser no banco do outbox (o shard atual), não no principal
+    with transaction.atomic(using=router.db_for_write(NotificacaoOutbox)):
+        lote = list(
+            NotificacaoOutbox.objects.select_for_update(skip_locked=True).filter(
+                status='pendente',
+                proxima_tentativa_em__lte=agora
+            ).order_by('proxima_tentativa_em')[:tamanho_lote]
+        )
+        if lote:
+            NotificacaoOutbox.objects.filter(pk__in=[n.pk for n in lote]).update(
+                proxima_tentativa_em=agora + TEMPO_RESERVA
+            )
+    return lote
+
+
+def _despachar_email_confirmacao(notificacoes):
+    """Envia os emails de confirmação de agendamento em um único lote"""
+    ids = [n.payload['agendamento_id'] for n in notificacoes]
+    agendamentos = Agendamento.objects.select_related(
+        'comerciante', 'cliente', 'servico', 'funcionario__user'
+    ).in_bulk(ids)
+
+    envios = NotificationService().enviar_confirmacoes_em_lote(list(agendamentos.values()))
+
+    # Agendamento removido: nada a enviar, a notificação é dada como concluída
+    return {
+        n.pk: envios.get(n.payload['agendamento_id'])
+        for n in notificacoes
+    }
+
+
+def _despachar_tempo_real(notificacoes):
+    """Envia as notificações websocket pelo channel layer em um único lote"""
+    # A chave de idempotência acompanha o quadro para o consumer descartar reenvios
+    quadros = [{**n.payload['data'], 'chave': n.chave_idempotencia} for n in notificacoes]
+
+    # Notificações de um usuário vão para o histórico (e ganham 'seq') para reenvio após reconexão
+    indices_usuario = [i for i, n in enumerate(notificacoes) if not n.payload.get('grupo')]
+    registradas = registrar_no_historico([
+        (notificacoes[i].payload['user_id'], quadros[i]) for i in indices_usuario
+    ])
+    for i, (_, quadro) in zip(indices_usuario, registradas):
+        quadros[i] = quadro
+
+    # Usuários sem socket vivo ficam só com o histórico; grupos são sempre enviados
+    conectados = usuarios_conectados_para_envio([user_id for user_id, _ in registradas])
+    envios = [
+        i for i, n in enumerate(notificacoes)
+        if n.payload.get('grupo') or n.payload['user_id'] in conectados
+    ]
+    erros = dict(zip(envios, send_notifications_to_groups([
+        (
+            notificacoes[i].payload.get('grupo') or f"notifications_{notificacoes[i].payload['user_id']}",
+            quadros[i]
+        )
+        for i in envios
+    ])))
+    return {
+        notificacao.pk: str(erros[i]) if erros.get(i) is not None else None
+        for i, notificacao in enumerate(notificacoes)
+    }
+
+
+# Despachantes por tipo: recebem a lista de notificações e retornam {pk: erro ou None}
+DESPACHANTES = {
+    'email_confirmacao': _despachar_email_confirmacao,
+    'tempo_real': _despachar_tempo_real,
+}
+
+
+def despachar_pendentes(micro_lote=True):
+    """
+    Esvazia o outbox em lotes. Falhas são reagendadas com backoff exponencial
+    até o limite de tentativas. Retorna a quantidade de notificações enviadas.
+    Com micro_lote=False não espera a janela de micro-lote (despacho na requisição).
+    """
+    tamanho_lote = getattr(settings, 'OUTBOX_TAMANHO_LOTE', 100)
+    janela_ms = getattr(settings, 'OUTBOX_MICRO_LOTE_JANELA_MS', 0)
+    max_tentativas = getattr(settings, 'OUTBOX_MAX_TENTATIVAS', 5)
+    backoff_segundos = getattr(settings, 'OUTBOX_BACKOFF_SEGUNDOS', 30)
+    total_enviadas = 0
+
+    if micro_lote:
+        _aguardar_micro_lote(tamanho_lote, janela_ms)
+
+    while True:
+        lote = _reservar_lote(tamanho_lote)
+        if not lote:
+            break
+
+        por_tipo = {}
+        for notificacao in lote:
+            por_tipo.setdefault(notificacao.tipo, []).append(notificacao)
+
+        resultados = {}
+        for tipo, notificacoes in por_tipo.items():
+            despachante = DESPACHANTES.get(tipo)
+            if despachante is None:
+                for notificacao in notificacoes:
+                    resultados[notificacao.pk] = f'Tipo de notificação desconhecido: {tipo}'
+                continue
+            resultados.update(despachante(notificacoes))
+
+        agora = timezone.now()
+        enviadas = [pk for pk, erro in resultados.items() if erro is None]
+        if enviadas:
+            NotificacaoOutbox.objects.filter(pk__in=enviadas).update(
+                status='enviada',
+                enviado_em=agora,
+                ultimo_erro=''
+            )
+            total_enviadas += len(enviadas)
+
+        for notificacao in lote:
+            erro = resultados.get(notificacao.pk)
+            if erro is None:
+                continue
+            notificacao.tentativas += 1
+            notificacao.ultimo_erro = erro
+            if notificacao.tentativas >= max_tentativas:
+                notificacao.status = 'falhou'
+                logger.error(f"Notificação {notificacao.chave_idempotencia} descartada após {notificacao.tentativas} tentativas: {erro}")
+            else:
+                notificacao.proxima_tentativa_em = agora + timedelta(
+                    seconds=backoff_segundos * (2 ** (notificacao.tentativas - 1))
+                )
+            notificacao.save(update_fields=['tentativas', 'ultimo_erro', 'status', 'proxima_tentativa_em'])
+
+    return total_enviadas
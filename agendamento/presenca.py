@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from datetime import timedelta
+from .models import PresencaConexao
+import asyncio
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+# Identifica o worker ASGI dono de cada conexão, para dimensionar a frota pelos números reais
+PROCESSO = f'{socket.gethostname()}:{os.getpid()}'
+
+
+def tempo_ocioso():
+    """Tempo sem sinal do cliente depois do qual o socket é considerado morto"""
+    return timedelta(seconds=getattr(settings, 'WEBSOCKET_TIMEOUT_OCIOSO_SEGUNDOS', 75))
+
+
+def registrar_conexao(canal, user_id, comerciante_id, grupos):
+    """Registra um socket de notificações recém-aberto"""
+    PresencaConexao.objects.update_or_create(
+        canal=canal,
+        defaults={
+            'user_id': user_id,
+            'comerciante_id': comerciante_id,
+            'grupos': grupos,
+            'processo': PROCESSO,
+            'ultimo_sinal': timezone.now(),
+        }
+    )
+
+
+def atualizar_sinal(canal, quando):
+    """Grava o último sinal de vida recebido do cliente"""
+    PresencaConexao.objects.filter(canal=canal).update(ultimo_sinal=quando)
+
+
+def remover_conexao(canal):
+    PresencaConexao.objects.filter(canal=canal).delete()
+
+
+def usuarios_conectados(user_ids):
+    """Dos usuários informados, os que têm ao menos um socket vivo"""
+    if not user_ids:
+        return set()
+    return set(
+        PresencaConexao.objects.filter(
+            user_id__in=set(user_ids),
+            ultimo_sinal__gte=timezone.now() - tempo_ocioso()
+        ).values_list('user_id', flat=True).distinct()
+    )
+
+
+def limpar_conexoes_expiradas():
+    """
+    Remove os registros de sockets sem sinal além do tempo ocioso (ex.: worker que caiu
+    sem fechar as conexões) e tira os canais deles dos grupos. Retorna quantos removeu.
+    """
+    expiradas = list(
+        PresencaConexao.objects.filter(
+            ultimo_sinal__lt=timezone.now() - tempo_ocioso()
+        ).values_list('pk', 'canal', 'grupos')
+    )
+    if not expiradas:
+        return 0
+
+    channel_layer = get_channel_layer()
+
+    async def _descartar():
+        await asyncio.gather(*(
+            channel_layer.group_discard(grupo, canal)
+            for _, canal, grupos in expiradas
+            for grupo in grupos
+        ), return_exceptions=True)
+
+    async_to_sync(_descartar)()
+    PresencaConexao.objects.filter(pk__in=[pk for pk, _, _ in expiradas]).delete()
+    logger.info(f"Removidas {len(expiradas)} conexões sem sinal")
+    return len(expiradas)
+
+
+def metricas_presenca():
+    """Conexões vivas no total, por worker e por estabelecimento (com o último sinal)"""
+    vivas = PresencaConexao.objects.filter(ultimo_sinal__gte=timezone.now() - tempo_ocioso())
+    return {
+        'conexoes': vivas.count(),
+        'usuarios': vivas.values('user_id').distinct().count(),
+        'por_processo': {
+            item['processo']: item['total']
+            for item in vivas.values('processo').annotate(total=Count('id')).order_by('processo')
+        },
+        'por_comerciante': [
+            {
+                'comerciante_id': item['comerciante_id'],
+                'conexoes': item['total'],
+                'usuarios': item['usuarios'],
+                'ultimo_sinal': item['ultimo'].isoformat(),
+            }
+            for item in vivas.exclude(comerciante__isnull=True).values('comerciante_id').annotate(
+                total=Count('id'),
+                usuarios=Count('user_id', distinct=True),
+                ultimo=Max('ultimo_sinal'),
+            ).order_by('comerciante_id')
+        ],
+    }
@@ -4,4 +4,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
+    re_path(r'ws/disponibilidade/(?P<comerciante_id>\d+)/(?P<funcionario_id>\d+)/(?P<data>\d{4}-\d{2}-\d{2})/$',
+            consumers.DisponibilidadeConsumer.as_asgi()),
 ]
@@ -0,0 +1,175 @@
+"""
+Apoio aos testes de orçamento de consultas (agendamento/tests.py e comerciante_panel/tests.py):
+estabelecimento de teste, volume de dados e a classe base que mede as consultas.
+"""
+import math
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import User
+from .models import Agendamento, Cliente, Comerciante, Funcionario, LembreteAgendado, Servico
+
+UM = 1
+PEQUENO = 10
+GRANDE = 1000
+
+
+def criar_estabelecimento():
+    """Estabelecimento com dono, um serviço e um funcionário fixo (usado para login)"""
+    dono = User.objects.create_user(username='dono', password='senha', tipo_usuario='comerciante')
+    comerciante = Comerciante.objects.create(
+        user=dono, nome_salao='Salão Teste', endereco='Rua A', telefone_comercial='11999999999',
+        horario_funcionamento='08:00-18:00'
+    )
+    servico = Servico.objects.create(comerciante=comerciante, nome='Corte', preco=50, duracao_minutos=30)
+    usuario = User.objects.create_user(
+        username='funcionario', password='senha', tipo_usuario='funcionario', first_name='Ana'
+    )
+    funcionario = Funcionario.objects.create(
+        user=usuario, comerciante=comerciante, especialidades='Corte', horario_trabalho='08:00-18:00'
+    )
+    servico.funcionarios.add(funcionario)
+    return comerciante, servico, funcionario
+
+
+def acrescentar_dados(comerciante, servico, funcionario, quantidade):
+    """
+    Acrescenta `quantidade` funcionários e clientes ao estabelecimento, em bulk_create, e
+    para cada cliente um agendamento (com lembrete) em cada período: o passado (varredura
+    de não comparecimento), as próximas 24 horas (lembretes, dashboards) e a manhã de
+    depois de amanhã (verificação de conflito ao criar agendamento). Assim já com
+    quantidade=1 todos os períodos, e os dois funcionários, têm agendamentos.
+    """
+    inicio = User.objects.count()
+    usuarios = User.objects.bulk_create([
+        User(username=f'extra_{inicio + i}', first_name='Extra', tipo_usuario='funcionario', password='!')
+        for i in range(quantidade)
+    ])
+    funcionarios = Funcionario.objects.bulk_create([
+        Funcionario(user=usuario, comerciante=comerciante, especialidades='-', horario_trabalho='-')
+        for usuario in usuarios
+    ])
+    servico.funcionarios.add(*funcionarios)
+    clientes = Cliente.objects.bulk_create([
+        Cliente(comerciante=comerciante, nome=f'Cliente {inicio + i}', email=f'c{inicio + i}@teste.com', telefone='1')
+        for i in range(quantidade)
+    ])
+
+    agora = timezone.now()
+    depois_de_amanha = timezone.make_aware(
+        timezone.datetime.combine(timezone.localdate() + timedelta(days=2), timezone.datetime.min.time())
+    ) + timedelta(hours=6)
+    datas = (agora - timedelta(hours=3), agora + timedelta(hours=3), agora + timedelta(hours=20), depois_de_amanha)
+    agendamentos = Agendamento.objects.bulk_create([
+        Agendamento(
+            comerciante=comerciante,
+            cliente=cliente,
+            funcionario=funcionario if (i + j) % 2 else funcionarios[i],
+            servico=servico,
+            data_agendamento=data + timedelta(seconds=i),
+            token_confirmacao=f'token-{inicio + i}-{j}',
+        )
+        for i, cliente in enumerate(clientes)
+        for j, data in enumerate(datas)
+    ])
+    LembreteAgendado.objects.bulk_create([
+        LembreteAgendado(agendamento=agendamento, antecedencia_minutos=60, enviar_em=agora - timedelta(minutes=1))
+        for agendamento in agendamentos
+    ])
+
+
+class OrcamentoConsultasTestCase(TestCase):
+    """
+    Base dos testes de orçamento de consultas: cada chamada é medida com UM registro de
+    cada tipo e depois com PEQUENO e GRANDE registros. O número de consultas não pode
+    passar do orçamento e precisa ser o mesmo nos três volumes (qualquer N+1 quebra o
+    teste); abaixo do orçamento o teste passa, então o orçamento é um teto.
+    """
+
+    def setUp(self):
+        self.comerciante, self.servico, self.funcionario = criar_estabelecimento()
+        acrescentar_dados(self.comerciante, self.servico, self.funcionario, UM)
+
+    def medir_consultas(self, chamada):
+        cache.clear()
+        registro = RegistroConsultas()
+        with connection.execute_wrapper(registro):
+            chamada()
+        return _agrupar_lotes(registro.consultas)
+
+    def assertOrcamentoConsultas(self, orcamento, chamada):
+        medidas = {UM: self.medir_consultas(chamada)}
+        for volume in (PEQUENO, GRANDE):
+            acrescentar_dados(self.comerciante, self.servico, self.funcionario, volume - max(medidas))
+            medidas[volume] = self.medir_consultas(chamada)
+
+        um = medidas[UM]
+        self.assertLessEqual(
+            len(um), orcamento,
+            f'{len(um)} consultas, orçamento de {orcamento}:\n' + _listar(um)
+        )
+        for volume in (PEQUENO, GRANDE):
+            self.assertEqual(
+                len(medidas[volume]), len(um),
+                f'Consultas crescem com os dados ({len(um)} com {UM}, {len(medidas[volume])} com {volume}):\n'
+                + _listar(medidas[volume])
+            )
+
+    def assertStatus(self, resposta, status=200):
+        self.assertEqual(resposta.status_code, status, resposta.content[:500])
+
+
+class RegistroConsultas:
+    """execute_wrapper que guarda o SQL e os parâmetros de cada consulta"""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas.append((sql, params, many))
+        return execute(sql, params, many, context)
+
+
+def _agrupar_lotes(consultas):
+    """
+    SQL das consultas. INSERTs consecutivos na mesma tabela contam uma vez só quando são
+    os lotes de um único bulk_create, ou seja, ceil(linhas / tamanho do lote) INSERTs (o
+    lote é limitado pelos parâmetros do banco, 999 no SQLite). Um .create() por linha
+    continua contando cada INSERT.
+    """
+    sqls = []
+    sequencia = []
+
+    def fechar_sequencia():
+        if not sequencia:
+            return
+        linhas = sum(quantidade for _, quantidade, _ in sequencia)
+        lote = connection.ops.bulk_batch_size(sequencia[0][2], range(linhas))
+        if len(sequencia) == math.ceil(linhas / lote):
+            sqls.append(sequencia[0][0])
+        else:
+            sqls.extend(sql for sql, _, _ in sequencia)
+        sequencia.clear()
+
+    for sql, params, many in consultas:
+        if not sql.startswith('INSERT') or ') VALUES' not in sql:
+            fechar_sequencia()
+            sqls.append(sql)
+            continue
+        colunas = sql[sql.index('(') + 1:sql.index(') VALUES')].split(', ')
+        quantidade = len(params) if many else len(params) // len(colunas)
+        if sequencia and sequencia[0][0].split(' (')[0] != sql.split(' (')[0]:
+            fechar_sequencia()
+        sequencia.append((sql, quantidade, colunas))
+    fechar_sequencia()
+    return sqls
+
+
+def _listar(sqls):
+    return '\n'.join(sql[:200] for sql in sqls)
+
+
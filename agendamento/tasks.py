@@ -1,10 +1,14 @@
 
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
-from .models import Agendamento
+from .models import Agendamento, LembreteAgendado, NotificacaoUsuario
 from .notifications import NotificationService
-from .consumers import send_notification_to_user
+from .consumers import send_notification_to_user, AgregadorNotificacoes
+from .calendario import notificacoes_evento_calendario
+from . import presenca
+from salao_agendamento.shards import para_cada_shard, primeiro_nos_shards
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,7 +17,9 @@ logger = logging.getLogger(__name__)
 def enviar_confirmacao_agendamento(agendamento_id):
     """Task para enviar confirmação de agendamento"""
     try:
-        agendamento = Agendamento.objects.get(id=agendamento_id)
+        agendamento = primeiro_nos_shards(lambda: Agendamento.objects.filter(id=agendamento_id).first())
+        if agendamento is None:
+            raise Agendamento.DoesNotExist
         notification_service = NotificationService()
         notification_service.enviar_confirmacao_agendamento(agendamento)
         
@@ -36,6 +42,38 @@ def enviar_confirmacao_agendamento(agendamento_id):
         logger.error(f"Erro ao enviar confirmação para agendamento {agendamento_id}: {str(e)}")
 
 @shared_task
+@para_cada_shard
+def despachar_notificacoes():
+    """Task para esvaziar o outbox de notificações"""
+    try:
+        from .outbox import despachar_pendentes
+        total_enviadas = despachar_pendentes()
+        if total_enviadas:
+            logger.info(f"Despachadas {total_enviadas} notificações do outbox")
+    except Exception as e:
+        logger.error(f"Erro ao despachar notificações do outbox: {str(e)}")
+
+@shared_task
+def limpar_historico_notificacoes():
+    """Task para remover do histórico as notificações mais antigas que a retenção"""
+    try:
+        dias = getattr(settings, 'NOTIFICACOES_RETENCAO_DIAS', 7)
+        limite = timezone.now() - timedelta(days=dias)
+        removidas, _ = NotificacaoUsuario.objects.filter(data_criacao__lt=limite).delete()
+        logger.info(f"Removidas {removidas} notificações do histórico")
+    except Exception as e:
+        logger.error(f"Erro ao limpar histórico de notificações: {str(e)}")
+
+@shared_task
+def limpar_conexoes_expiradas():
+    """Task para remover a presença e os grupos de sockets que pararam de dar sinal"""
+    try:
+        presenca.limpar_conexoes_expiradas()
+    except Exception as e:
+        logger.error(f"Erro ao limpar conexões expiradas: {str(e)}")
+
+@shared_task
+@para_cada_shard
 def verificar_agendamentos_perdidos():
     """Task para verificar agendamentos que não foram comparecidos"""
     try:
@@ -43,65 +81,162 @@ def verificar_agendamentos_perdidos():
         agora = timezone.now()
         limite_passado = agora - timedelta(hours=1)  # 1 hora de tolerância
         
-        agendamentos_perdidos = Agendamento.objects.filter(
+        agendamentos_perdidos = list(Agendamento.objects.filter(
             data_agendamento__lt=limite_passado,
             status__in=['agendado', 'confirmado']
-        )
+        ).select_related('comerciante__user', 'cliente', 'servico', 'funcionario__user'))
         
-        for agendamento in agendamentos_perdidos:
-            agendamento.status = 'nao_compareceu'
-            agendamento.save()
-            
-            # Notificar comerciante
-            send_notification_to_user(
-                agendamento.comerciante.user.id,
-                {
-                    'type': 'cliente_nao_compareceu',
-                    'message': f'Cliente não compareceu: {agendamento.cliente.nome}',
-                    'agendamento_id': agendamento.id
-                }
-            )
+        # Um único UPDATE para todos; data_atualizacao (auto_now) é preenchida explicitamente
+        Agendamento.objects.filter(
+            pk__in=[agendamento.pk for agendamento in agendamentos_perdidos],
+            status__in=['agendado', 'confirmado']
+        ).update(status='nao_compareceu', data_atualizacao=agora)
         
-        logger.info(f"Marcados {agendamentos_perdidos.count()} agendamentos como não compareceu")
+        # Notificações agrupadas: um quadro por comerciante ao final, não um por agendamento
+        with AgregadorNotificacoes() as agregador:
+            for agendamento in agendamentos_perdidos:
+                agendamento.status = 'nao_compareceu'
+                agendamento.data_atualizacao = agora
+                
+                # Notificar comerciante
+                agregador.adicionar(
+                    agendamento.comerciante.user.id,
+                    {
+                        'type': 'cliente_nao_compareceu',
+                        'message': f'Cliente não compareceu: {agendamento.cliente.nome}',
+                        'agendamento_id': agendamento.id
+                    }
+                )
+
+                # Atualizar o evento nos calendários abertos
+                for user_id, notificacao in notificacoes_evento_calendario(agendamento):
+                    agregador.adicionar(user_id, notificacao)
+        
+        logger.info(f"Marcados {len(agendamentos_perdidos)} agendamentos como não compareceu")
         
     except Exception as e:
         logger.error(f"Erro ao verificar agendamentos perdidos: {str(e)}")
 
 @shared_task
+@para_cada_shard
 def enviar_lembretes_agendamentos():
-    """Task para enviar lembretes de agendamentos"""
+    """Task para enviar lembretes de agendamentos em lotes"""
     try:
         # Buscar agendamentos nas próximas 24 horas
         agora = timezone.now()
         limite_lembrete = agora + timedelta(hours=24)
-        
+        tamanho_lote = getattr(settings, 'LEMBRETES_TAMANHO_LOTE', 200)
+
         agendamentos = Agendamento.objects.filter(
             data_agendamento__gte=agora,
             data_agendamento__lte=limite_lembrete,
             status__in=['agendado', 'confirmado'],
             lembrete_enviado=False
-        )
-        
+        ).select_related(
+            'comerciante', 'cliente', 'servico', 'funcionario__user'
+        ).order_by('pk')
+
         notification_service = NotificationService()
-        
-        for agendamento in agendamentos:
-            notification_service.enviar_lembrete_agendamento(agendamento)
-            
-            # Marcar lembrete como enviado
-            agendamento.lembrete_enviado = True
-            agendamento.save()
-            
+        total_enviados = 0
+        ultimo_id = 0
+
+        # Paginação por chave para não reprocessar agendamentos cujo envio falhou
+        while True:
+            lote = list(agendamentos.filter(pk__gt=ultimo_id)[:tamanho_lote])
+            if not lote:
+                break
+            ultimo_id = lote[-1].pk
+
+            enviados = set(notification_service.enviar_lembretes_em_lote(lote))
+            if not enviados:
+                continue
+
+            # Marcar lembretes como enviados com um único UPDATE
+            Agendamento.objects.filter(pk__in=enviados).update(lembrete_enviado=True)
+            total_enviados += len(enviados)
+
             # Enviar notificação em tempo real
-            send_notification_to_user(
-                agendamento.funcionario.user.id,
-                {
-                    'type': 'lembrete_agendamento',
-                    'message': f'Agendamento em breve: {agendamento.cliente.nome}',
-                    'agendamento_id': agendamento.id
-                }
-            )
-        
-        logger.info(f"Lembretes enviados para {agendamentos.count()} agendamentos")
-        
+            _notificar_lembretes([a for a in lote if a.id in enviados])
+
+        logger.info(f"Lembretes enviados para {total_enviados} agendamentos")
+
     except Exception as e:
         logger.error(f"Erro ao enviar lembretes: {str(e)}")
+
+@shared_task
+@para_cada_shard
+def processar_lembretes_pendentes():
+    """Task executada a cada minuto para enviar os lembretes programados que venceram"""
+    try:
+        agora = timezone.now()
+        tamanho_lote = getattr(settings, 'LEMBRETES_TAMANHO_LOTE', 200)
+
+        pendentes = LembreteAgendado.objects.filter(
+            enviado_em__isnull=True,
+            enviar_em__lte=agora
+        ).select_related(
+            'agendamento__comerciante', 'agendamento__cliente',
+            'agendamento__servico', 'agendamento__funcionario__user'
+        ).order_by('pk')
+
+        notification_service = NotificationService()
+        total_enviados = 0
+        ultimo_id = 0
+
+        while True:
+            lote = list(pendentes.filter(pk__gt=ultimo_id)[:tamanho_lote])
+            if not lote:
+                break
+            ultimo_id = lote[-1].pk
+
+            # Lembretes de agendamentos cancelados, concluídos ou já passados são descartados
+            descartados = {
+                l.pk for l in lote
+                if l.agendamento.status not in ('agendado', 'confirmado')
+                or l.agendamento.data_agendamento <= agora
+            }
+            if descartados:
+                LembreteAgendado.objects.filter(pk__in=descartados).delete()
+
+            # Vários lembretes vencidos do mesmo agendamento geram um único envio
+            por_agendamento = {}
+            for lembrete in lote:
+                if lembrete.pk not in descartados:
+                    por_agendamento.setdefault(lembrete.agendamento_id, []).append(lembrete)
+            if not por_agendamento:
+                continue
+
+            agendamentos = [lembretes[0].agendamento for lembretes in por_agendamento.values()]
+            enviados = set(notification_service.enviar_lembretes_em_lote(agendamentos))
+            if not enviados:
+                continue
+
+            LembreteAgendado.objects.filter(
+                pk__in=[l.pk for agendamento_id in enviados for l in por_agendamento[agendamento_id]]
+            ).update(enviado_em=agora)
+            Agendamento.objects.filter(pk__in=enviados).update(lembrete_enviado=True)
+            total_enviados += len(enviados)
+
+            _notificar_lembretes([a for a in agendamentos if a.id in enviados])
+
+        if total_enviados:
+            logger.info(f"Lembretes programados enviados para {total_enviados} agendamentos")
+
+    except Exception as e:
+        logger.error(f"Erro ao processar lembretes programados: {str(e)}")
+
+def _notificar_lembretes(agendamentos):
+    """Envia a notificação em tempo real de lembrete, agrupada por funcionário"""
+    try:
+        with AgregadorNotificacoes() as agregador:
+            for agendamento in agendamentos:
+                agregador.adicionar(
+                    agendamento.funcionario.user.id,
+                    {
+                        'type': 'lembrete_agendamento',
+                        'message': f'Agendamento em breve: {agendamento.cliente.nome}',
+                        'agendamento_id': agendamento.id
+                    }
+                )
+    except Exception as notification_error:
+        logger.warning(f"Erro ao enviar notificação em tempo real: {str(notification_error)}")
@@ -1,3 +1,660 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import json
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.apps import apps
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+
+from .canais import Envio, enviar_em_canais, obter_canais
+from .consumers import (
+    grupo_comerciante, ip_do_cliente, registrar_no_historico, send_notifications_batch, send_notifications_to_groups,
+    usuarios_conectados_para_envio,
+)
+from .models import Agendamento, Cliente, LembreteAgendado, NotificacaoOutbox, NotificacaoUsuario, PresencaConexao
+from .notifications import NotificationService
+from .outbox import registrar_notificacao_comerciante
+from .suporte_testes import GRANDE, PEQUENO, OrcamentoConsultasTestCase, criar_estabelecimento
+from .routing import websocket_urlpatterns
+from . import tasks, views
+
+
+CANAIS_FAKE = {
+    'email': {'BACKEND': 'agendamento.canais.CanalFake', 'MAX_CONCORRENCIA': 1, 'OPCOES': {'atraso': 0.1}},
+    'sms': {'BACKEND': 'agendamento.canais.CanalFake', 'MAX_CONCORRENCIA': 1, 'OPCOES': {'campo': 'telefone', 'atraso': 0.1}},
+}
+
+
+class CriarAgendamentoTests(TestCase):
+    """Fluxo público de reserva com a configuração padrão (tarefas Celery síncronas)"""
+
+    def setUp(self):
+        self.comerciante, self.servico, self.funcionario = criar_estabelecimento()
+        self.data = (timezone.localdate() + timedelta(days=2)).isoformat()
+
+    def reservar(self, horario, nome, canal=''):
+        return self.client.post(
+            f'/agendamento/api/{self.comerciante.id}/criar/',
+            json.dumps({
+                'servico_id': self.servico.id,
+                'funcionario_id': self.funcionario.id,
+                'data': self.data,
+                'horario': horario,
+                'cliente_nome': nome,
+                'cliente_email': f'{nome}@teste.com',
+                'cliente_telefone': f'11-{nome}',
+                'canal_preferido': canal,
+            }),
+            content_type='application/json'
+        )
+
+    def test_confirmacao_enviada_apos_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.reservar('09:00', 'maria')
+
+        self.assertEqual(resposta.status_code, 200, resposta.content)
+        self.assertEqual([email.to for email in mail.outbox], [['maria@teste.com']])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(NotificacaoOutbox.objects.filter(status='pendente').exists())
+
+    def test_horario_ocupado_e_recusado(self):
+        self.assertEqual(self.reservar('09:00', 'maria').status_code, 200)
+        resposta = self.reservar('09:15', 'joana')
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('não está mais disponível', resposta.json()['error'])
+        self.assertEqual(Agendamento.objects.count(), 1)
+
+    def test_formulario_oferece_apenas_canais_configurados(self):
+        resposta = self.client.get(f'/agendamento/{self.comerciante.id}/')
+        self.assertContains(resposta, 'value="email"')
+        self.assertNotContains(resposta, 'value="sms"')
+        self.assertNotContains(resposta, 'value="whatsapp"')
+
+        self.assertEqual(self.reservar('09:00', 'maria', canal='sms').status_code, 200)
+        self.assertEqual(Cliente.objects.get().canal_preferido, 'email')
+
+    @override_settings(NOTIFICACAO_CANAIS=CANAIS_FAKE)
+    def test_confirmacao_pelo_canal_preferido(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.reservar('09:00', 'maria', canal='sms').status_code, 200)
+
+        canais = obter_canais()
+        self.assertEqual([envio[0] for envio in canais['sms'].enviados], ['11-maria'])
+        self.assertIn('Agendamento confirmado', canais['sms'].enviados[0][2])
+        self.assertEqual(canais['email'].enviados, [])
+
+
+class CanaisNotificacaoTests(TestCase):
+    """Cada canal é despachado de forma independente, com a própria concorrência"""
+
+    @override_settings(NOTIFICACAO_CANAIS=CANAIS_FAKE)
+    def test_canais_despachados_em_paralelo(self):
+        envios = [
+            Envio(f'{canal}-{i}', canal, 'destino', 'assunto', 'mensagem')
+            for i in range(3) for canal in ('email', 'sms')
+        ]
+
+        inicio = time.monotonic()
+        resultados = enviar_em_canais(envios)
+        duracao = time.monotonic() - inicio
+
+        self.assertEqual(resultados, {envio.chave: None for envio in envios})
+        # Cada canal envia 3 mensagens em série (0,3s); em série os dois canais levariam 0,6s
+        self.assertLess(duracao, 0.5)
+        self.assertEqual(len(obter_canais()['sms'].enviados), 3)
+
+
+@override_settings(LEMBRETES_ANTECEDENCIAS_MINUTOS=[24 * 60, 2 * 60])
+class LembretesTests(TestCase):
+    """Lembretes programados por agendamento nas antecedências configuradas"""
+
+    def setUp(self):
+        self.comerciante, self.servico, self.funcionario = criar_estabelecimento()
+        self.cliente = Cliente.objects.create(
+            comerciante=self.comerciante, nome='Maria', email='maria@teste.com', telefone='1'
+        )
+
+    def agendar(self, daqui):
+        return Agendamento.objects.create(
+            comerciante=self.comerciante, cliente=self.cliente, funcionario=self.funcionario,
+            servico=self.servico, data_agendamento=timezone.now() + daqui, token_confirmacao='token',
+        )
+
+    def programados(self, agendamento):
+        return list(agendamento.lembretes_agendados.order_by('enviar_em').values_list(
+            'antecedencia_minutos', 'enviar_em', 'enviado_em'
+        ))
+
+    def test_um_lembrete_por_antecedencia(self):
+        agendamento = self.agendar(timedelta(days=3))
+        NotificationService().agendar_lembretes(agendamento)
+
+        self.assertEqual(self.programados(agendamento), [
+            (24 * 60, agendamento.data_agendamento - timedelta(days=1), None),
+            (2 * 60, agendamento.data_agendamento - timedelta(hours=2), None),
+        ])
+
+    @override_settings(LEMBRETES_ANTECEDENCIAS_MINUTOS=[24 * 60, 2 * 60, 30])
+    def test_antecedencias_vencidas_viram_um_lembrete_imediato(self):
+        agendamento = self.agendar(timedelta(hours=1))
+        antes = timezone.now()
+        NotificationService().agendar_lembretes(agendamento)
+
+        (imediato, enviar_em, _), trinta_minutos = self.programados(agendamento)
+        self.assertEqual(imediato, 2 * 60)
+        self.assertTrue(antes <= enviar_em <= timezone.now())
+        self.assertEqual(trinta_minutos, (30, agendamento.data_agendamento - timedelta(minutes=30), None))
+
+    def test_remarcacao_descarta_pendentes_e_mantem_enviados(self):
+        agendamento = self.agendar(timedelta(days=3))
+        NotificationService().agendar_lembretes(agendamento)
+        enviado = agendamento.lembretes_agendados.get(antecedencia_minutos=24 * 60)
+        enviado.enviado_em = timezone.now()
+        enviado.save()
+
+        agendamento.data_agendamento += timedelta(days=2)
+        agendamento.save()
+        NotificationService().agendar_lembretes(agendamento)
+
+        self.assertEqual(self.programados(agendamento), [
+            (24 * 60, enviado.enviar_em, enviado.enviado_em),
+            (24 * 60, agendamento.data_agendamento - timedelta(days=1), None),
+            (2 * 60, agendamento.data_agendamento - timedelta(hours=2), None),
+        ])
+
+    def test_processar_lembretes_envia_uma_vez(self):
+        agendamento = self.agendar(timedelta(hours=1))
+        # Dois lembretes vencidos do mesmo agendamento e um ainda no futuro
+        LembreteAgendado.objects.bulk_create([
+            LembreteAgendado(agendamento=agendamento, antecedencia_minutos=antecedencia, enviar_em=enviar_em)
+            for antecedencia, enviar_em in (
+                (24 * 60, timezone.now() - timedelta(hours=23)),
+                (2 * 60, timezone.now() - timedelta(hours=1)),
+                (30, timezone.now() + timedelta(minutes=30)),
+            )
+        ])
+
+        tasks.processar_lembretes_pendentes()
+        tasks.processar_lembretes_pendentes()
+
+        self.assertEqual([email.to for email in mail.outbox], [['maria@teste.com']])
+        enviados = dict(agendamento.lembretes_agendados.values_list('antecedencia_minutos', 'enviado_em'))
+        self.assertIsNotNone(enviados[24 * 60])
+        self.assertIsNotNone(enviados[2 * 60])
+        self.assertIsNone(enviados[30])
+        agendamento.refresh_from_db()
+        self.assertTrue(agendamento.lembrete_enviado)
+
+    def test_migracao_programa_agendamentos_existentes(self):
+        migracao = importlib.import_module('agendamento.migrations.0011_programar_lembretes_existentes')
+        futuro = self.agendar(timedelta(days=3))
+        passado = self.agendar(-timedelta(days=1))
+        cancelado = self.agendar(timedelta(days=3))
+        cancelado.status = 'cancelado'
+        cancelado.save()
+        ja_programado = self.agendar(timedelta(days=3))
+        NotificationService().agendar_lembretes(ja_programado)
+
+        migracao.programar_lembretes(apps, mock.Mock(connection=connection))
+
+        self.assertEqual([antecedencia for antecedencia, _, _ in self.programados(futuro)], [24 * 60, 2 * 60])
+        self.assertEqual(self.programados(passado), [])
+        self.assertEqual(self.programados(cancelado), [])
+        self.assertEqual(len(self.programados(ja_programado)), 2)
+
+
+class ContagemLotesTests(OrcamentoConsultasTestCase):
+    """Os lotes de um bulk_create contam uma vez; um .create() por linha conta cada INSERT"""
+
+    def novos_clientes(self, quantidade):
+        return [
+            Cliente(comerciante=self.comerciante, nome=f'Lote {i}', email=f'lote{i}@teste.com', telefone='1')
+            for i in range(quantidade)
+        ]
+
+    def test_bulk_create_em_varios_lotes_conta_uma_consulta(self):
+        sqls = self.medir_consultas(lambda: Cliente.objects.bulk_create(self.novos_clientes(GRANDE)))
+        self.assertEqual(len(sqls), 1)
+
+    def test_create_por_linha_conta_cada_insert(self):
+        sqls = self.medir_consultas(lambda: [cliente.save() for cliente in self.novos_clientes(PEQUENO)])
+        self.assertEqual(len(sqls), PEQUENO)
+
+
+class OrcamentoConsultasPublicoTests(OrcamentoConsultasTestCase):
+    """APIs e páginas públicas de agendamento"""
+
+    def test_pagina_agendamento(self):
+        self.assertOrcamentoConsultas(2, lambda: self.assertStatus(
+            self.client.get(f'/agendamento/{self.comerciante.id}/')
+        ))
+
+    def test_funcionarios_servico(self):
+        self.assertOrcamentoConsultas(3, lambda: self.assertStatus(
+            self.client.get(f'/agendamento/api/{self.comerciante.id}/funcionarios/{self.servico.id}/')
+        ))
+
+    def test_funcionarios_por_servico(self):
+        # View sem rota própria no momento; chamada diretamente
+        requisicao = RequestFactory().get('/')
+        self.assertOrcamentoConsultas(3, lambda: self.assertStatus(
+            views.get_funcionarios_por_servico(requisicao, self.comerciante.id, self.servico.id)
+        ))
+
+    def test_horarios_disponiveis(self):
+        amanha = (timezone.localdate() + timedelta(days=1)).isoformat()
+        self.assertOrcamentoConsultas(3, lambda: self.assertStatus(
+            self.client.get(f'/agendamento/api/{self.comerciante.id}/horarios/{self.funcionario.id}/?data={amanha}')
+        ))
+
+    def test_criar_agendamento(self):
+        data = timezone.localdate() + timedelta(days=2)
+        # Cliente novo a cada chamada, para que as duas medições façam o mesmo caminho
+        chamadas = iter([('09:00', 'maria'), ('10:00', 'joana'), ('11:00', 'paula')])
+
+        def criar():
+            horario, nome = next(chamadas)
+            resposta = self.client.post(
+                f'/agendamento/api/{self.comerciante.id}/criar/',
+                json.dumps({
+                    'servico_id': self.servico.id,
+                    'funcionario_id': self.funcionario.id,
+                    'data': data.isoformat(),
+                    'horario': horario,
+                    'cliente_nome': nome,
+                    'cliente_email': f'{nome}@teste.com',
+                    'cliente_telefone': f'11-{nome}',
+                }),
+                content_type='application/json'
+            )
+            self.assertStatus(resposta)
+
+        self.assertOrcamentoConsultas(31, criar)
+
+
+class OrcamentoConsultasTarefasTests(OrcamentoConsultasTestCase):
+    """Tarefas periódicas: o orçamento vale por lote, então o lote cobre todos os registros"""
+
+    def test_verificar_agendamentos_perdidos(self):
+        self.assertOrcamentoConsultas(9, tasks.verificar_agendamentos_perdidos)
+
+    @override_settings(LEMBRETES_TAMANHO_LOTE=GRANDE * 10)
+    def test_enviar_lembretes_agendamentos(self):
+        self.assertOrcamentoConsultas(10, tasks.enviar_lembretes_agendamentos)
+
+    @override_settings(LEMBRETES_TAMANHO_LOTE=GRANDE * 10)
+    def test_processar_lembretes_pendentes(self):
+        self.assertOrcamentoConsultas(12, tasks.processar_lembretes_pendentes)
+
+
+@override_settings(DISPONIBILIDADE_MAX_CONEXOES_POR_IP=1, PROXIES_CONFIAVEIS=['10.0.0.1'])
+class DisponibilidadeConsumerTests(TransactionTestCase):
+    """Limite de sockets anônimos por IP, contado no cache compartilhado entre os workers"""
+
+    def setUp(self):
+        cache.clear()
+        self.comerciante, self.servico, self.funcionario = criar_estabelecimento()
+        self.aplicacao = URLRouter(websocket_urlpatterns)
+
+    def socket(self, ip, encaminhado=None, funcionario_id=None):
+        headers = [(b'x-forwarded-for', encaminhado.encode())] if encaminhado else []
+        comunicador = WebsocketCommunicator(
+            self.aplicacao,
+            f'/ws/disponibilidade/{self.comerciante.id}/{funcionario_id or self.funcionario.id}/2030-01-02/',
+            headers=headers,
+        )
+        comunicador.scope['client'] = (ip, 50000)
+        return comunicador
+
+    def test_ip_do_cliente_so_confia_em_proxies_configurados(self):
+        def scope(ip, encaminhado):
+            return {'client': (ip, 1), 'headers': [(b'x-forwarded-for', encaminhado.encode())]}
+
+        self.assertEqual(ip_do_cliente(scope('200.1.1.1', '1.2.3.4')), '200.1.1.1')
+        self.assertEqual(ip_do_cliente(scope('10.0.0.1', '1.2.3.4, 200.1.1.1')), '200.1.1.1')
+        self.assertEqual(ip_do_cliente(scope('10.0.0.1', '1.2.3.4, 10.0.0.1')), '1.2.3.4')
+
+    async def test_limite_por_ip_atras_do_proxy(self):
+        primeiro = self.socket('10.0.0.1', '200.1.1.1')
+        self.assertEqual(await primeiro.connect(), (True, None))
+
+        # Mesmo cliente pelo mesmo proxy é recusado; outro cliente pelo proxy é aceito
+        recusado = self.socket('10.0.0.1', '200.1.1.1')
+        self.assertEqual(await recusado.connect(), (False, 4429))
+        outro = self.socket('10.0.0.1', '200.2.2.2')
+        self.assertEqual(await outro.connect(), (True, None))
+
+        # A vaga volta ao desconectar
+        await primeiro.disconnect()
+        novo = self.socket('10.0.0.1', '200.1.1.1')
+        self.assertEqual(await novo.connect(), (True, None))
+        await novo.disconnect()
+        await outro.disconnect()
+
+    async def test_recusa_devolve_a_vaga(self):
+        invalido = self.socket('200.1.1.1', funcionario_id=999999)
+        self.assertEqual(await invalido.connect(), (False, 4404))
+
+        valido = self.socket('200.1.1.1')
+        self.assertEqual(await valido.connect(), (True, None))
+        await valido.disconnect()
+
+
+class NotificacoesSocketTestCase(TransactionTestCase):
+    """Base dos testes do socket de notificações: conexões com o usuário já autenticado no scope"""
+
+    def setUp(self):
+        cache.clear()
+        self.comerciante, self.servico, self.funcionario = criar_estabelecimento()
+        self.aplicacao = URLRouter(websocket_urlpatterns)
+        self.camada = get_channel_layer()
+
+    async def conectar(self, user, comerciante_id=None, resume_from=None):
+        """Socket aberto e já sem o quadro connection_established, que é devolvido junto"""
+        caminho = '/ws/notifications/' + (f'?resume_from={resume_from}' if resume_from is not None else '')
+        comunicador = WebsocketCommunicator(self.aplicacao, caminho)
+        comunicador.scope['user'] = user
+        comunicador.scope['comerciante_id'] = comerciante_id
+        conectado, _ = await comunicador.connect()
+        self.assertTrue(conectado)
+        inicial = await comunicador.receive_json_from()
+        self.assertEqual(inicial['type'], 'connection_established')
+        return comunicador, inicial
+
+    async def enviar_ao_grupo(self, grupo, notificacao):
+        await self.camada.group_send(grupo, {'type': 'notification_message', 'notificacao': notificacao})
+
+
+@override_settings(NOTIFICACOES_JANELA_AGRUPAMENTO_MS=100)
+class JanelaAgrupamentoTests(NotificacoesSocketTestCase):
+    """Notificações que chegam dentro da janela saem juntas, sem duplicatas"""
+
+    async def test_duplicatas_na_janela_entregues_uma_vez(self):
+        socket, _ = await self.conectar(self.funcionario.user)
+        notificacao = {'type': 'novo_agendamento', 'chave': 'novo:1', 'agendamento_id': 1}
+        for _ in range(3):
+            await self.enviar_ao_grupo(f'notifications_{self.funcionario.user_id}', notificacao)
+
+        self.assertEqual(await socket.receive_json_from(), notificacao)
+        self.assertTrue(await socket.receive_nothing(0.2))
+        await socket.disconnect()
+
+    async def test_distintas_na_janela_viram_um_quadro(self):
+        socket, _ = await self.conectar(self.funcionario.user)
+        for agendamento_id in (1, 2, 3):
+            await self.enviar_ao_grupo(f'notifications_{self.funcionario.user_id}', {
+                'type': 'novo_agendamento', 'chave': f'novo:{agendamento_id}', 'agendamento_id': agendamento_id,
+            })
+
+        quadro = await socket.receive_json_from()
+        self.assertEqual(
+            (quadro['agrupada'], quadro['total'], quadro['agendamento_ids']), (True, 3, [1, 2, 3])
+        )
+        self.assertEqual(quadro['message'], '3 novos agendamentos')
+        self.assertTrue(await socket.receive_nothing(0.2))
+        await socket.disconnect()
+
+    async def test_unica_sai_inalterada_depois_da_janela(self):
+        socket, _ = await self.conectar(self.funcionario.user)
+        notificacao = {'type': 'agendamento_confirmado', 'chave': 'confirmado:1', 'agendamento_id': 1}
+        await self.enviar_ao_grupo(f'notifications_{self.funcionario.user_id}', notificacao)
+
+        # Nada antes de a janela fechar; depois, o quadro original
+        self.assertTrue(await socket.receive_nothing(0.05))
+        self.assertEqual(await socket.receive_json_from(), notificacao)
+        await socket.disconnect()
+
+
+@override_settings(NOTIFICACOES_JANELA_AGRUPAMENTO_MS=0)
+class EnvioEmLoteTests(NotificacoesSocketTestCase):
+    """Um lote de envios para vários grupos numa única passagem pelo event loop"""
+
+    async def abrir_sockets(self):
+        self.dono, _ = await self.conectar(self.comerciante.user, self.comerciante.id)
+        self.funcionario_sockets = [
+            (await self.conectar(self.funcionario.user, self.comerciante.id))[0] for _ in range(2)
+        ]
+
+    async def desconectar(self):
+        for socket in [self.dono, *self.funcionario_sockets]:
+            await socket.disconnect()
+
+    async def recebidos(self, socket, quantidade):
+        quadros = [await socket.receive_json_from() for _ in range(quantidade)]
+        self.assertTrue(await socket.receive_nothing(0.05))
+        return sorted(quadro['chave'] for quadro in quadros)
+
+    def falhar_no_grupo(self, grupo):
+        """group_send da camada que falha apenas para `grupo`"""
+        original = self.camada.group_send
+
+        async def group_send(nome, mensagem):
+            if nome == grupo:
+                raise ChannelFull()
+            return await original(nome, mensagem)
+
+        return mock.patch.object(self.camada, 'group_send', group_send)
+
+    async def test_lote_alcanca_todos_os_membros(self):
+        await self.abrir_sockets()
+        erros = await sync_to_async(send_notifications_to_groups)([
+            (f'notifications_{self.comerciante.user_id}', {'type': 'aviso', 'chave': 'dono'}),
+            (f'notifications_{self.funcionario.user_id}', {'type': 'aviso', 'chave': 'funcionario'}),
+            (grupo_comerciante(self.comerciante.id), {'type': 'aviso', 'chave': 'equipe'}),
+        ])
+
+        self.assertEqual(erros, [None, None, None])
+        self.assertEqual(await self.recebidos(self.dono, 2), ['dono', 'equipe'])
+        for socket in self.funcionario_sockets:
+            self.assertEqual(await self.recebidos(socket, 2), ['equipe', 'funcionario'])
+        await self.desconectar()
+
+    async def test_erros_por_quadro(self):
+        await self.abrir_sockets()
+        with self.falhar_no_grupo(f'notifications_{self.funcionario.user_id}'):
+            erros = await sync_to_async(send_notifications_to_groups)([
+                (f'notifications_{self.comerciante.user_id}', {'type': 'aviso', 'chave': 'dono'}),
+                (f'notifications_{self.funcionario.user_id}', {'type': 'aviso', 'chave': 'funcionario'}),
+                (grupo_comerciante(self.comerciante.id), {'type': 'aviso', 'chave': 'equipe'}),
+            ])
+
+        self.assertEqual(erros[0], None)
+        self.assertIsInstance(erros[1], ChannelFull)
+        self.assertEqual(erros[2], None)
+        # A falha de um quadro não impede os demais
+        self.assertEqual(await self.recebidos(self.dono, 2), ['dono', 'equipe'])
+        for socket in self.funcionario_sockets:
+            self.assertEqual(await self.recebidos(socket, 1), ['equipe'])
+        await self.desconectar()
+
+    async def test_lote_por_usuario_com_erros_na_ordem(self):
+        await self.abrir_sockets()
+        ausente = await sync_to_async(User.objects.create_user)(username='ausente', tipo_usuario='funcionario')
+        with self.falhar_no_grupo(f'notifications_{self.funcionario.user_id}'):
+            erros = await sync_to_async(send_notifications_batch)([
+                (self.comerciante.user_id, {'type': 'aviso', 'chave': 'dono'}),
+                (ausente.id, {'type': 'aviso', 'chave': 'ausente'}),
+                (self.funcionario.user_id, {'type': 'aviso', 'chave': 'funcionario'}),
+            ])
+
+        # Usuário sem socket fica só com o histórico, sem erro
+        self.assertEqual(erros[:2], [None, None])
+        self.assertIsInstance(erros[2], ChannelFull)
+        self.assertEqual(await self.recebidos(self.dono, 1), ['dono'])
+        await self.desconectar()
+
+
+@override_settings(NOTIFICACOES_JANELA_AGRUPAMENTO_MS=0)
+class GruposEstabelecimentoTests(NotificacoesSocketTestCase):
+    """Sockets da equipe entram nos grupos do estabelecimento e do papel; os demais não"""
+
+    async def abrir_sockets(self):
+        sem_estabelecimento = await sync_to_async(User.objects.create_user)(username='cliente', tipo_usuario='admin')
+        self.dono, _ = await self.conectar(self.comerciante.user, self.comerciante.id)
+        self.equipe, _ = await self.conectar(self.funcionario.user, self.comerciante.id)
+        self.cliente, _ = await self.conectar(sem_estabelecimento)
+
+    async def desconectar(self):
+        for socket in (self.dono, self.equipe, self.cliente):
+            await socket.disconnect()
+
+    async def recebeu(self, socket):
+        if await socket.receive_nothing(0.1):
+            return None
+        return (await socket.receive_json_from())['chave']
+
+    async def test_equipe_nos_grupos_do_estabelecimento_e_do_papel(self):
+        await self.abrir_sockets()
+        await self.enviar_ao_grupo(grupo_comerciante(self.comerciante.id), {'type': 'aviso', 'chave': 'todos'})
+        self.assertEqual(await self.recebeu(self.dono), 'todos')
+        self.assertEqual(await self.recebeu(self.equipe), 'todos')
+        self.assertIsNone(await self.recebeu(self.cliente))
+
+        await self.enviar_ao_grupo(
+            grupo_comerciante(self.comerciante.id, 'funcionario'), {'type': 'aviso', 'chave': 'funcionarios'}
+        )
+        self.assertIsNone(await self.recebeu(self.dono))
+        self.assertEqual(await self.recebeu(self.equipe), 'funcionarios')
+        self.assertIsNone(await self.recebeu(self.cliente))
+        await self.desconectar()
+
+    async def test_outbox_por_papel_alcanca_apenas_o_papel(self):
+        await self.abrir_sockets()
+        await sync_to_async(registrar_notificacao_comerciante)(
+            self.comerciante.id, 'aviso:funcionarios', {'type': 'aviso'}, tipo_usuario='funcionario'
+        )
+        await sync_to_async(registrar_notificacao_comerciante)(
+            self.comerciante.id, 'aviso:comerciantes', {'type': 'aviso'}, tipo_usuario='comerciante'
+        )
+
+        self.assertEqual(await self.recebeu(self.dono), 'aviso:comerciantes')
+        self.assertEqual(await self.recebeu(self.equipe), 'aviso:funcionarios')
+        self.assertIsNone(await self.recebeu(self.dono))
+        self.assertIsNone(await self.recebeu(self.cliente))
+        await self.desconectar()
+
+    async def test_estabelecimento_buscado_no_banco_sem_o_middleware(self):
+        # Sem comerciante_id no scope (outra pilha de autenticação), o consumer o busca no banco
+        socket = WebsocketCommunicator(self.aplicacao, '/ws/notifications/')
+        socket.scope['user'] = self.funcionario.user
+        self.assertEqual(await socket.connect(), (True, None))
+        await socket.receive_json_from()
+
+        await self.enviar_ao_grupo(
+            grupo_comerciante(self.comerciante.id, 'funcionario'), {'type': 'aviso', 'chave': 'funcionarios'}
+        )
+        self.assertEqual(await self.recebeu(socket), 'funcionarios')
+        await socket.disconnect()
+
+
+@override_settings(NOTIFICACOES_JANELA_AGRUPAMENTO_MS=0)
+class HistoricoNotificacoesTests(NotificacoesSocketTestCase):
+    """Sequência por usuário, reenvio após reconexão e retenção do histórico"""
+
+    def test_sequencias_monotonicas_por_usuario_no_lote(self):
+        dono, funcionario = self.comerciante.user_id, self.funcionario.user_id
+        primeiro = registrar_no_historico([
+            (dono, {'type': 'a'}), (funcionario, {'type': 'b'}), (dono, {'type': 'c'}), (dono, {'type': 'd'}),
+        ])
+        segundo = registrar_no_historico([(funcionario, {'type': 'e'}), (dono, {'type': 'f'})])
+
+        self.assertEqual(
+            [(user_id, quadro['type'], quadro['seq']) for user_id, quadro in primeiro + segundo],
+            [(dono, 'a', 1), (funcionario, 'b', 1), (dono, 'c', 2), (dono, 'd', 3), (funcionario, 'e', 2), (dono, 'f', 4)]
+        )
+        self.assertEqual(
+            list(NotificacaoUsuario.objects.filter(user_id=dono).order_by('sequencia').values_list('sequencia', 'dados')),
+            [(1, {'type': 'a'}), (2, {'type': 'c'}), (3, {'type': 'd'}), (4, {'type': 'f'})]
+        )
+
+    async def test_reconexao_reenvia_apenas_depois_da_sequencia(self):
+        await sync_to_async(registrar_no_historico)([
+            (self.funcionario.user_id, {'type': f'aviso_{i}', 'chave': f'aviso:{i}'}) for i in range(1, 6)
+        ])
+
+        socket, inicial = await self.conectar(self.funcionario.user, self.comerciante.id, resume_from=2)
+
+        self.assertEqual(inicial['seq'], 5)
+        reenviados = [await socket.receive_json_from() for _ in range(3)]
+        self.assertEqual([(q['seq'], q['chave']) for q in reenviados], [(3, 'aviso:3'), (4, 'aviso:4'), (5, 'aviso:5')])
+        self.assertTrue(await socket.receive_nothing(0.05))
+        await socket.disconnect()
+
+    @override_settings(NOTIFICACOES_RETENCAO_DIAS=7)
+    def test_limpeza_remove_apenas_o_que_passou_da_retencao(self):
+        registrar_no_historico([(self.funcionario.user_id, {'type': f'aviso_{i}'}) for i in range(3)])
+        NotificacaoUsuario.objects.filter(sequencia=1).update(data_criacao=timezone.now() - timedelta(days=8))
+        NotificacaoUsuario.objects.filter(sequencia=2).update(data_criacao=timezone.now() - timedelta(days=6))
+
+        tasks.limpar_historico_notificacoes()
+
+        self.assertEqual(list(NotificacaoUsuario.objects.values_list('sequencia', flat=True).order_by('sequencia')), [2, 3])
+
+
+@override_settings(WEBSOCKET_HEARTBEAT_SEGUNDOS=0.05, WEBSOCKET_TIMEOUT_OCIOSO_SEGUNDOS=0.15)
+class BatimentoPresencaTests(NotificacoesSocketTestCase):
+    """Heartbeat do servidor e presença dos sockets de notificações"""
+
+    async def saidas_ate_fechar(self, socket):
+        """Tipos dos quadros recebidos até o fechamento, e o código de fechamento"""
+        tipos = []
+        while (saida := await socket.receive_output(1))['type'] != 'websocket.close':
+            tipos.append(json.loads(saida['text'])['type'])
+        return tipos, saida['code']
+
+    async def test_sem_sinal_fecha_com_4408(self):
+        socket, _ = await self.conectar(self.funcionario.user, self.comerciante.id)
+
+        tipos, codigo = await self.saidas_ate_fechar(socket)
+
+        self.assertEqual(codigo, 4408)
+        self.assertIn('heartbeat', tipos)
+        await socket.disconnect()
+
+    async def test_ping_renova_o_prazo(self):
+        socket, _ = await self.conectar(self.funcionario.user, self.comerciante.id)
+
+        # Quatro vezes o tempo ocioso, com sinal a cada batimento
+        tipos = []
+        for _ in range(12):
+            await socket.send_json_to({'type': 'ping', 'timestamp': 1})
+            await asyncio.sleep(0.05)
+            while not await socket.receive_nothing(0):
+                saida = await socket.receive_output()
+                self.assertNotEqual(saida['type'], 'websocket.close')
+                tipos.append(json.loads(saida['text'])['type'])
+
+        self.assertIn('pong', tipos)
+        self.assertIn('heartbeat', tipos)
+        await socket.disconnect()
+
+    async def test_presenca_com_varios_sockets_por_usuario(self):
+        conectados = sync_to_async(usuarios_conectados_para_envio)
+        user_id = self.funcionario.user_id
+        primeiro, _ = await self.conectar(self.funcionario.user, self.comerciante.id)
+        segundo, _ = await self.conectar(self.funcionario.user, self.comerciante.id)
+
+        self.assertEqual(await PresencaConexao.objects.filter(user_id=user_id).acount(), 2)
+        self.assertEqual(await conectados([user_id, self.comerciante.user_id]), {user_id})
+
+        await primeiro.disconnect()
+        self.assertEqual(await PresencaConexao.objects.filter(user_id=user_id).acount(), 1)
+        self.assertEqual(await conectados([user_id]), {user_id})
+
+        await segundo.disconnect()
+        self.assertFalse(await PresencaConexao.objects.filter(user_id=user_id).aexists())
+        self.assertEqual(await conectados([user_id]), set())
@@ -1,13 +1,17 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
+from django.db import connections, transaction
 from django.utils import timezone
 from datetime import datetime, timedelta
 import json
 import logging
 
 from .models import Comerciante, Funcionario, Servico, Cliente, Agendamento
+from .canais import opcoes_canal_preferido
+from .disponibilidade import horarios_disponiveis, capturar_disponibilidade, publicar_disponibilidade, dia_agendamento
+from salao_agendamento.shards import fixar_shard, primeiro_nos_shards
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +24,7 @@ def agendar_servico(request, comerciante_id):
         'comerciante': comerciante,
         'servicos': comerciante.servicos.filter(ativo=True),
         'funcionarios': comerciante.funcionarios.filter(ativo=True),
+        'canais': opcoes_canal_preferido(),
     }
     
     return render(request, 'agendamento/agendamento_publico.html', context)
@@ -62,19 +67,27 @@ def criar_agendamento(request, comerciante_id):
             except Cliente.DoesNotExist:
                 pass
         
+        # Canal preferido para lembretes (opcional); só os canais configurados são aceitos
+        canal_preferido = data.get('canal_preferido', '')
+        if canal_preferido not in dict(opcoes_canal_preferido()):
+            canal_preferido = ''
+        
         # Se cliente não existe, criar novo
         if not cliente:
             cliente = Cliente.objects.create(
                 nome=nome,
                 email=email,
                 telefone=telefone,
-                comerciante=comerciante
+                comerciante=comerciante,
+                canal_preferido=canal_preferido or 'email'
             )
         else:
             # Atualizar dados se necessário
             cliente.nome = nome
             if email:
                 cliente.email = email
+            if canal_preferido:
+                cliente.canal_preferido = canal_preferido
             cliente.save()
         
         # Buscar serviço e funcionário
@@ -104,50 +117,85 @@ def criar_agendamento(request, comerciante_id):
         from datetime import timedelta
         data_fim = data_agendamento + timedelta(minutes=servico.duracao_minutos)
         
-        # Verificar conflitos de horário
-        data_inicio_novo = data_agendamento
-        data_fim_novo = data_agendamento + timedelta(minutes=servico.duracao_minutos)
-        
-        # Buscar agendamentos do funcionário no mesmo dia
-        agendamentos_existentes = Agendamento.objects.filter(
-            funcionario=funcionario,
-            status__in=['agendado', 'confirmado', 'em_andamento'],
-            data_agendamento__date=data_agendamento.date()
-        )
-        
-        # Verificar se há sobreposição de horários
-        tem_conflito = False
-        for agendamento_existente in agendamentos_existentes:
-            data_inicio_existente = agendamento_existente.data_agendamento
-            data_fim_existente = agendamento_existente.get_data_fim()
-            
-            # Verificar se há sobreposição
-            if (data_inicio_novo < data_fim_existente and data_fim_novo > data_inicio_existente):
-                tem_conflito = True
-                break
-        
-        if tem_conflito:
-            return JsonResponse({'error': 'Horário não está mais disponível'}, status=400)
-        
         # Gerar token de confirmação
         import uuid
         token_confirmacao = str(uuid.uuid4())
         
-        # Criar agendamento
-        agendamento = Agendamento.objects.create(
-            comerciante=comerciante,
-            cliente=cliente,
-            funcionario=funcionario,
-            servico=servico,
-            data_agendamento=data_agendamento,
-            observacoes=data.get('observacoes', ''),
-            status='agendado',
-            token_confirmacao=token_confirmacao
-        )
+        from .notifications import NotificationService
+        from .outbox import registrar_notificacao, registrar_notificacao_tempo_real
+        from .calendario import registrar_evento_calendario
         
-        # Enviar notificações
-        from .tasks import enviar_confirmacao_agendamento
-        enviar_confirmacao_agendamento.delay(agendamento.id)
+        # Verificação de conflito, agendamento, lembretes e notificações na mesma transação;
+        # o envio fica a cargo do despachante do outbox, fora da requisição. No SQLite a
+        # transação começa com BEGIN IMMEDIATE e serializa as reservas; nos demais bancos o
+        # funcionário é travado (select_for_update) até o commit
+        banco = comerciante._state.db
+        with transaction.atomic(using=banco):
+            if connections[banco].features.has_select_for_update:
+                Funcionario.objects.select_for_update().filter(pk=funcionario.pk).exists()
+            
+            # Verificar conflitos de horário
+            data_inicio_novo = data_agendamento
+            data_fim_novo = data_agendamento + timedelta(minutes=servico.duracao_minutos)
+            
+            # Buscar agendamentos do funcionário no mesmo dia
+            agendamentos_existentes = Agendamento.objects.filter(
+                funcionario=funcionario,
+                status__in=['agendado', 'confirmado', 'em_andamento'],
+                data_agendamento__date=data_agendamento.date()
+            ).select_related('servico')
+            
+            # Verificar se há sobreposição de horários
+            tem_conflito = False
+            for agendamento_existente in agendamentos_existentes:
+                data_inicio_existente = agendamento_existente.data_agendamento
+                data_fim_existente = agendamento_existente.get_data_fim()
+                
+                # Verificar se há sobreposição
+                if (data_inicio_novo < data_fim_existente and data_fim_novo > data_inicio_existente):
+                    tem_conflito = True
+                    break
+            
+            if tem_conflito:
+                return JsonResponse({'error': 'Horário não está mais disponível'}, status=400)
+            
+            # Horários do dia antes da reserva, para avisar quem está na página pública
+            disponibilidade = capturar_disponibilidade([
+                (funcionario.id, timezone.localtime(data_agendamento).date())
+            ])
+            
+            agendamento = Agendamento.objects.create(
+                comerciante=comerciante,
+                cliente=cliente,
+                funcionario=funcionario,
+                servico=servico,
+                data_agendamento=data_agendamento,
+                observacoes=data.get('observacoes', ''),
+                status='agendado',
+                token_confirmacao=token_confirmacao
+            )
+            
+            # Programar lembretes nas antecedências configuradas
+            NotificationService().agendar_lembretes(agendamento)
+            
+            registrar_notificacao(
+                'email_confirmacao',
+                f'email_confirmacao:{agendamento.id}',
+                {'agendamento_id': agendamento.id},
+                agendamento=agendamento,
+            )
+            registrar_notificacao_tempo_real(
+                comerciante.user_id,
+                f'novo_agendamento:{agendamento.id}',
+                {
+                    'type': 'novo_agendamento',
+                    'message': f'Novo agendamento: {cliente.nome} - {servico.nome}',
+                    'agendamento_id': agendamento.id
+                },
+                agendamento=agendamento,
+            )
+            registrar_evento_calendario(agendamento)
+            publicar_disponibilidade(disponibilidade, using=banco)
         
         return JsonResponse({
             'success': True,
@@ -200,63 +248,11 @@ def get_horarios_disponiveis(request, comerciante_id, funcionario_id):
     try:
         # Validar formato da data
         data_obj = datetime.strptime(data, '%Y-%m-%d').date()
-        
-        # Não permitir agendamento para datas passadas
-        if data_obj < timezone.now().date():
-            return JsonResponse({'horarios': []})
-        
     except ValueError:
         return JsonResponse({'erro': 'Data inválida'}, status=400)
     
-    # Horários básicos (você pode personalizar conforme necessário)
-    horarios_base = [
-        '08:00', '08:30', '09:00', '09:30', '10:00', '10:30',
-        '11:00', '11:30', '14:00', '14:30', '15:00', '15:30',
-        '16:00', '16:30', '17:00', '17:30'
-    ]
-    
-    # Se for hoje, filtrar horários que já passaram
-    if data_obj == timezone.now().date():
-        hora_atual = timezone.now().time()
-        horarios_base = [h for h in horarios_base if datetime.strptime(h, '%H:%M').time() > hora_atual]
-    
-    # Buscar agendamentos existentes para essa data
-    agendamentos_existentes = Agendamento.objects.filter(
-        funcionario=funcionario,
-        data_agendamento__date=data,
-        status__in=['agendado', 'confirmado', 'em_andamento']
-    )
-    
-    horarios_disponiveis = []
-    
-    for horario in horarios_base:
-        try:
-            horario_obj = datetime.strptime(f"{data} {horario}", '%Y-%m-%d %H:%M')
-            horario_obj = timezone.make_aware(horario_obj)
-            
-            # Verificar se há conflito com algum agendamento existente
-            # Assumindo duração padrão de 60 minutos para verificação
-            duracao_padrao = 60  # minutos
-            inicio_novo = horario_obj
-            fim_novo = horario_obj + timedelta(minutes=duracao_padrao)
-            
-            tem_conflito = False
-            for agendamento in agendamentos_existentes:
-                inicio_existente = agendamento.data_agendamento
-                fim_existente = agendamento.get_data_fim()
-                
-                # Verificar se há sobreposição de horários
-                if (inicio_novo < fim_existente and fim_novo > inicio_existente):
-                    tem_conflito = True
-                    break
-            
-            if not tem_conflito:
-                horarios_disponiveis.append(horario)
-        except Exception as e:
-            logger.error(f"Erro ao processar horário {horario}: {str(e)}")
-            continue
-    
-    return JsonResponse({'horarios': horarios_disponiveis})
+    # Datas passadas e horários que já passaram hoje não são oferecidos
+    return JsonResponse({'horarios': horarios_disponiveis(funcionario.id, data_obj)})
 
 
 def get_funcionarios_por_servico(request, comerciante_id, servico_id):
@@ -265,7 +261,7 @@ def get_funcionarios_por_servico(request, comerciante_id, servico_id):
     servico = get_object_or_404(Servico, id=servico_id, comerciante=comerciante, ativo=True)
     
     # Por simplicidade, todos os funcionários podem prestar todos os serviços
-    funcionarios = comerciante.funcionarios.filter(ativo=True)
+    funcionarios = comerciante.funcionarios.filter(ativo=True).select_related('user')
     
     funcionarios_data = []
     for funcionario in funcionarios:
@@ -291,7 +287,7 @@ def confirmar_agendamento(request):
         return render(request, 'agendamento/erro.html', {'erro': 'ID do agendamento não informado'})
     
     try:
-        agendamento = get_object_or_404(Agendamento, id=agendamento_id)
+        agendamento = _localizar_agendamento(id=agendamento_id)
         context = {
             'agendamento': agendamento,
         }
@@ -310,26 +306,41 @@ def verificar_disponibilidade(request):
     return JsonResponse({"disponivel": True})
 
 
+def _localizar_agendamento(**filtros):
+    """Agendamento por token ou id em qualquer shard; o resto da requisição usa o shard dele"""
+    agendamento = primeiro_nos_shards(lambda: Agendamento.objects.filter(**filtros).first())
+    if agendamento is None:
+        raise Http404('Agendamento não encontrado')
+    fixar_shard(agendamento._state.db)
+    return agendamento
+
+
 def confirmar_agendamento_token(request, token):
     """Confirmar agendamento via token"""
     try:
-        agendamento = get_object_or_404(Agendamento, token_confirmacao=token)
+        agendamento = _localizar_agendamento(token_confirmacao=token)
         
         if request.method == 'POST':
-            agendamento.status = 'confirmado'
-            agendamento.confirmado_pelo_cliente = True
-            agendamento.save()
+            from .outbox import registrar_notificacao_tempo_real
+            from .calendario import registrar_evento_calendario
             
-            # Notificar comerciante em tempo real
-            from .consumers import send_notification_to_user
-            send_notification_to_user(
-                agendamento.comerciante.user.id,
-                {
-                    'type': 'agendamento_confirmado',
-                    'message': f'Agendamento confirmado por {agendamento.cliente.nome}',
-                    'agendamento_id': agendamento.id
-                }
-            )
+            with transaction.atomic(using=agendamento._state.db):
+                agendamento.status = 'confirmado'
+                agendamento.confirmado_pelo_cliente = True
+                agendamento.save()
+
+                # Notificar comerciante em tempo real (via outbox)
+                registrar_notificacao_tempo_real(
+                    agendamento.comerciante.user_id,
+                    f'agendamento_confirmado:{agendamento.id}',
+                    {
+                        'type': 'agendamento_confirmado',
+                        'message': f'Agendamento confirmado por {agendamento.cliente.nome}',
+                        'agendamento_id': agendamento.id
+                    },
+                    agendamento=agendamento,
+                )
+                registrar_evento_calendario(agendamento)
             
             messages.success(request, 'Agendamento confirmado com sucesso!')
             return redirect('agendamento_confirmado', agendamento_id=agendamento.id)
@@ -349,24 +360,32 @@ def confirmar_agendamento_token(request, token):
 def cancelar_agendamento_token(request, token):
     """Cancelar agendamento via token"""
     try:
-        agendamento = get_object_or_404(Agendamento, token_confirmacao=token)
+        agendamento = _localizar_agendamento(token_confirmacao=token)
         
         if request.method == 'POST':
             motivo = request.POST.get('motivo', '')
-            agendamento.status = 'cancelado'
-            agendamento.observacoes += f"\nCancelado pelo cliente. Motivo: {motivo}"
-            agendamento.save()
+            from .outbox import registrar_notificacao_tempo_real
+            from .calendario import registrar_evento_calendario
             
-            # Notificar comerciante em tempo real
-            from .consumers import send_notification_to_user
-            send_notification_to_user(
-                agendamento.comerciante.user.id,
-                {
-                    'type': 'agendamento_cancelado',
-                    'message': f'Agendamento cancelado por {agendamento.cliente.nome}',
-                    'agendamento_id': agendamento.id
-                }
-            )
+            with transaction.atomic(using=agendamento._state.db):
+                disponibilidade = capturar_disponibilidade([dia_agendamento(agendamento)])
+                agendamento.status = 'cancelado'
+                agendamento.observacoes += f"\nCancelado pelo cliente. Motivo: {motivo}"
+                agendamento.save()
+
+                # Notificar comerciante em tempo real (via outbox)
+                registrar_notificacao_tempo_real(
+                    agendamento.comerciante.user_id,
+                    f'agendamento_cancelado:{agendamento.id}',
+                    {
+                        'type': 'agendamento_cancelado',
+                        'message': f'Agendamento cancelado por {agendamento.cliente.nome}',
+                        'agendamento_id': agendamento.id
+                    },
+                    agendamento=agendamento,
+                )
+                registrar_evento_calendario(agendamento)
+                publicar_disponibilidade(disponibilidade, using=agendamento._state.db)
             
             messages.success(request, 'Agendamento cancelado com sucesso!')
             return redirect('agendamento_cancelado', agendamento_id=agendamento.id)
@@ -385,12 +404,12 @@ def cancelar_agendamento_token(request, token):
 
 def agendamento_confirmado(request, agendamento_id):
     """Página de agendamento confirmado"""
-    agendamento = get_object_or_404(Agendamento, id=agendamento_id)
+    agendamento = _localizar_agendamento(id=agendamento_id)
     return render(request, 'agendamento/agendamento_confirmado.html', {'agendamento': agendamento})
 
 
 def agendamento_cancelado(request, agendamento_id):
     """Página de agendamento cancelado"""
-    agendamento = get_object_or_404(Agendamento, id=agendamento_id)
+    agendamento = _localizar_agendamento(id=agendamento_id)
     return render(request, 'agendamento/agendamento_cancelado.html', {'agendamento': agendamento})
 
@@ -1,3 +1,123 @@
+import json
+from datetime import timedelta
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from agendamento.models import Agendamento, Cliente, NotificacaoOutbox
+from agendamento.suporte_testes import OrcamentoConsultasTestCase, criar_estabelecimento
+
+
+class OrcamentoConsultasPainelTests(OrcamentoConsultasTestCase):
+    """Dashboards, listas e o calendário do painel, para o comerciante e para o funcionário"""
+
+    def entrar_como_comerciante(self):
+        self.client.force_login(self.comerciante.user)
+
+    def entrar_como_funcionario(self):
+        self.client.force_login(self.funcionario.user)
+
+    def assertPaginaNoOrcamento(self, orcamento, url):
+        self.assertOrcamentoConsultas(orcamento, lambda: self.assertStatus(self.client.get(url)))
+
+    def test_dashboard(self):
+        self.entrar_como_comerciante()
+        self.assertPaginaNoOrcamento(9, '/comerciante/')
+
+    def test_funcionarios_list(self):
+        self.entrar_como_comerciante()
+        self.assertPaginaNoOrcamento(5, '/comerciante/funcionarios/')
+
+    def test_servicos_list(self):
+        self.entrar_como_comerciante()
+        self.assertPaginaNoOrcamento(6, '/comerciante/servicos/')
+
+    def test_agendamentos_list(self):
+        self.entrar_como_comerciante()
+        self.assertPaginaNoOrcamento(5, '/comerciante/agendamentos/')
+
+    def test_agendamentos_list_funcionario(self):
+        self.entrar_como_funcionario()
+        self.assertPaginaNoOrcamento(5, '/comerciante/agendamentos/')
+
+    def test_funcionario_dashboard(self):
+        self.entrar_como_funcionario()
+        self.assertPaginaNoOrcamento(7, '/comerciante/funcionario-dashboard/')
+
+    def test_calendario(self):
+        self.entrar_como_comerciante()
+        self.assertPaginaNoOrcamento(4, '/comerciante/calendario/')
+
+    def test_agendamentos_json(self):
+        self.entrar_como_comerciante()
+        inicio = (timezone.now() - timedelta(days=1)).isoformat()
+        fim = (timezone.now() + timedelta(days=7)).isoformat()
+        self.assertOrcamentoConsultas(4, lambda: self.assertStatus(
+            self.client.get('/comerciante/agendamentos/json/', {'start': inicio, 'end': fim})
+        ))
+
+    def test_agendamentos_json_funcionario(self):
+        self.entrar_como_funcionario()
+        self.assertOrcamentoConsultas(4, lambda: self.assertStatus(
+            self.client.get('/comerciante/agendamentos/json/')
+        ))
+
+
+class EventosCalendarioTests(TestCase):
+    """Alterações de agendamento no painel chegam aos calendários abertos, um evento por destinatário"""
+
+    def setUp(self):
+        cache.clear()
+        self.comerciante, self.servico, self.funcionario = criar_estabelecimento()
+        cliente = Cliente.objects.create(comerciante=self.comerciante, nome='Maria', telefone='1')
+        self.agendamento = Agendamento.objects.create(
+            comerciante=self.comerciante, cliente=cliente, funcionario=self.funcionario, servico=self.servico,
+            data_agendamento=timezone.now() + timedelta(days=2),
+        )
+        self.client.force_login(self.comerciante.user)
+
+    def eventos(self):
+        return list(NotificacaoOutbox.objects.filter(
+            chave_idempotencia__startswith=f'calendario:{self.agendamento.id}:'
+        ).order_by('pk').values_list('chave_idempotencia', flat=True))
+
+    def chaves_esperadas(self):
+        self.agendamento.refresh_from_db()
+        versao = self.agendamento.data_atualizacao.isoformat()
+        return {
+            f'calendario:{self.agendamento.id}:{versao}:{user_id}'
+            for user_id in (self.comerciante.user_id, self.funcionario.user_id)
+        }
+
+    def editar(self, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(
+                f'/comerciante/agendamentos/{self.agendamento.id}/edit/', {'status': status, 'observacoes': ''}
+            )
+        self.assertEqual(resposta.status_code, 302)
+
+    def test_edicao_gera_um_evento_por_destinatario(self):
+        self.editar('confirmado')
+        self.assertEqual(set(self.eventos()), self.chaves_esperadas())
+
+    def test_remarcacao_gera_um_evento_por_destinatario(self):
+        nova_data = timezone.localtime(self.agendamento.data_agendamento) + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post(
+                '/comerciante/agendamentos/mover/',
+                json.dumps({'id': self.agendamento.id, 'start': nova_data.isoformat()}),
+                content_type='application/json',
+            )
+        self.assertEqual(resposta.status_code, 200, resposta.content)
+        self.assertEqual(set(self.eventos()), self.chaves_esperadas())
+
+    def test_regravar_sem_mudanca_nao_gera_evento(self):
+        self.editar('confirmado')
+        primeiros = self.eventos()
+        self.editar('confirmado')
+        self.assertEqual(self.eventos(), primeiros)
 
-# Create your tests here.
+        # Voltar ao estado anterior é uma mudança e gera novos eventos
+        self.editar('agendado')
+        self.assertEqual(len(self.eventos()), 4)
@@ -4,14 +4,18 @@ from django.contrib import messages
 from django.db.models import Count, Q
 from django.core.paginator import Paginator
 from django.http import JsonResponse
-from django.db import transaction
+from django.db import connections, transaction
 from django.urls import reverse
 from django.utils import timezone # Import timezone
 from accounts.models import User
+from accounts.tenant import invalidar_tenant, invalidar_tenant_comerciante
 from agendamento.models import Comerciante, Funcionario, Servico, Agendamento, Cliente
+from agendamento.notifications import NotificationService
+from agendamento.calendario import cor_funcionario, evento_calendario, registrar_evento_calendario
+from agendamento.disponibilidade import capturar_disponibilidade, publicar_disponibilidade, dia_agendamento
+from salao_agendamento.replicas import leitura_replica
 from datetime import datetime, timedelta
 import json
-import hashlib
 
 def is_comerciante_or_funcionario(user):
     return user.is_authenticated and (user.is_comerciante() or user.is_funcionario())
@@ -19,19 +23,12 @@ def is_comerciante_or_funcionario(user):
 def is_comerciante(user):
     return user.is_authenticated and user.is_comerciante()
 
-def get_comerciante_from_user(user):
-    """Retorna o comerciante baseado no usuário (comerciante ou funcionário)"""
-    if user.is_comerciante():
-        return user.comerciante
-    elif user.is_funcionario():
-        return user.funcionario.comerciante
-    return None
-
 @login_required
 @user_passes_test(is_comerciante_or_funcionario)
+@leitura_replica
 def dashboard(request):
     """Dashboard do comerciante"""
-    comerciante = get_comerciante_from_user(request.user)
+    comerciante = request.tenant.comerciante
 
     # Estatísticas
     total_funcionarios = comerciante.funcionarios.filter(ativo=True).count()
@@ -48,14 +45,14 @@ def dashboard(request):
     # Agendamentos recentes
     agendamentos_recentes = Agendamento.objects.filter(
         comerciante=comerciante
-    ).select_related('cliente', 'funcionario', 'servico').order_by('-data_criacao')[:10]
+    ).select_related('cliente', 'funcionario__user', 'servico').order_by('-data_criacao')[:10]
 
     # Próximos agendamentos
     proximos_agendamentos = Agendamento.objects.filter(
         comerciante=comerciante,
         data_agendamento__gte=datetime.now(),
         status__in=['agendado', 'confirmado']
-    ).select_related('cliente', 'funcionario', 'servico').order_by('data_agendamento')[:5]
+    ).select_related('cliente', 'funcionario__user', 'servico').order_by('data_agendamento')[:5]
 
     context = {
         'comerciante': comerciante,
@@ -71,9 +68,10 @@ def dashboard(request):
 
 @login_required
 @user_passes_test(is_comerciante)
+@leitura_replica
 def funcionarios_list(request):
     """Lista funcionários do comerciante"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
 
     search = request.GET.get('search', '')
     status = request.GET.get('status', '')
@@ -113,7 +111,7 @@ def funcionarios_list(request):
 @user_passes_test(is_comerciante)
 def funcionario_create(request):
     """Cria um novo funcionário"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
 
     if request.method == 'POST':
         try:
@@ -154,7 +152,7 @@ def funcionario_create(request):
 @user_passes_test(is_comerciante)
 def funcionario_edit(request, pk):
     """Edita um funcionário"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
     funcionario = get_object_or_404(Funcionario, pk=pk, comerciante=comerciante)
 
     if request.method == 'POST':
@@ -180,6 +178,7 @@ def funcionario_edit(request, pk):
                 funcionario.comissao_percentual = request.POST.get('comissao_percentual', 30)
                 funcionario.ativo = request.POST.get('ativo') == 'on'
                 funcionario.save()
+                invalidar_tenant(funcionario.user_id)
 
                 messages.success(request, f'Funcionário {funcionario.user.get_full_name()} atualizado com sucesso!')
                 return redirect('comerciante_panel:funcionarios_list')
@@ -196,9 +195,10 @@ def funcionario_edit(request, pk):
 
 @login_required
 @user_passes_test(is_comerciante)
+@leitura_replica
 def servicos_list(request):
     """Lista serviços do comerciante"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
 
     search = request.GET.get('search', '')
     status = request.GET.get('status', '')
@@ -236,7 +236,7 @@ def servicos_list(request):
 @user_passes_test(is_comerciante)
 def servico_create(request):
     """Cria um novo serviço"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
     funcionarios = comerciante.funcionarios.filter(ativo=True)
 
     if request.method == 'POST':
@@ -271,7 +271,7 @@ def servico_create(request):
 @user_passes_test(is_comerciante)
 def servico_edit(request, pk):
     """Edita um serviço"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
     servico = get_object_or_404(Servico, pk=pk, comerciante=comerciante)
     funcionarios = comerciante.funcionarios.filter(ativo=True)
 
@@ -306,7 +306,7 @@ def servico_edit(request, pk):
 @user_passes_test(is_comerciante)
 def servico_delete(request, pk):
     """Exclui um serviço"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
     servico = get_object_or_404(Servico, pk=pk, comerciante=comerciante)
 
     if request.method == 'POST':
@@ -325,9 +325,10 @@ def servico_delete(request, pk):
 
 @login_required
 @user_passes_test(is_comerciante_or_funcionario)
+@leitura_replica
 def agendamentos_list(request):
     """Lista agendamentos"""
-    comerciante = get_comerciante_from_user(request.user)
+    comerciante = request.tenant.comerciante
 
     # Filtros
     search = request.GET.get('search', '')
@@ -341,7 +342,7 @@ def agendamentos_list(request):
 
     # Se for funcionário, mostrar apenas seus agendamentos
     if request.user.is_funcionario():
-        agendamentos = agendamentos.filter(funcionario=request.user.funcionario)
+        agendamentos = agendamentos.filter(funcionario=request.tenant.funcionario)
 
     if search:
         agendamentos = agendamentos.filter(
@@ -382,11 +383,11 @@ def agendamentos_list(request):
 @user_passes_test(is_comerciante_or_funcionario)
 def agendamento_edit(request, pk):
     """Edita um agendamento"""
-    comerciante = get_comerciante_from_user(request.user)
+    comerciante = request.tenant.comerciante
     agendamento = get_object_or_404(Agendamento, pk=pk, comerciante=comerciante)
 
     # Se for funcionário, só pode editar seus próprios agendamentos
-    if request.user.is_funcionario() and agendamento.funcionario != request.user.funcionario:
+    if request.user.is_funcionario() and agendamento.funcionario != request.tenant.funcionario:
         messages.error(request, 'Você só pode editar seus próprios agendamentos.')
         return redirect('comerciante_panel:agendamentos_list')
 
@@ -398,7 +399,12 @@ def agendamento_edit(request, pk):
             if request.POST.get('valor_pago'):
                 agendamento.valor_pago = request.POST['valor_pago']
 
-            agendamento.save()
+            banco = agendamento._state.db
+            with transaction.atomic(using=banco):
+                disponibilidade = capturar_disponibilidade([dia_agendamento(agendamento)])
+                agendamento.save()
+                registrar_evento_calendario(agendamento)
+                publicar_disponibilidade(disponibilidade, using=banco)
 
             messages.success(request, 'Agendamento atualizado com sucesso!')
             return redirect('comerciante_panel:agendamentos_list')
@@ -414,21 +420,21 @@ def agendamento_edit(request, pk):
 
 @login_required
 @user_passes_test(is_comerciante_or_funcionario)
+@leitura_replica
 def funcionario_dashboard(request):
     """Dashboard específico para funcionários"""
-    try:
-        funcionario = request.user.funcionario
-        comerciante = funcionario.comerciante
-    except:
+    funcionario = request.tenant.funcionario
+    if funcionario is None:
         messages.error(request, 'Acesso negado. Você não está cadastrado como funcionário.')
         return redirect('accounts:login')
+    comerciante = request.tenant.comerciante
 
     # Agendamentos de hoje do funcionário
     hoje = timezone.now().date()
     agendamentos_hoje = Agendamento.objects.filter(
         funcionario=funcionario,
         data_agendamento__date=hoje
-    ).order_by('data_agendamento')
+    ).select_related('cliente', 'servico').order_by('data_agendamento')
 
     # Próximos agendamentos (próximos 7 dias)
     proxima_semana = hoje + timedelta(days=7)
@@ -436,7 +442,7 @@ def funcionario_dashboard(request):
         funcionario=funcionario,
         data_agendamento__date__gt=hoje,
         data_agendamento__date__lte=proxima_semana
-    ).order_by('data_agendamento')[:5]
+    ).select_related('cliente', 'servico').order_by('data_agendamento')[:5]
 
     # URL do link de agendamento
     agendamento_url = request.build_absolute_uri(
@@ -457,7 +463,7 @@ def funcionario_dashboard(request):
 @user_passes_test(is_comerciante)
 def link_agendamento(request):
     """Gera link de agendamento para clientes"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
 
     # URL do link de agendamento
     agendamento_url = request.build_absolute_uri(
@@ -475,7 +481,7 @@ def link_agendamento(request):
 @user_passes_test(is_comerciante)
 def configuracoes(request):
     """Configurações do comerciante"""
-    comerciante = request.user.comerciante
+    comerciante = request.tenant.comerciante
 
     if request.method == 'POST':
         try:
@@ -490,6 +496,7 @@ def configuracoes(request):
                 comerciante.logo = request.FILES['logo']
 
             comerciante.save()
+            invalidar_tenant_comerciante(comerciante)
 
             messages.success(request, 'Configurações atualizadas com sucesso!')
             return redirect('comerciante_panel:configuracoes')
@@ -503,26 +510,17 @@ def configuracoes(request):
 
 @login_required
 @user_passes_test(is_comerciante_or_funcionario)
+@leitura_replica
 def calendario_view(request):
     """View para exibir o calendário avançado"""
-    comerciante = get_comerciante_from_user(request.user)
+    comerciante = request.tenant.comerciante
     
     # Buscar funcionários e suas especialidades para gerar cores
-    funcionarios = comerciante.funcionarios.filter(ativo=True)
+    funcionarios = comerciante.funcionarios.filter(ativo=True).select_related('user')
     cores_funcionarios = {}
     
-    def gerar_cor_deterministica(funcionario_id):
-        """Gera cor determinística e com bom contraste para funcionário"""
-        # Usar hash mais robusto para cores consistentes
-        hash_value = hash(str(funcionario_id))
-        hue = (hash_value % 360)  # 0-359 graus no círculo de cores
-        # Usar saturação alta e luminosidade média para boa visibilidade
-        saturation = 70  # 70%
-        lightness = 45   # 45%
-        return f"hsl({hue}, {saturation}%, {lightness}%)"
-    
     for funcionario in funcionarios:
-        color = gerar_cor_deterministica(funcionario.id)
+        color = cor_funcionario(funcionario.id)
         cores_funcionarios[funcionario.id] = {
             'color': color,
             'nome': funcionario.user.get_full_name(),
@@ -540,9 +538,10 @@ def calendario_view(request):
 
 @login_required
 @user_passes_test(is_comerciante_or_funcionario)
+@leitura_replica
 def agendamentos_json(request):
     """API para retornar agendamentos em formato JSON para o calendário"""
-    comerciante = get_comerciante_from_user(request.user)
+    comerciante = request.tenant.comerciante
     
     # Filtros de data do FullCalendar
     start = request.GET.get('start')
@@ -554,7 +553,7 @@ def agendamentos_json(request):
     
     # Se for funcionário, mostrar apenas seus agendamentos
     if request.user.is_funcionario():
-        agendamentos = agendamentos.filter(funcionario=request.user.funcionario)
+        agendamentos = agendamentos.filter(funcionario=request.tenant.funcionario)
     
     # Filtro por data se fornecido (importante para performance)
     if start:
@@ -571,45 +570,7 @@ def agendamentos_json(request):
             pass  # Ignorar data inválida
     
     # Converter para formato FullCalendar
-    events = []
-    for agendamento in agendamentos:
-        # Gerar cor baseada no funcionário usando a mesma função
-        hash_value = hash(str(agendamento.funcionario.id))
-        hue = (hash_value % 360)
-        saturation = 70
-        lightness = 45
-        color = f"hsl({hue}, {saturation}%, {lightness}%)"
-        
-        # Status do agendamento define o estilo
-        class_names = ['agendamento']
-        if agendamento.status == 'confirmado':
-            class_names.append('confirmado')
-        elif agendamento.status == 'cancelado':
-            class_names.append('cancelado')
-        elif agendamento.status == 'concluido':
-            class_names.append('concluido')
-        
-        event = {
-            'id': agendamento.id,
-            'title': f"{agendamento.cliente.nome} - {agendamento.servico.nome}",
-            'start': agendamento.data_agendamento.isoformat(),
-            'end': agendamento.get_data_fim().isoformat(),
-            'backgroundColor': color,
-            'borderColor': color,
-            'extendedProps': {
-                'cliente': agendamento.cliente.nome,
-                'servico': agendamento.servico.nome,
-                'funcionario': agendamento.funcionario.user.get_full_name(),
-                'funcionario_id': agendamento.funcionario.id,
-                'preco': str(agendamento.servico.preco),
-                'status': agendamento.status,
-                'status_display': agendamento.get_status_display(),
-                'telefone': agendamento.cliente.telefone,
-                'observacoes': agendamento.observacoes or ''
-            },
-            'classNames': class_names
-        }
-        events.append(event)
+    events = [evento_calendario(agendamento) for agendamento in agendamentos]
     
     return JsonResponse(events, safe=False)
 
@@ -628,13 +589,13 @@ def mover_agendamento(request):
         if not agendamento_id or not nova_data:
             return JsonResponse({'error': 'Dados incompletos', 'code': 'MISSING_DATA'}, status=400)
         
-        comerciante = get_comerciante_from_user(request.user)
+        comerciante = request.tenant.comerciante
         agendamento = get_object_or_404(Agendamento, 
                                       id=agendamento_id, 
                                       comerciante=comerciante)
         
         # Se for funcionário, só pode mover seus próprios agendamentos
-        if request.user.is_funcionario() and agendamento.funcionario != request.user.funcionario:
+        if request.user.is_funcionario() and agendamento.funcionario != request.tenant.funcionario:
             return JsonResponse({'error': 'Sem permissão para mover agendamentos de outros funcionários', 'code': 'PERMISSION_DENIED'}, status=403)
         
         # Converter e validar nova data
@@ -649,29 +610,44 @@ def mover_agendamento(request):
         # Calcular nova data de fim
         nova_data_fim = nova_data_obj + timedelta(minutes=agendamento.servico.duracao_minutos)
         
-        # Verificar conflitos com outros agendamentos do mesmo funcionário
-        conflitos = Agendamento.objects.filter(
-            funcionario=agendamento.funcionario,
-            comerciante=comerciante,
-            status__in=['agendado', 'confirmado', 'em_andamento']
-        ).exclude(id=agendamento.id).filter(
-            Q(data_agendamento__lt=nova_data_fim) & 
-            Q(data_agendamento__gte=nova_data_obj) |
-            Q(data_agendamento__lt=nova_data_obj) & 
-            Q(data_agendamento__gt=nova_data_obj)
-        )
-        
-        if conflitos.exists():
-            conflito = conflitos.first()
-            return JsonResponse({
-                'error': f'Conflito de horário com agendamento de {conflito.cliente.nome} às {conflito.data_agendamento.strftime("%H:%M")}', 
-                'code': 'TIME_CONFLICT'
-            }, status=400)
-        
-        # Usar transação para garantir consistência
-        with transaction.atomic():
+        # Verificação de conflito e remarcação na mesma transação, no banco do
+        # comerciante, como na reserva pública: o funcionário fica travado até o commit
+        banco = agendamento._state.db
+        with transaction.atomic(using=banco):
+            if connections[banco].features.has_select_for_update:
+                Funcionario.objects.select_for_update().filter(pk=agendamento.funcionario_id).exists()
+
+            # Verificar conflitos com outros agendamentos do mesmo funcionário
+            conflitos = Agendamento.objects.filter(
+                funcionario=agendamento.funcionario,
+                comerciante=comerciante,
+                status__in=['agendado', 'confirmado', 'em_andamento']
+            ).exclude(id=agendamento.id).filter(
+                Q(data_agendamento__lt=nova_data_fim) & 
+                Q(data_agendamento__gte=nova_data_obj) |
+                Q(data_agendamento__lt=nova_data_obj) & 
+                Q(data_agendamento__gt=nova_data_obj)
+            )
+            
+            if conflitos.exists():
+                conflito = conflitos.first()
+                return JsonResponse({
+                    'error': f'Conflito de horário com agendamento de {conflito.cliente.nome} às {conflito.data_agendamento.strftime("%H:%M")}', 
+                    'code': 'TIME_CONFLICT'
+                }, status=400)
+            
+            disponibilidade = capturar_disponibilidade([dia_agendamento(agendamento)])
             agendamento.data_agendamento = nova_data_obj
             agendamento.save()
+
+            # Reprogramar os lembretes para o novo horário
+            NotificationService().agendar_lembretes(agendamento)
+
+            # Atualizar o calendário aberto em outras telas
+            registrar_evento_calendario(agendamento)
+
+            # Liberar o horário antigo e ocupar o novo na página pública
+            publicar_disponibilidade(disponibilidade, [dia_agendamento(agendamento)], using=banco)
         
         return JsonResponse({
             'success': True,
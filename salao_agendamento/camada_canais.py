@@ -0,0 +1,406 @@
+"""
+Channel layer para vários workers ASGI em um único host, sem Redis.
+
+As mensagens passam por um journal SQLite em modo WAL compartilhado pelos processos:
+
+- send/group_send gravam uma linha por canal de destino; a participação nos grupos
+  fica em uma tabela, então qualquer processo adiciona, remove e envia a qualquer grupo;
+- cada processo tem um único leitor que consulta PRAGMA data_version (barato, não lê
+  páginas) e só busca mensagens quando outro processo fez commit; envios do próprio
+  processo acordam o leitor diretamente;
+- nenhuma chamada ao SQLite roda no event loop: a consulta a data_version tem uma thread
+  própria e todo o resto (gravação, busca, reivindicação, limpeza) passa pela thread
+  de escrita, então um banco ocupado nunca trava os consumers;
+- canais comuns (sem "!") são disputados entre os processos com DELETE ... RETURNING,
+  de forma que cada mensagem é entregue uma única vez; o mesmo leitor reivindica as
+  mensagens apenas para os receive() que estão esperando.
+
+Sem commits novos, o leitor espaça as consultas a data_version de intervalo_consulta
+até intervalo_maximo; qualquer atividade volta ao intervalo mínimo.
+
+Configuração:
+
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'salao_agendamento.camada_canais.CamadaCanaisSQLite',
+            'CONFIG': {'caminho': BASE_DIR / 'canais.sqlite3'},
+        },
+    }
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS mensagens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    processo TEXT NOT NULL,
+    canal TEXT NOT NULL,
+    expira REAL NOT NULL,
+    dados BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS mensagens_processo_idx ON mensagens (processo, id);
+CREATE INDEX IF NOT EXISTS mensagens_canal_idx ON mensagens (canal, id);
+CREATE TABLE IF NOT EXISTS grupos (
+    grupo TEXT NOT NULL,
+    canal TEXT NOT NULL,
+    entrada REAL NOT NULL,
+    PRIMARY KEY (grupo, canal)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS grupos_canal_idx ON grupos (canal);
+"""
+
+# Intervalo entre limpezas de mensagens e participações expiradas, em segundos
+INTERVALO_LIMPEZA = 5
+
+
+class CamadaCanaisSQLite(BaseChannelLayer):
+    """Channel layer multi-processo sobre um journal SQLite (WAL)"""
+
+    extensions = ['groups', 'flush']
+
+    def __init__(
+        self,
+        caminho='canais.sqlite3',
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        intervalo_consulta=0.005,
+        intervalo_maximo=0.1,
+        tamanho_lote=500,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.caminho = str(caminho)
+        self.group_expiry = group_expiry
+        self.intervalo_consulta = intervalo_consulta
+        self.intervalo_maximo = intervalo_maximo
+        self.tamanho_lote = tamanho_lote
+
+        # Prefixo dos canais específicos deste processo
+        self.processo = '%s.%s' % (os.getpid(), ''.join(random.choice(string.ascii_letters) for _ in range(8)))
+
+        # Todo acesso de escrita passa por uma única thread (o SQLite aceita um escritor por vez)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='camada-canais')
+        # data_version fica em outra thread para não esperar na fila das escritas
+        self._executor_versao = ThreadPoolExecutor(max_workers=1, thread_name_prefix='camada-canais-versao')
+        self._conexao_local = threading.local()
+        self._prefixos = set()
+        self._reset_estado_loop()
+
+    # Conexões
+
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, timeout=30, isolation_level=None, check_same_thread=False)
+        conexao.execute('PRAGMA journal_mode=WAL')
+        conexao.execute('PRAGMA synchronous=NORMAL')
+        return conexao
+
+    def _conexao(self):
+        """Conexão da thread atual, criando o esquema na primeira vez"""
+        conexao = getattr(self._conexao_local, 'conexao', None)
+        if conexao is None:
+            conexao = self._conectar()
+            conexao.executescript(ESQUEMA)
+            self._conexao_local.conexao = conexao
+        return conexao
+
+    async def _executar(self, funcao, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, funcao, *args)
+
+    # Estado ligado ao event loop que recebe mensagens
+
+    def _reset_estado_loop(self):
+        self._loop = None
+        self._filas = {}
+        # receive() aguardando, por canal: filas com alguém esperando não são descartadas
+        # e, nos canais comuns, o leitor reivindica uma mensagem por receive() pendente
+        self._esperando = {}
+        self._leitor = None
+        self._acordar = None
+        self._versao = None
+
+    def _garantir_leitor(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Receber em outro loop (ex.: testes com async_to_sync) recomeça o estado local
+            self._reset_estado_loop()
+            self._loop = loop
+            self._acordar = asyncio.Event()
+        if self._leitor is None or self._leitor.done():
+            self._leitor = loop.create_task(self._ler_journal())
+
+    def _fila(self, canal):
+        fila = self._filas.get(canal)
+        if fila is None:
+            fila = self._filas[canal] = asyncio.Queue(maxsize=self.get_capacity(canal))
+        return fila
+
+    def _sinalizar(self):
+        """Acorda o leitor deste processo após um envio local, de qualquer thread"""
+        loop, acordar = self._loop, self._acordar
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(acordar.set)
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+
+        dados = msgpack.packb(message, use_bin_type=True)
+        if not await self._executar(self._gravar, [channel], dados, True):
+            raise ChannelFull(channel)
+        self._sinalizar()
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+
+        self._garantir_leitor()
+        if '!' in channel:
+            self._prefixos.add(self.non_local_name(channel))
+        fila = self._fila(channel)
+        self._esperando[channel] = self._esperando.get(channel, 0) + 1
+        if '!' not in channel:
+            # Canal comum: disputado entre os processos; o leitor tenta reivindicar já
+            self._acordar.set()
+        try:
+            _, message = await fila.get()
+        finally:
+            restantes = self._esperando.get(channel, 1) - 1
+            if restantes:
+                self._esperando[channel] = restantes
+            else:
+                self._esperando.pop(channel, None)
+                if fila.empty():
+                    self._filas.pop(channel, None)
+        return message
+
+    async def new_channel(self, prefix='specific.'):
+        nome = '%s.%s!%s' % (
+            prefix.rstrip('.'),
+            self.processo,
+            ''.join(random.choice(string.ascii_letters) for _ in range(12)),
+        )
+        self._prefixos.add(self.non_local_name(nome))
+        return nome
+
+    async def flush(self):
+        await self._executar(self._apagar_tudo)
+        for fila in self._filas.values():
+            while not fila.empty():
+                fila.get_nowait()
+
+    async def close(self):
+        if self._leitor is not None and self._loop is asyncio.get_running_loop():
+            self._leitor.cancel()
+        self._reset_estado_loop()
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._executar(self._sql, 'INSERT OR REPLACE INTO grupos (grupo, canal, entrada) VALUES (?, ?, ?)',
+                             (group, channel, time.time()))
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        await self._executar(self._sql, 'DELETE FROM grupos WHERE grupo = ? AND canal = ?', (group, channel))
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+
+        # Serializado uma vez só, gravado para todos os membros em uma transação
+        dados = msgpack.packb(message, use_bin_type=True)
+        if await self._executar(self._gravar_grupo, group, dados):
+            self._sinalizar()
+
+    # Operações no banco (sempre na thread do executor)
+
+    def _sql(self, sql, parametros=()):
+        self._conexao().execute(sql, parametros)
+
+    def _gravar(self, canais, dados, verificar_capacidade=False):
+        conexao = self._conexao()
+        expira = time.time() + self.expiry
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            if verificar_capacidade and len(canais) == 1:
+                pendentes = conexao.execute(
+                    'SELECT COUNT(*) FROM mensagens WHERE canal = ? AND expira > ?',
+                    (canais[0], time.time())
+                ).fetchone()[0]
+                if pendentes >= self.get_capacity(canais[0]):
+                    conexao.execute('ROLLBACK')
+                    return False
+            conexao.executemany(
+                'INSERT INTO mensagens (processo, canal, expira, dados) VALUES (?, ?, ?, ?)',
+                [(self.non_local_name(canal) if '!' in canal else '', canal, expira, dados) for canal in canais]
+            )
+            conexao.execute('COMMIT')
+        except Exception:
+            conexao.execute('ROLLBACK')
+            raise
+        return True
+
+    def _gravar_grupo(self, grupo, dados):
+        conexao = self._conexao()
+        limite = time.time() - self.group_expiry
+        canais = [
+            canal for (canal,) in conexao.execute(
+                'SELECT canal FROM grupos WHERE grupo = ? AND entrada > ?', (grupo, limite)
+            )
+        ]
+        if not canais:
+            return False
+        return self._gravar(canais, dados)
+
+    def _buscar(self, prefixos):
+        """Lê e remove do journal as mensagens dos canais específicos deste processo"""
+        conexao = self._conexao()
+        marcadores = ','.join('?' * len(prefixos))
+        conexao.execute('BEGIN IMMEDIATE')
+        try:
+            linhas = conexao.execute(
+                f'SELECT id, canal, expira, dados FROM mensagens WHERE processo IN ({marcadores}) '
+                f'ORDER BY id LIMIT ?',
+                (*prefixos, self.tamanho_lote)
+            ).fetchall()
+            if linhas:
+                conexao.execute(
+                    f'DELETE FROM mensagens WHERE processo IN ({marcadores}) AND id <= ?',
+                    (*prefixos, linhas[-1][0])
+                )
+            conexao.execute('COMMIT')
+        except Exception:
+            conexao.execute('ROLLBACK')
+            raise
+        return linhas
+
+    def _reivindicar(self, canal):
+        """Remove e retorna (expira, dados) da mensagem mais antiga de um canal comum, se houver"""
+        return self._conexao().execute(
+            'DELETE FROM mensagens WHERE id = ('
+            '  SELECT id FROM mensagens WHERE canal = ? AND expira > ? ORDER BY id LIMIT 1'
+            ') RETURNING expira, dados',
+            (canal, time.time())
+        ).fetchone()
+
+    def _limpar(self):
+        conexao = self._conexao()
+        agora = time.time()
+        expirados = [
+            canal for (canal,) in conexao.execute(
+                'SELECT DISTINCT canal FROM mensagens WHERE expira <= ?', (agora,)
+            )
+        ]
+        conexao.execute('DELETE FROM mensagens WHERE expira <= ?', (agora,))
+        # Como no InMemoryChannelLayer, canal com mensagem expirada sai de todos os grupos
+        conexao.executemany('DELETE FROM grupos WHERE canal = ?', [(canal,) for canal in expirados])
+        conexao.execute('DELETE FROM grupos WHERE entrada <= ?', (agora - self.group_expiry,))
+
+    def _apagar_tudo(self):
+        conexao = self._conexao()
+        conexao.execute('DELETE FROM mensagens')
+        conexao.execute('DELETE FROM grupos')
+
+    # Leitura
+
+    def _versao_dados(self):
+        """PRAGMA data_version na conexão da thread de versão; muda a cada commit de outra conexão"""
+        return self._conexao().execute('PRAGMA data_version').fetchone()[0]
+
+    async def _ler_journal(self):
+        """
+        Único leitor do processo: espera um commit (data_version muda) ou um envio
+        local e distribui as mensagens nas filas dos canais específicos.
+        """
+        loop = asyncio.get_running_loop()
+        proxima_limpeza = time.monotonic() + INTERVALO_LIMPEZA
+        espera = self.intervalo_consulta
+        try:
+            while True:
+                versao = await loop.run_in_executor(self._executor_versao, self._versao_dados)
+                if versao != self._versao or self._acordar.is_set():
+                    self._versao = versao
+                    self._acordar.clear()
+                    await self._distribuir()
+                    await self._reivindicar_comuns()
+                    espera = self.intervalo_consulta
+                else:
+                    espera = min(espera * 2, self.intervalo_maximo)
+
+                if time.monotonic() >= proxima_limpeza:
+                    proxima_limpeza = time.monotonic() + INTERVALO_LIMPEZA
+                    await self._executar(self._limpar)
+                    self._limpar_filas()
+
+                try:
+                    await asyncio.wait_for(self._acordar.wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro no leitor da camada de canais: {str(e)}")
+            raise
+
+    async def _distribuir(self):
+        if not self._prefixos:
+            return
+        while True:
+            linhas = await self._executar(self._buscar, tuple(self._prefixos))
+            agora = time.time()
+            for _, canal, expira, dados in linhas:
+                if expira <= agora:
+                    continue
+                try:
+                    self._fila(canal).put_nowait((expira, msgpack.unpackb(dados, raw=False)))
+                except asyncio.QueueFull:
+                    logger.warning(f"Fila do canal {canal} cheia, mensagem descartada")
+            if len(linhas) < self.tamanho_lote:
+                return
+
+    async def _reivindicar_comuns(self):
+        """Reivindica mensagens dos canais comuns, uma para cada receive() esperando"""
+        for canal, esperando in list(self._esperando.items()):
+            if '!' in canal:
+                continue
+            fila = self._fila(canal)
+            for _ in range(esperando - fila.qsize()):
+                linha = await self._executar(self._reivindicar, canal)
+                if linha is None:
+                    break
+                expira, dados = linha
+                fila.put_nowait((expira, msgpack.unpackb(dados, raw=False)))
+
+    def _limpar_filas(self):
+        """Descarta mensagens expiradas das filas locais e as filas vazias sem receive() esperando"""
+        agora = time.time()
+        for canal, fila in list(self._filas.items()):
+            validas = []
+            while not fila.empty():
+                item = fila.get_nowait()
+                if item[0] >= agora:
+                    validas.append(item)
+            for item in validas:
+                fila.put_nowait(item)
+            if fila.empty() and not self._esperando.get(canal):
+                self._filas.pop(canal, None)
@@ -15,16 +15,31 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Carrega módulos de tarefas de todos os apps Django registrados.
 app.autodiscover_tasks()
 
+# Perfil das tarefas (consultas e tempo de banco por execução) quando PERFIL_REQUISICOES está ativo
+from . import perfil  # noqa: E402,F401
+
 # Configuração de tarefas periódicas
 app.conf.beat_schedule = {
-    'enviar-lembretes-agendamentos': {
-        'task': 'agendamento.tasks.enviar_lembretes_agendamentos',
-        'schedule': crontab(minute=0, hour=8),  # Todo dia às 8h
+    'processar-lembretes-pendentes': {
+        'task': 'agendamento.tasks.processar_lembretes_pendentes',
+        'schedule': crontab(minute='*'),  # A cada minuto, envia os lembretes programados que venceram
+    },
+    'despachar-notificacoes': {
+        'task': 'agendamento.tasks.despachar_notificacoes',
+        'schedule': 5.0,  # A cada 5 segundos, esvazia o outbox de notificações
     },
     'verificar-agendamentos-perdidos': {
         'task': 'agendamento.tasks.verificar_agendamentos_perdidos',
         'schedule': crontab(minute=0, hour='*/2'),  # A cada 2 horas
     },
+    'limpar-historico-notificacoes': {
+        'task': 'agendamento.tasks.limpar_historico_notificacoes',
+        'schedule': crontab(minute=30, hour=3),  # Todo dia às 3h30
+    },
+    'limpar-conexoes-expiradas': {
+        'task': 'agendamento.tasks.limpar_conexoes_expiradas',
+        'schedule': crontab(minute='*/5'),  # A cada 5 minutos
+    },
 }
 
 app.conf.timezone = 'America/Sao_Paulo'
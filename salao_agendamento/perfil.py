@@ -0,0 +1,252 @@
+"""
+Perfil de requisições e tarefas: número de consultas, tempo de banco, tempo de
+renderização de templates e latência total por view (nome resolvido da URL).
+
+Ativado com PERFIL_REQUISICOES = True (variável de ambiente PERFIL_REQUISICOES=1).
+Os valores vão para histogramas em memória do processo, expostos em formato texto do
+Prometheus pelo painel admin (admin_panel:metricas_prometheus).
+
+A lista completa de consultas de uma requisição vai para o log quando um administrador
+envia o cabeçalho X-Perfil, ou por amostragem (PERFIL_AMOSTRAGEM, fração de 0 a 1).
+O cabeçalho Server-Timing com os tempos da requisição só vai para administradores e
+staff; PERFIL_SERVER_TIMING_PUBLICO o libera para todos (benchmarks locais).
+Nas tarefas Celery, cada execução registra uma linha de log com os mesmos números.
+"""
+import bisect
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+METRICAS = (
+    # (atributo da medição, nome no Prometheus, descrição, limites)
+    ('duracao', 'salao_requisicao_duracao_segundos', 'Latência total da requisição', LIMITES_SEGUNDOS),
+    ('tempo_banco', 'salao_requisicao_banco_segundos', 'Tempo gasto em consultas ao banco', LIMITES_SEGUNDOS),
+    ('tempo_template', 'salao_requisicao_template_segundos', 'Tempo de renderização de templates', LIMITES_SEGUNDOS),
+    ('consultas', 'salao_requisicao_consultas', 'Consultas ao banco por requisição', LIMITES_CONSULTAS),
+)
+
+# Medição em andamento no contexto atual (requisição ou tarefa)
+_medicao_atual = contextvars.ContextVar('medicao_perfil', default=None)
+
+
+def ativo():
+    return getattr(settings, 'PERFIL_REQUISICOES', False)
+
+
+class Histograma:
+    """Histograma cumulativo no formato do Prometheus"""
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def acumulados(self):
+        acumulado = 0
+        for limite, contagem in zip((*self.limites, '+Inf'), self.contagens):
+            acumulado += contagem
+            yield limite, acumulado
+
+
+class Registro:
+    """Histogramas por rota, compartilhados pelas threads do processo"""
+
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._rotas = {}
+
+    def registrar(self, rota, medicao):
+        with self._trava:
+            histogramas = self._rotas.get(rota)
+            if histogramas is None:
+                histogramas = self._rotas[rota] = {
+                    atributo: Histograma(limites) for atributo, _, _, limites in METRICAS
+                }
+            for atributo, _, _, _ in METRICAS:
+                histogramas[atributo].observar(getattr(medicao, atributo))
+
+    def limpar(self):
+        with self._trava:
+            self._rotas.clear()
+
+    def prometheus(self):
+        """Exposição em formato texto do Prometheus (versão 0.0.4)"""
+        linhas = []
+        with self._trava:
+            for atributo, nome, descricao, _ in METRICAS:
+                linhas.append(f'# HELP {nome} {descricao}')
+                linhas.append(f'# TYPE {nome} histogram')
+                for rota in sorted(self._rotas):
+                    histograma = self._rotas[rota][atributo]
+                    rotulo = f'view="{_escapar(rota)}"'
+                    for limite, acumulado in histograma.acumulados():
+                        linhas.append(f'{nome}_bucket{{{rotulo},le="{limite}"}} {acumulado}')
+                    linhas.append(f'{nome}_sum{{{rotulo}}} {histograma.soma}')
+                    linhas.append(f'{nome}_count{{{rotulo}}} {histograma.total}')
+        return '\n'.join(linhas) + '\n'
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registro = Registro()
+
+
+class Medicao:
+    """Números de uma requisição ou tarefa; com detalhar=True guarda também cada consulta"""
+
+    def __init__(self, detalhar=False):
+        self.detalhar = detalhar
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.tempo_template = 0.0
+        self.duracao = 0.0
+        self.lista_consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper do Django: envolve cada consulta de todas as conexões
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            tempo = time.perf_counter() - inicio
+            self.consultas += 1
+            self.tempo_banco += tempo
+            if self.detalhar:
+                self.lista_consultas.append((tempo, sql, params))
+
+    def registrar_log(self, rota):
+        logger.info(
+            f"Perfil {rota}: {self.consultas} consultas, banco {self.tempo_banco * 1000:.1f} ms, "
+            f"templates {self.tempo_template * 1000:.1f} ms, total {self.duracao * 1000:.1f} ms"
+        )
+        for tempo, sql, params in self.lista_consultas:
+            logger.info(f"  {tempo * 1000:.2f} ms {sql} {params}")
+
+
+@contextmanager
+def medir(detalhar=False):
+    """Mede as consultas e os templates renderizados no bloco, em qualquer conexão"""
+    medicao = Medicao(detalhar)
+    token = _medicao_atual.set(medicao)
+    inicio = time.perf_counter()
+    try:
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(medicao))
+            yield medicao
+    finally:
+        medicao.duracao = time.perf_counter() - inicio
+        _medicao_atual.reset(token)
+
+
+_templates_instrumentados = False
+
+
+def instrumentar_templates():
+    """Envolve o render do backend de templates do Django para somar o tempo na medição atual"""
+    global _templates_instrumentados
+    if _templates_instrumentados:
+        return
+    from django.template.backends.django import Template
+
+    render_original = Template.render
+
+    def render(self, context=None, request=None):
+        medicao = _medicao_atual.get()
+        if medicao is None:
+            return render_original(self, context, request)
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, context, request)
+        finally:
+            medicao.tempo_template += time.perf_counter() - inicio
+
+    Template.render = render
+    _templates_instrumentados = True
+
+
+class PerfilMiddleware:
+    """
+    Middleware opcional de perfil por view. Deve ficar no início do MIDDLEWARE para
+    que a latência inclua os demais middlewares.
+    """
+
+    def __init__(self, get_response):
+        if not ativo():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.amostragem = getattr(settings, 'PERFIL_AMOSTRAGEM', 0)
+        self.server_timing_publico = getattr(settings, 'PERFIL_SERVER_TIMING_PUBLICO', False)
+        instrumentar_templates()
+
+    def __call__(self, request):
+        solicitado = 'HTTP_X_PERFIL' in request.META
+        detalhar = solicitado or (self.amostragem and random.random() < self.amostragem)
+
+        with medir(detalhar=detalhar) as medicao:
+            response = self.get_response(request)
+
+        rota = request.resolver_match.view_name if request.resolver_match else '<sem rota>'
+        registro.registrar(rota, medicao)
+
+        usuario = getattr(request, 'user', None)
+        administrador = bool(usuario and usuario.is_authenticated and usuario.is_admin())
+        # A lista de consultas só é pedida por administradores (o cabeçalho é ignorado para os demais)
+        if solicitado and not administrador:
+            detalhar = False
+        if detalhar:
+            medicao.registrar_log(rota)
+
+        # Tempos de banco e templates não são expostos a visitantes
+        if administrador or (usuario and usuario.is_staff) or self.server_timing_publico:
+            response['Server-Timing'] = (
+                f'db;dur={medicao.tempo_banco * 1000:.1f};desc="{medicao.consultas} consultas", '
+                f'tpl;dur={medicao.tempo_template * 1000:.1f}, '
+                f'total;dur={medicao.duracao * 1000:.1f}'
+            )
+        return response
+
+
+# Tarefas Celery: medição por execução, registrada em log no worker
+_medicoes_tarefas = {}
+
+
+@task_prerun.connect
+def _tarefa_iniciada(task_id=None, task=None, **kwargs):
+    if not ativo():
+        return
+    contexto = medir(detalhar=random.random() < getattr(settings, 'PERFIL_AMOSTRAGEM', 0))
+    _medicoes_tarefas[task_id] = (contexto, contexto.__enter__())
+
+
+@task_postrun.connect
+def _tarefa_concluida(task_id=None, task=None, **kwargs):
+    em_andamento = _medicoes_tarefas.pop(task_id, None)
+    if em_andamento is None:
+        return
+    contexto, medicao = em_andamento
+    contexto.__exit__(None, None, None)
+    rota = f'tarefa:{task.name}'
+    registro.registrar(rota, medicao)
+    medicao.registrar_log(rota)
@@ -0,0 +1,127 @@
+"""
+Réplica de leitura para painéis e relatórios.
+
+Só as views marcadas com @leitura_replica leem da réplica (alias REPLICA_ALIAS), e
+apenas em requisições GET/HEAD. Todo o resto continua no banco principal:
+
+- escritas, e leituras dentro de transaction.atomic() (verificações de conflito e
+  disponibilidade do agendamento);
+- as views do fluxo público de agendamento, que não são marcadas;
+- sessões;
+- as requisições do usuário nos REPLICA_FIXAR_PRIMARIO_SEGUNDOS seguintes a uma escrita
+  dele (POST, PUT, PATCH, DELETE), marcadas por um cookie, para que o redirect depois de
+  um formulário já mostre o que foi gravado.
+
+Sem a réplica configurada em DATABASES, tudo vai para o principal. Configuração:
+
+    DATABASE_ROUTERS = ['salao_agendamento.replicas.RoteadorReplica']
+    MIDDLEWARE = [..., 'salao_agendamento.replicas.ReplicaMiddleware', ...]
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+COOKIE_PRIMARIO = 'primario_ate'
+METODOS_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+
+# Apps sempre lidos do principal
+APPS_PRIMARIO = {'sessions'}
+
+_ler_da_replica = contextvars.ContextVar('ler_da_replica', default=False)
+
+
+def replica_configurada():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def ler_da_replica():
+    """Leituras do bloco vão para a réplica (fora de transações)"""
+    token = _ler_da_replica.set(True)
+    try:
+        yield
+    finally:
+        _ler_da_replica.reset(token)
+
+
+@contextmanager
+def ler_do_primario():
+    """Leituras do bloco vão para o principal mesmo dentro de ler_da_replica()"""
+    token = _ler_da_replica.set(False)
+    try:
+        yield
+    finally:
+        _ler_da_replica.reset(token)
+
+
+def leitura_replica(view):
+    """Marca uma view somente leitura de painel/relatório para ler da réplica"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if getattr(request, 'fixar_primario', True):
+            return view(request, *args, **kwargs)
+        with ler_da_replica():
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class RoteadorReplica:
+    """Router de banco: leituras marcadas vão para a réplica, o resto para o principal"""
+
+    def db_for_read(self, model, **hints):
+        if (
+            _ler_da_replica.get()
+            and replica_configurada()
+            and model._meta.app_label not in APPS_PRIMARIO
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Explícito: sem isso o Django gravaria no banco de onde a instância foi lida
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A réplica é uma cópia do principal; objetos dos dois podem se relacionar
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema pela cópia (manage.py sincronizar_replica)
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Decide se a requisição pode usar a réplica (request.fixar_primario) e, depois de uma
+    escrita, fixa o usuário no principal por REPLICA_FIXAR_PRIMARIO_SEGUNDOS via cookie.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.janela = getattr(settings, 'REPLICA_FIXAR_PRIMARIO_SEGUNDOS', 10)
+
+    def __call__(self, request):
+        escrita = request.method not in METODOS_LEITURA
+        try:
+            fixado = float(request.COOKIES.get(COOKIE_PRIMARIO, 0)) > time.time()
+        except ValueError:
+            fixado = False
+        request.fixar_primario = escrita or fixado or not replica_configurada()
+
+        response = self.get_response(request)
+
+        if escrita and replica_configurada():
+            response.set_cookie(
+                COOKIE_PRIMARIO, str(time.time() + self.janela), max_age=self.janela, httponly=True, samesite='Lax'
+            )
+        return response
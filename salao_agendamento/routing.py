@@ -1,12 +1,12 @@
 
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
+from accounts.websocket_middleware import CachedAuthMiddlewareStack
 import agendamento.routing
 
 application = ProtocolTypeRouter({
     'websocket': AllowedHostsOriginValidator(
-        AuthMiddlewareStack(
+        CachedAuthMiddlewareStack(
             URLRouter(
                 agendamento.routing.websocket_urlpatterns
             )
@@ -0,0 +1,189 @@
+"""
+Backend de sessões com escrita coalescida, compatível com as sessões em banco.
+
+Com SESSION_SAVE_EVERY_REQUEST, toda requisição (inclusive o polling JSON do
+calendário) regravaria a linha da sessão só para empurrar a expiração. Aqui:
+
+- a sessão fica em cache (dados, expiração atual e expiração gravada no banco). O
+  cache precisa ser compartilhado entre os workers (Redis, Memcached, arquivo): com um
+  cache local ao processo (LocMemCache) um logout em um worker não invalidaria a cópia
+  dos demais, então nesse caso as leituras vão sempre ao banco;
+- dados alterados (login, logout, mensagens) são gravados no banco na hora;
+- com dados iguais, a expiração só é persistida quando avança mais que
+  SESSAO_LIMIAR_RENOVACAO_SEGUNDOS, e essas renovações são agrupadas por uma thread
+  em uma única transação a cada SESSAO_INTERVALO_GRAVACAO_SEGUNDOS (e na saída do
+  processo, pelo atexit).
+
+As renovações em fila só alteram expire_date, e apenas para frente, então nunca
+sobrescrevem dados gravados depois por outra requisição.
+
+Configuração:
+
+    SESSION_ENGINE = 'salao_agendamento.sessoes'
+"""
+import atexit
+import copy
+import logging
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'sessao_coalescida_'
+
+# Renovações de expiração aguardando gravação: session_key -> nova expire_date
+_pendentes = {}
+_trava = threading.Lock()
+_gravador = None
+_parar = threading.Event()
+
+
+def _cache():
+    """Cache das sessões, ou None quando ele é local ao processo e não pode ser usado nas leituras"""
+    cache = caches[getattr(settings, 'SESSAO_CACHE', 'default')]
+    return None if isinstance(cache, LocMemCache) else cache
+
+
+def _limiar():
+    return timedelta(seconds=getattr(settings, 'SESSAO_LIMIAR_RENOVACAO_SEGUNDOS', 3600))
+
+
+def gravar_pendentes():
+    """Persiste em lote as renovações de expiração em fila. Retorna quantas gravou."""
+    with _trava:
+        lote = list(_pendentes.items())
+        _pendentes.clear()
+    if not lote:
+        return 0
+
+    modelo = SessionStore.get_model_class()
+    using = modelo.objects.db
+    with transaction.atomic(using=using):
+        for session_key, expira in lote:
+            modelo.objects.filter(session_key=session_key, expire_date__lt=expira).update(expire_date=expira)
+    return len(lote)
+
+
+def _executar_gravador():
+    intervalo = getattr(settings, 'SESSAO_INTERVALO_GRAVACAO_SEGUNDOS', 5)
+    while not _parar.wait(intervalo):
+        try:
+            gravar_pendentes()
+        except Exception as e:
+            logger.error(f"Erro ao gravar renovações de sessão: {str(e)}")
+        finally:
+            connections.close_all()
+
+
+def _agendar_renovacao(session_key, expira):
+    global _gravador
+    with _trava:
+        _pendentes[session_key] = expira
+        if _gravador is None:
+            _gravador = threading.Thread(target=_executar_gravador, name='gravador-sessoes', daemon=True)
+            _gravador.start()
+            atexit.register(_encerrar)
+
+
+def _encerrar():
+    """Na saída do processo: para a thread e grava as renovações que ainda estão em fila"""
+    _parar.set()
+    gravar_pendentes()
+
+
+class SessionStore(DBStore):
+    """SessionStore do backend de banco com leitura em cache e escrita coalescida"""
+
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        self._cache = _cache()
+        # (dados, expire_date) como estão no banco, para decidir se a gravação é necessária
+        self._persistido = None
+        super().__init__(session_key)
+
+    @property
+    def cache_key(self):
+        return self.cache_key_prefix + self._get_or_create_session_key()
+
+    def _guardar(self, dados, expira, gravada):
+        if self._cache is None:
+            return
+        self._cache.set(
+            self.cache_key,
+            {'dados': dados, 'expira': expira, 'gravada': gravada},
+            getattr(settings, 'SESSAO_CACHE_SEGUNDOS', 300)
+        )
+
+    def load(self):
+        entrada = self._cache.get(self.cache_key) if self._cache and self.session_key else None
+        if entrada is not None and entrada['expira'] > timezone.now():
+            self._persistido = (copy.deepcopy(entrada['dados']), entrada['gravada'])
+            return entrada['dados']
+
+        s = self._get_session_from_db()
+        if s is None:
+            return {}
+        dados = self.decode(s.session_data)
+        self._persistido = (copy.deepcopy(dados), s.expire_date)
+        self._guardar(dados, s.expire_date, s.expire_date)
+        return dados
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        dados = self._get_session(no_load=must_create)
+        expira = self.get_expiry_date()
+
+        if not must_create and self._persistido is not None and dados == self._persistido[0]:
+            gravada = self._persistido[1]
+            if expira - gravada >= _limiar():
+                _agendar_renovacao(self.session_key, expira)
+                gravada = expira
+                self._persistido = (self._persistido[0], gravada)
+            self._guardar(dados, expira, gravada)
+            return
+
+        with _trava:
+            _pendentes.pop(self.session_key, None)
+        super().save(must_create=must_create)
+        self._persistido = (copy.deepcopy(dados), expira)
+        self._guardar(dados, expira, expira)
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        with _trava:
+            _pendentes.pop(session_key, None)
+        if self._cache is not None:
+            self._cache.delete(self.cache_key_prefix + session_key)
+
+    def flush(self):
+        """Remove a sessão atual e gera uma nova chave (logout)"""
+        super().flush()
+        self._persistido = None
+
+    # Os métodos assíncronos passam pelos síncronos para manter cache e fila coerentes
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create)
+
+    async def adelete(self, session_key=None):
+        return await sync_to_async(self.delete)(session_key)
+
+    async def aflush(self):
+        return await sync_to_async(self.flush)()
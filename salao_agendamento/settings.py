@@ -60,6 +60,23 @@ SESSION_COOKIE_NAME = 'sessionid'
 SESSION_COOKIE_PATH = '/'
 SESSION_COOKIE_DOMAIN = None
 
+# Sessões em banco com leitura em cache e renovação da expiração gravada em lote
+# (ver salao_agendamento/sessoes.py). A leitura em cache só é usada com um cache
+# compartilhado entre os workers (REDIS_URL); com o cache local as leituras vão ao banco
+SESSION_ENGINE = 'salao_agendamento.sessoes'
+SESSAO_CACHE = 'default'
+SESSAO_CACHE_SEGUNDOS = 300
+SESSAO_LIMIAR_RENOVACAO_SEGUNDOS = 3600
+SESSAO_INTERVALO_GRAVACAO_SEGUNDOS = 5
+
+# Perfil por view (consultas, tempo de banco e de templates, latência), exposto em
+# /admin-panel/metricas/prometheus/. PERFIL_AMOSTRAGEM é a fração de requisições com
+# a lista de consultas no log (administradores podem pedir com o cabeçalho X-Perfil)
+PERFIL_REQUISICOES = os.environ.get('PERFIL_REQUISICOES') == '1'
+PERFIL_AMOSTRAGEM = float(os.environ.get('PERFIL_AMOSTRAGEM', '0'))
+# Server-Timing também para visitantes anônimos: só em benchmarks locais (benchmark_agendamento)
+PERFIL_SERVER_TIMING_PUBLICO = os.environ.get('PERFIL_SERVER_TIMING_PUBLICO') == '1'
+
 # Frame options for iframe support
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 
@@ -84,14 +101,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'salao_agendamento.perfil.PerfilMiddleware',  # Só atua com PERFIL_REQUISICOES ativo
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'accounts.middleware.PublicPathSessionMiddleware',  # Não regrava a sessão nas rotas públicas
     'django.middleware.common.CommonMiddleware',
     'accounts.csrf_middleware.ReplitCsrfMiddleware',  # Middleware customizado para Replit
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',  # Antes do UserTypeMiddleware, que avisa conta desativada
     'accounts.middleware.UserTypeMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'salao_agendamento.replicas.ReplicaMiddleware',  # Fixa no banco principal após escritas
+    'salao_agendamento.shards.ShardMiddleware',  # Só atua com SHARDS configurados
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -122,13 +142,64 @@ WSGI_APPLICATION = 'salao_agendamento.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite ajustado para vários workers: WAL (leitores não bloqueiam o escritor),
+# synchronous=NORMAL (seguro com WAL; uma queda de energia pode perder só os últimos
+# commits), mmap e cache de páginas de 64 MiB. 'timeout' é o busy_timeout, em segundos:
+# quem encontra o banco travado espera em vez de falhar com "database is locked".
+# BEGIN IMMEDIATE pega a trava de escrita no início do atomic(), evitando o erro ao
+# promover uma transação de leitura a escrita. Comparação: manage.py benchmark_sqlite
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'cache_size': -64 * 1024,  # negativo: em KiB
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Conexões persistentes: os PRAGMAs rodam uma vez por conexão, não por requisição
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(f'PRAGMA {nome}={valor}' for nome, valor in SQLITE_PRAGMAS.items()),
+        },
     }
 }
 
+# Réplica de leitura opcional para painéis e relatórios (views com @leitura_replica,
+# ver salao_agendamento/replicas.py). Localmente, com um segundo arquivo SQLite:
+#   DB_REPLICA=db_replica.sqlite3 python manage.py sincronizar_replica --intervalo 5
+if os.environ.get('DB_REPLICA'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'], NAME=BASE_DIR / os.environ['DB_REPLICA'], TEST={'MIRROR': 'default'}
+    )
+
+# Modo de shards por comerciante, opcional (ver salao_agendamento/shards.py). Cada
+# arquivo de DB_SHARDS vira um banco extra; crie o esquema com
+# "manage.py migrate --database shard_1" e mova comerciantes com mover_comerciante.
+# Nos shards extras as tabelas fora do shard (usuários, presença) ficam vazias ou são
+# cópias, então eles não verificam FOREIGN KEY; o principal continua verificando, e a
+# única referência dele a um modelo de shard (presença -> comerciante) não tem constraint
+SHARDS = []
+for _numero, _arquivo in enumerate(filter(None, os.environ.get('DB_SHARDS', '').split(',')), start=1):
+    SHARDS.append(f'shard_{_numero}')
+    _opcoes = DATABASES['default']['OPTIONS']
+    DATABASES[f'shard_{_numero}'] = dict(
+        DATABASES['default'],
+        NAME=BASE_DIR / _arquivo.strip(),
+        OPTIONS=dict(_opcoes, init_command=_opcoes['init_command'] + ';PRAGMA foreign_keys=OFF'),
+    )
+SHARDS_CACHE_SEGUNDOS = 60
+
+DATABASE_ROUTERS = ['salao_agendamento.shards.RoteadorShards', 'salao_agendamento.replicas.RoteadorReplica']
+# Depois de uma escrita, as requisições do usuário ficam no principal por este tempo
+REPLICA_FIXAR_PRIMARIO_SEGUNDOS = 10
+
 # Configuração para PostgreSQL em produção
 # DATABASES = {
 #     'default': {
@@ -207,7 +278,33 @@ DEFAULT_FROM_EMAIL = 'noreply@seudominio.com'
 # EMAIL_HOST_USER = 'seu_email@gmail.com'
 # EMAIL_HOST_PASSWORD = 'sua_senha'
 
-# Configurações removidas: Twilio/WhatsApp não será mais usado
+# Canais de notificação (confirmações e lembretes). Cada canal tem concorrência e limite de envios por segundo próprios;
+# clientes com canal_preferido sem canal configurado recebem por email, e o formulário
+# público só oferece os canais configurados.
+# Para testes/benchmarks use 'BACKEND': 'agendamento.canais.CanalFake'.
+NOTIFICACAO_CANAIS = {
+    'email': {
+        'BACKEND': 'agendamento.canais.CanalEmail',
+        'MAX_CONCORRENCIA': 10,
+    },
+}
+
+# SMS/WhatsApp via Twilio, habilitados apenas quando as credenciais estão no ambiente
+TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
+TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', '')
+if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
+    NOTIFICACAO_CANAIS['sms'] = {
+        'BACKEND': 'agendamento.canais.CanalTwilio',
+        'MAX_CONCORRENCIA': 5,
+        'LIMITE_POR_SEGUNDO': 1,
+        'OPCOES': {'remetente': os.environ.get('TWILIO_SMS_FROM', '')},
+    }
+    NOTIFICACAO_CANAIS['whatsapp'] = {
+        'BACKEND': 'agendamento.canais.CanalTwilio',
+        'MAX_CONCORRENCIA': 5,
+        'LIMITE_POR_SEGUNDO': 1,
+        'OPCOES': {'remetente': os.environ.get('TWILIO_WHATSAPP_FROM', ''), 'whatsapp': True},
+    }
 
 # URL base do site
 BASE_URL = os.environ.get('BASE_URL', 'http://localhost:5000')
@@ -222,6 +319,20 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'America/Sao_Paulo'
 
+# Quantidade de lembretes processados (e enviados pela mesma conexão SMTP) por lote
+LEMBRETES_TAMANHO_LOTE = 200
+
+# Antecedências (em minutos) em que cada agendamento recebe lembrete: 24h e 2h antes
+LEMBRETES_ANTECEDENCIAS_MINUTOS = [24 * 60, 2 * 60]
+
+# Outbox de notificações: tamanho do lote, limite de tentativas e backoff base (dobra a cada falha)
+OUTBOX_TAMANHO_LOTE = 100
+OUTBOX_MAX_TENTATIVAS = 5
+OUTBOX_BACKOFF_SEGUNDOS = 30
+# Janela de micro-lote: em rajadas, o despachante espera até esse tempo para juntar
+# até OUTBOX_TAMANHO_LOTE notificações antes de enviar pela mesma conexão SMTP
+OUTBOX_MICRO_LOTE_JANELA_MS = 200
+
 # Configurações do Django Channels - usando InMemoryChannelLayer
 ASGI_APPLICATION = 'salao_agendamento.routing.application'
 
@@ -231,6 +342,61 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Vários workers ASGI no mesmo host (sem Redis): CHANNEL_LAYER=sqlite usa um journal
+# SQLite compartilhado entre os processos
+if os.environ.get('CHANNEL_LAYER') == 'sqlite':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'salao_agendamento.camada_canais.CamadaCanaisSQLite',
+            'CONFIG': {
+                'caminho': os.environ.get('CHANNEL_LAYER_CAMINHO', str(BASE_DIR / 'canais.sqlite3')),
+            },
+        },
+    }
+
+# Cache local por processo; com REDIS_URL o cache 'default' passa a ser compartilhado entre
+# os workers (limite de sockets por IP, invalidações de sessão e de autenticação)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+    }
+
+# Notificações recebidas por um socket dentro dessa janela são entregues juntas, agrupadas por tipo
+NOTIFICACOES_JANELA_AGRUPAMENTO_MS = 250
+
+# Histórico de notificações para reenvio após reconexão: retenção e máximo de quadros reenviados
+NOTIFICACOES_RETENCAO_DIAS = 7
+NOTIFICACOES_REPLAY_LIMITE = 500
+
+# Heartbeat dos websockets: intervalo entre batimentos do servidor e tempo sem sinal do
+# cliente até o socket ser fechado (e a presença considerada expirada)
+WEBSOCKET_HEARTBEAT_SEGUNDOS = 25
+WEBSOCKET_TIMEOUT_OCIOSO_SEGUNDOS = 75
+# Notificações para usuários sem socket vivo ficam apenas no histórico (sem group_send)
+NOTIFICACOES_APENAS_CONECTADOS = True
+
+# Cache da sessão para o usuário na autenticação dos websockets. Com vários workers,
+# aponte WEBSOCKET_AUTH_CACHE para um cache compartilhado para que logout e desativação
+# invalidem todos os processos (o TTL limita a defasagem nos demais casos)
+WEBSOCKET_AUTH_CACHE = 'default'
+WEBSOCKET_AUTH_CACHE_SEGUNDOS = 30
+
+# Contexto do estabelecimento (request.tenant) em cache por usuário; invalidado nas
+# edições de perfil, e o TTL limita a defasagem entre processos com cache local
+TENANT_CACHE_SEGUNDOS = 300
+
+# Página pública: sockets anônimos de disponibilidade de horários permitidos por IP. O
+# contador fica em DISPONIBILIDADE_CACHE, que precisa ser compartilhado (REDIS_URL) para o
+# limite valer para a frota inteira e não por worker
+DISPONIBILIDADE_MAX_CONEXOES_POR_IP = 10
+DISPONIBILIDADE_CACHE = 'default'
+
+# Proxies reversos (IPs) cujo X-Forwarded-For é aceito para identificar o cliente
+PROXIES_CONFIAVEIS = [ip.strip() for ip in os.environ.get('PROXIES_CONFIAVEIS', '').split(',') if ip.strip()]
+
 # Login URLs
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -0,0 +1,331 @@
+"""
+Modo de shards por comerciante (opcional).
+
+Cada comerciante, com funcionários, serviços (e o M2M), clientes, agendamentos,
+lembretes e notificações do outbox, fica em um único banco (shard). O diretório
+(agendamento.ShardComerciante, no banco principal) diz em qual; sem registro no
+diretório, o comerciante fica no banco principal, que também é um shard.
+
+Usuários, sessões, presença e o histórico de notificações continuam no principal. A
+tabela de usuários é copiada para todos os shards (post_save/post_delete), para que os
+JOINs com user (select_related) funcionem dentro do shard.
+
+O shard de cada consulta vem do contexto atual:
+
+- requisições: ShardMiddleware, pelo comerciante_id da URL ou pelo tenant do usuário;
+- tarefas periódicas: @para_cada_shard executa a tarefa uma vez em cada shard;
+- código avulso: with usar_comerciante(id) / usar_shard(alias), ou
+  Modelo.objects.do_comerciante(id).
+
+Os ids das tabelas dos shards começam em faixas separadas (FAIXA_IDS por shard), então
+continuam únicos entre shards e um comerciante pode ser movido sem renumerar nada
+(manage.py mover_comerciante). O painel admin soma os shards com consultar_shards().
+
+Configuração (ver settings, DB_SHARDS): SHARDS com os aliases extras de DATABASES, e
+
+    DATABASE_ROUTERS = ['salao_agendamento.shards.RoteadorShards', ...]
+    MIDDLEWARE = [..., 'salao_agendamento.shards.ShardMiddleware', ...]
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections, models
+
+# Tabelas que ficam no shard do comerciante (label_lower dos modelos)
+MODELOS_SHARD = {
+    'agendamento.comerciante',
+    'agendamento.funcionario',
+    'agendamento.servico',
+    'agendamento.servico_funcionarios',
+    'agendamento.cliente',
+    'agendamento.agendamento',
+    'agendamento.lembreteagendado',
+    'agendamento.notificacaooutbox',
+}
+
+# Ids do shard N (1, 2, ...) começam em N * FAIXA_IDS; o principal fica com a faixa 0
+FAIXA_IDS = 10 ** 12
+
+_shard_atual = contextvars.ContextVar('shard_atual', default=None)
+
+
+def shards_extras():
+    return list(getattr(settings, 'SHARDS', []))
+
+
+def ativo():
+    return bool(shards_extras())
+
+
+def todos():
+    """O principal e os shards extras"""
+    return [DEFAULT_DB_ALIAS, *shards_extras()]
+
+
+def modelo_shard(model):
+    return model._meta.label_lower in MODELOS_SHARD
+
+
+def _chave(comerciante_id):
+    return f'shard_comerciante_{comerciante_id}'
+
+
+def shard_do_comerciante(comerciante_id):
+    """Alias do banco do comerciante, pelo diretório (em cache)"""
+    if not ativo():
+        return DEFAULT_DB_ALIAS
+    alias = cache.get(_chave(comerciante_id))
+    if alias is None:
+        from agendamento.models import ShardComerciante
+
+        alias = (
+            ShardComerciante.objects.using(DEFAULT_DB_ALIAS)
+            .filter(comerciante_id=comerciante_id).values_list('shard', flat=True).first()
+        ) or DEFAULT_DB_ALIAS
+        cache.set(_chave(comerciante_id), alias, getattr(settings, 'SHARDS_CACHE_SEGUNDOS', 60))
+    return alias
+
+
+def invalidar_shard(comerciante_id):
+    cache.delete(_chave(comerciante_id))
+
+
+def escolher_shard_novo():
+    """Shard para um comerciante novo: o que tem menos comerciantes"""
+    if not ativo():
+        return DEFAULT_DB_ALIAS
+    return min(todos(), key=lambda alias: _comerciantes_no_shard(alias))
+
+
+def _comerciantes_no_shard(alias):
+    from agendamento.models import Comerciante
+
+    return Comerciante.objects.using(alias).count()
+
+
+def registrar_comerciante(comerciante):
+    """Grava no diretório o shard onde o comerciante foi criado"""
+    from agendamento.models import ShardComerciante
+
+    if not ativo():
+        return
+    ShardComerciante.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        comerciante_id=comerciante.id, defaults={'shard': comerciante._state.db}
+    )
+    invalidar_shard(comerciante.id)
+
+
+@contextmanager
+def usar_shard(alias):
+    """Consultas do bloco aos modelos de shard vão para `alias`"""
+    token = _shard_atual.set(alias)
+    try:
+        yield
+    finally:
+        _shard_atual.reset(token)
+
+
+def usar_comerciante(comerciante_id):
+    return usar_shard(shard_do_comerciante(comerciante_id))
+
+
+def fixar_shard(alias):
+    """Define o shard até o fim da requisição (restaurado pelo ShardMiddleware)"""
+    if ativo():
+        _shard_atual.set(alias)
+
+
+def primeiro_nos_shards(consulta):
+    """Executa `consulta` em cada shard até um resultado diferente de None"""
+    for alias in todos():
+        with usar_shard(alias):
+            resultado = consulta()
+        if resultado is not None:
+            return resultado
+    return None
+
+
+def consultar_shards(consulta):
+    """Resultado de `consulta()` em cada shard, para agregações no painel admin"""
+    resultados = []
+    for alias in todos():
+        with usar_shard(alias):
+            resultados.append(consulta())
+    return resultados
+
+
+def para_cada_shard(funcao):
+    """Executa a tarefa uma vez por shard (tarefas periódicas que varrem todos os comerciantes)"""
+
+    @wraps(funcao)
+    def wrapper(*args, **kwargs):
+        if not ativo():
+            return funcao(*args, **kwargs)
+        for alias in todos():
+            with usar_shard(alias):
+                funcao(*args, **kwargs)
+
+    return wrapper
+
+
+class TenantQuerySet(models.QuerySet):
+    def do_comerciante(self, comerciante_id):
+        """Registros do comerciante, já no shard dele"""
+        campo = 'id' if self.model._meta.model_name == 'comerciante' else 'comerciante_id'
+        return self.using(shard_do_comerciante(comerciante_id)).filter(**{campo: comerciante_id})
+
+
+TenantManager = models.Manager.from_queryset(TenantQuerySet)
+
+
+class RoteadorShards:
+    """
+    Modelos de shard vão para o banco da instância relacionada (hint) ou do contexto
+    atual; os demais, para o principal. Sem SHARDS não decide nada.
+    """
+
+    def _shard(self, hints):
+        instancia = hints.get('instance')
+        if instancia is not None and instancia._state.db in todos():
+            return instancia._state.db
+        return _shard_atual.get() or DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        if not ativo():
+            return None
+        if modelo_shard(model):
+            return self._shard(hints)
+        instancia = hints.get('instance')
+        if instancia is not None and instancia._state.db in shards_extras():
+            # Ex.: usuário carregado por select_related dentro de um shard
+            return DEFAULT_DB_ALIAS
+        # Demais leituras seguem para os próximos routers (réplica)
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not ativo():
+            return None
+        return self._shard(hints) if modelo_shard(model) else DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not ativo():
+            return None
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Todos os bancos têm o esquema completo; as tabelas fora do shard ficam vazias
+        return None
+
+
+class ShardMiddleware:
+    """Escolhe o shard da requisição: comerciante_id da URL ou estabelecimento do usuário"""
+
+    def __init__(self, get_response):
+        if not ativo():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _shard_atual.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _shard_atual.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        comerciante_id = view_kwargs.get('comerciante_id')
+        if comerciante_id is not None:
+            fixar_shard(shard_do_comerciante(comerciante_id))
+        elif request.user.is_authenticated and request.tenant.comerciante is not None:
+            fixar_shard(request.tenant.comerciante._state.db)
+
+
+def copiar_linhas(modelo, origem, destino, lote=500, **filtros):
+    """
+    Copia as linhas filtradas de `modelo` de `origem` para `destino` com os mesmos ids e os
+    valores crus do banco (sem pre_save: auto_now e auto_now_add não mudam). Linhas com o
+    mesmo id no destino são substituídas. Devolve os ids copiados.
+    """
+    campos = modelo._meta.local_concrete_fields
+    consulta = modelo._base_manager.using(origem).filter(**filtros).values_list(*(campo.attname for campo in campos))
+    sql, params = consulta.query.get_compiler(using=origem).as_sql()
+    qn = connections[destino].ops.quote_name
+    tabela = qn(modelo._meta.db_table)
+    indice_pk = campos.index(modelo._meta.pk)
+    inserir = (
+        f'INSERT INTO {tabela} ({", ".join(qn(campo.column) for campo in campos)}) '
+        f'VALUES ({", ".join(["%s"] * len(campos))})'
+    )
+    ids = []
+    with connections[origem].cursor() as leitura, connections[destino].cursor() as escrita:
+        leitura.execute(sql, params)
+        while linhas := leitura.fetchmany(lote):
+            ids_lote = [linha[indice_pk] for linha in linhas]
+            escrita.execute(
+                f'DELETE FROM {tabela} WHERE {qn(modelo._meta.pk.column)} IN ({", ".join(["%s"] * len(ids_lote))})',
+                ids_lote
+            )
+            escrita.executemany(inserir, linhas)
+            ids.extend(ids_lote)
+    return ids
+
+
+def excluir_linhas(modelo, alias, **filtros):
+    """
+    DELETE direto em `alias` das linhas filtradas de `modelo`, sem carregá-las e sem a
+    cascata do ORM, que alcançaria tabelas fora do shard (ex.: presença, no principal)
+    """
+    sql, params = modelo._base_manager.using(alias).filter(**filtros).values('pk').query.get_compiler(
+        using=alias
+    ).as_sql()
+    qn = connections[alias].ops.quote_name
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {qn(modelo._meta.db_table)} WHERE {qn(modelo._meta.pk.column)} IN ({sql})', params
+        )
+        return cursor.rowcount
+
+
+def replicar_usuario(sender, instance, using, raw=False, **kwargs):
+    """Cópia do usuário em todos os shards (a fonte continua sendo o principal)"""
+    if raw or using != DEFAULT_DB_ALIAS or not ativo():
+        return
+    for alias in shards_extras():
+        copiar_linhas(sender, DEFAULT_DB_ALIAS, alias, pk=instance.pk)
+
+
+def remover_usuario(sender, instance, using, **kwargs):
+    """Remove a cópia do usuário dos shards, em cascata com o que depende dele lá"""
+    if using != DEFAULT_DB_ALIAS or not ativo():
+        return
+    for alias in shards_extras():
+        sender.objects.using(alias).filter(pk=instance.pk).delete()
+
+
+def reservar_faixa_ids(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate: posiciona o AUTOINCREMENT das tabelas de shard de cada shard extra
+    no início da sua faixa de ids (só SQLite; em outros bancos, ajuste as sequências)
+    """
+    if using not in shards_extras():
+        return
+    conexao = connections[using]
+    if conexao.vendor != 'sqlite':
+        return
+    from django.apps import apps
+
+    inicio = (shards_extras().index(using) + 1) * FAIXA_IDS
+    tabelas = [
+        modelo._meta.db_table for modelo in apps.get_models(include_auto_created=True) if modelo_shard(modelo)
+    ]
+    with conexao.cursor() as cursor:
+        for tabela in tabelas:
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [inicio, tabela, inicio])
+            if not cursor.rowcount:
+                cursor.execute('SELECT 1 FROM sqlite_sequence WHERE name = %s', [tabela])
+                if cursor.fetchone() is None:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [tabela, inicio])
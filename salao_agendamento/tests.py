@@ -0,0 +1,472 @@
+import asyncio
+import io
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from channels.exceptions import ChannelFull
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from accounts.tenant import carregar_tenant
+from agendamento.models import (
+    Agendamento, Cliente, Comerciante, Funcionario, LembreteAgendado, NotificacaoOutbox, PresencaConexao,
+    Servico, ShardComerciante,
+)
+from agendamento.disponibilidade import dia_agendamento, publicar_disponibilidade
+from agendamento.outbox import registrar_notificacao_comerciante, registrar_notificacao_tempo_real
+from agendamento.suporte_testes import criar_estabelecimento
+from salao_agendamento import replicas, sessoes, shards
+from salao_agendamento.camada_canais import CamadaCanaisSQLite
+
+
+@override_settings(PERFIL_REQUISICOES=True)
+class PerfilServerTimingTests(TestCase):
+    """O Server-Timing expõe tempos de banco e templates: só para administradores e staff"""
+
+    def test_visitante_nao_recebe_server_timing(self):
+        resposta = self.client.get('/accounts/login/')
+        self.assertNotIn('Server-Timing', resposta.headers)
+
+    def test_administrador_recebe_server_timing(self):
+        self.client.force_login(User.objects.create_user(username='admin', tipo_usuario='admin'))
+        resposta = self.client.get('/accounts/login/')
+        self.assertIn('consultas', resposta.headers['Server-Timing'])
+
+    @override_settings(PERFIL_SERVER_TIMING_PUBLICO=True)
+    def test_liberado_para_benchmarks(self):
+        resposta = self.client.get('/accounts/login/')
+        self.assertIn('Server-Timing', resposta.headers)
+
+
+class CamadaCanaisSQLiteTests(SimpleTestCase):
+    """
+    Mesmos cenários dos testes do InMemoryChannelLayer do channels; duas instâncias
+    sobre o mesmo arquivo fazem o papel de dois processos.
+    """
+
+    def setUp(self):
+        self.diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.diretorio.cleanup)
+
+    def camada(self, **kwargs):
+        return CamadaCanaisSQLite(caminho=f'{self.diretorio.name}/canais.sqlite3', **kwargs)
+
+    async def receber(self, camada, canal, tempo=1):
+        return await asyncio.wait_for(camada.receive(canal), tempo)
+
+    async def test_send_receive(self):
+        camada = self.camada()
+        await camada.send('test-channel-1', {'type': 'test.message', 'text': 'Ahoy-hoy!'})
+        self.assertEqual((await self.receber(camada, 'test-channel-1'))['text'], 'Ahoy-hoy!')
+        await camada.close()
+
+    async def test_send_capacity(self):
+        camada = self.camada(capacity=3)
+        for _ in range(3):
+            await camada.send('test-channel-1', {'type': 'test.message'})
+        with self.assertRaises(ChannelFull):
+            await camada.send('test-channel-1', {'type': 'test.message'})
+        await camada.close()
+
+    async def test_canal_comum_entregue_uma_vez(self):
+        a, b = self.camada(), self.camada()
+        recebendo = [asyncio.ensure_future(camada.receive('tarefas')) for camada in (a, b)]
+        await asyncio.sleep(0.05)
+
+        await a.send('tarefas', {'type': 'test.message', 'n': 1})
+        await a.send('tarefas', {'type': 'test.message', 'n': 2})
+        recebidas = await asyncio.wait_for(asyncio.gather(*recebendo), 1)
+
+        self.assertEqual(sorted(m['n'] for m in recebidas), [1, 2])
+        await a.close()
+        await b.close()
+
+    async def test_groups_entre_processos(self):
+        a, b = self.camada(), self.camada()
+        canal_a, canal_b = await a.new_channel(), await b.new_channel()
+        await a.group_add('test-group', canal_a)
+        await a.group_add('test-group', canal_b)
+        await b.group_discard('test-group', canal_a)
+
+        await b.group_send('test-group', {'type': 'message.1'})
+        self.assertEqual((await self.receber(b, canal_b))['type'], 'message.1')
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receber(a, canal_a, tempo=0.2)
+        await a.close()
+        await b.close()
+
+    async def test_expiry_single(self):
+        camada = self.camada(expiry=0.1)
+        canal = await camada.new_channel()
+        await camada.send(canal, {'type': 'message.1'})
+        await asyncio.sleep(0.2)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receber(camada, canal, tempo=0.2)
+        await camada.close()
+
+    async def test_expiry_remove_canal_dos_grupos(self):
+        camada = self.camada(expiry=0.1)
+        canal = await camada.new_channel()
+        await camada.group_add('test-group', canal)
+        await camada.group_send('test-group', {'type': 'message.1'})
+        await asyncio.sleep(0.2)
+
+        # Como no InMemoryChannelLayer, mensagem não lida e expirada tira o canal do grupo
+        await camada._executar(camada._limpar)
+        await camada.group_send('test-group', {'type': 'message.2'})
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receber(camada, canal, tempo=0.2)
+        await camada.close()
+
+    async def test_leitor_nao_consulta_o_banco_no_event_loop(self):
+        camada = self.camada()
+        threads = []
+        original = camada._versao_dados
+
+        def versao_dados():
+            threads.append(threading.get_ident())
+            return original()
+
+        camada._versao_dados = versao_dados
+        await camada.send('test-channel-1', {'type': 'message.1'})
+        await self.receber(camada, 'test-channel-1')
+
+        self.assertTrue(threads)
+        self.assertNotIn(threading.get_ident(), threads)
+        await camada.close()
+
+    async def test_flush(self):
+        camada = self.camada()
+        await camada.send('test-channel-1', {'type': 'message.1'})
+        await camada.flush()
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.receber(camada, 'test-channel-1', tempo=0.2)
+        await camada.close()
+
+
+class SessoesTests(TransactionTestCase):
+    """Sessões com escrita coalescida: gravação só quando os dados mudam ou a expiração avança"""
+
+    def setUp(self):
+        # Sem a thread de gravação por padrão: os testes gravam a fila explicitamente
+        self.addCleanup(self.parar_gravador)
+        sessoes._gravador = mock.Mock()
+
+    def parar_gravador(self):
+        gravador = sessoes._gravador
+        sessoes._encerrar()
+        if hasattr(gravador, 'join'):
+            gravador.join(1)
+        sessoes._gravador = None
+        sessoes._parar.clear()
+
+    def criar_sessao(self):
+        sessao = sessoes.SessionStore()
+        sessao['user'] = 1
+        sessao.save()
+        return sessao.session_key
+
+    def expiracao_gravada(self, chave):
+        return Session.objects.get(session_key=chave).expire_date
+
+    def test_dados_iguais_nao_regravam(self):
+        chave = self.criar_sessao()
+        sessao = sessoes.SessionStore(chave)
+        self.assertEqual(sessao['user'], 1)
+
+        with self.assertNumQueries(0):
+            sessao.save()
+
+    def test_dados_alterados_gravam_na_hora(self):
+        chave = self.criar_sessao()
+        sessao = sessoes.SessionStore(chave)
+        sessao['user'] = 2
+        sessao.save()
+
+        self.assertEqual(sessoes.SessionStore(chave).load(), {'user': 2})
+
+    @override_settings(SESSAO_LIMIAR_RENOVACAO_SEGUNDOS=0)
+    def test_renovacao_gravada_em_lote(self):
+        chave = self.criar_sessao()
+        anterior = self.expiracao_gravada(chave)
+        sessao = sessoes.SessionStore(chave)
+        self.assertEqual(sessao['user'], 1)
+
+        with self.assertNumQueries(0):
+            sessao.save()
+        self.assertEqual(self.expiracao_gravada(chave), anterior)
+
+        self.assertEqual(sessoes.gravar_pendentes(), 1)
+        self.assertGreater(self.expiracao_gravada(chave), anterior)
+
+    def test_cache_local_nao_esconde_logout_de_outro_worker(self):
+        chave = self.criar_sessao()
+        sessoes.SessionStore(chave).load()
+
+        # Outro worker encerra a sessão: o cache local deste não pode mantê-la viva
+        Session.objects.filter(session_key=chave).delete()
+        self.assertEqual(sessoes.SessionStore(chave).load(), {})
+
+    def test_cache_compartilhado_evita_leitura_no_banco(self):
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'sessoes': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': diretorio},
+            },
+            SESSAO_CACHE='sessoes',
+        ):
+            chave = self.criar_sessao()
+            with self.assertNumQueries(0):
+                self.assertEqual(sessoes.SessionStore(chave).load(), {'user': 1})
+
+            sessoes.SessionStore(chave).flush()
+            self.assertEqual(sessoes.SessionStore(chave).load(), {})
+
+    @override_settings(SESSAO_LIMIAR_RENOVACAO_SEGUNDOS=0, SESSAO_INTERVALO_GRAVACAO_SEGUNDOS=0.05)
+    def test_thread_grava_a_fila_e_atexit_e_registrado(self):
+        sessoes._gravador = None
+        chave = self.criar_sessao()
+        anterior = self.expiracao_gravada(chave)
+        sessao = sessoes.SessionStore(chave)
+        self.assertEqual(sessao['user'], 1)
+
+        with mock.patch.object(sessoes.atexit, 'register') as registrar:
+            sessao.save()
+        registrar.assert_called_once_with(sessoes._encerrar)
+
+        limite = time.monotonic() + 2
+        while self.expiracao_gravada(chave) == anterior and time.monotonic() < limite:
+            time.sleep(0.02)
+        self.assertGreater(self.expiracao_gravada(chave), anterior)
+
+    @override_settings(SESSAO_LIMIAR_RENOVACAO_SEGUNDOS=0)
+    def test_encerramento_grava_a_fila(self):
+        chave = self.criar_sessao()
+        anterior = self.expiracao_gravada(chave)
+        sessao = sessoes.SessionStore(chave)
+        self.assertEqual(sessao['user'], 1)
+        sessao.save()
+
+        sessoes._encerrar()
+        self.assertGreater(self.expiracao_gravada(chave), anterior)
+
+
+class ReplicaTests(TransactionTestCase):
+    """Réplica de leitura: o alias 'replica' aponta para o mesmo banco de teste do principal"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Registrada depois da preparação do TestCase, como os shards; sem transação em
+        # volta do teste, para que o roteador não mande tudo ao principal
+        cls.databases = cls.databases | {replicas.REPLICA_ALIAS}
+        connections.settings[replicas.REPLICA_ALIAS] = dict(connections.settings['default'])
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[replicas.REPLICA_ALIAS].close()
+        del connections[replicas.REPLICA_ALIAS]
+        del connections.settings[replicas.REPLICA_ALIAS]
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.comerciante, _, _ = criar_estabelecimento()
+        self.client.force_login(self.comerciante.user)
+
+    def consultas_na_replica(self, funcao):
+        with CaptureQueriesContext(connections[replicas.REPLICA_ALIAS]) as consultas:
+            funcao()
+        return len(consultas)
+
+    def test_get_em_view_de_leitura_vai_para_a_replica(self):
+        self.assertGreater(self.consultas_na_replica(lambda: self.client.get('/comerciante/')), 0)
+
+    def test_escritas_e_select_for_update_vao_ao_principal(self):
+        with replicas.ler_da_replica():
+            self.assertEqual(Comerciante.objects.all().db, replicas.REPLICA_ALIAS)
+            self.assertEqual(Comerciante.objects.select_for_update().db, 'default')
+            with transaction.atomic():
+                self.assertEqual(Comerciante.objects.all().db, 'default')
+
+            comerciante = Comerciante.objects.get(pk=self.comerciante.pk)
+            comerciante.nome_salao = 'Outro nome'
+            comerciante.save()
+        self.assertEqual(comerciante._state.db, 'default')
+
+    def test_cookie_fixa_no_principal_depois_de_escrita(self):
+        resposta = self.client.post('/comerciante/', {})
+        cookie = resposta.cookies[replicas.COOKIE_PRIMARIO]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_FIXAR_PRIMARIO_SEGUNDOS)
+        self.assertEqual(self.consultas_na_replica(lambda: self.client.get('/comerciante/')), 0)
+
+        # Passada a janela, as leituras voltam para a réplica
+        expirado = time.time() + settings.REPLICA_FIXAR_PRIMARIO_SEGUNDOS + 1
+        with mock.patch('salao_agendamento.replicas.time.time', return_value=expirado):
+            self.assertGreater(self.consultas_na_replica(lambda: self.client.get('/comerciante/')), 0)
+
+    def test_tenant_carregado_do_principal_em_view_de_leitura(self):
+        with replicas.ler_da_replica():
+            tenant = carregar_tenant(self.comerciante.user)
+        self.assertEqual(tenant.comerciante._state.db, 'default')
+        self.assertEqual(carregar_tenant(self.comerciante.user).comerciante._state.db, 'default')
+
+
+class ReplicaNaoConfiguradaTests(SimpleTestCase):
+    """Sem DB_REPLICA o roteador e o middleware não mudam nada"""
+
+    def test_roteador_sem_replica(self):
+        self.assertNotIn(replicas.REPLICA_ALIAS, settings.DATABASES)
+        with replicas.ler_da_replica():
+            self.assertIsNone(replicas.RoteadorReplica().db_for_read(Comerciante))
+
+    def test_middleware_sem_replica(self):
+        request = RequestFactory().post('/comerciante/')
+        resposta = replicas.ReplicaMiddleware(lambda request: HttpResponse())(request)
+        self.assertTrue(request.fixar_primario)
+        self.assertNotIn(replicas.COOKIE_PRIMARIO, resposta.cookies)
+
+
+SHARDS_TESTE = ['shard_1', 'shard_2']
+
+
+@override_settings(SHARDS=SHARDS_TESTE)
+class ShardsTests(TransactionTestCase):
+    """Roteamento por comerciante e mover_comerciante entre dois shards extras (arquivos temporários)"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Os shards são registrados depois da preparação do TestCase, que só conhece os
+        # bancos do settings; cada um é um arquivo migrado aqui e, como os demais bancos
+        # do teste, esvaziado depois de cada teste
+        cls.databases = cls.databases | set(SHARDS_TESTE)
+        cls.diretorio = tempfile.TemporaryDirectory()
+        principal = connections.settings['default']
+        for alias in SHARDS_TESTE:
+            connections.settings[alias] = dict(
+                principal,
+                NAME=f'{cls.diretorio.name}/{alias}.sqlite3',
+                OPTIONS=dict(principal['OPTIONS'], init_command='PRAGMA foreign_keys=OFF'),
+            )
+            call_command('migrate', database=alias, verbosity=0)
+            # O migrate religa as foreign keys na conexão aberta; a próxima volta com o init_command
+            connections[alias].close()
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in SHARDS_TESTE:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        cls.diretorio.cleanup()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        with shards.usar_shard('shard_1'):
+            self.comerciante, self.servico, self.funcionario = criar_estabelecimento()
+            shards.registrar_comerciante(self.comerciante)
+            cliente = Cliente.objects.create(comerciante=self.comerciante, nome='Maria', telefone='1')
+            self.agendamento = Agendamento.objects.create(
+                comerciante=self.comerciante, cliente=cliente, funcionario=self.funcionario,
+                servico=self.servico, data_agendamento=timezone.now() + timedelta(days=1),
+            )
+            LembreteAgendado.objects.create(
+                agendamento=self.agendamento, antecedencia_minutos=60, enviar_em=timezone.now() + timedelta(hours=23)
+            )
+            registrar_notificacao_tempo_real(
+                self.comerciante.user_id, 'novo:1', {'type': 'novo_agendamento'}, agendamento=self.agendamento
+            )
+            # Notificação do estabelecimento, sem agendamento
+            registrar_notificacao_comerciante(self.comerciante.id, 'aviso:1', {'type': 'aviso'})
+        PresencaConexao.objects.create(
+            canal='canal-1', user=self.comerciante.user, comerciante_id=self.comerciante.id, processo='teste'
+        )
+
+    def contagens(self, alias):
+        return {
+            modelo._meta.model_name: modelo._base_manager.using(alias).count()
+            for modelo in (
+                Comerciante, Funcionario, Servico, Servico.funcionarios.through, Cliente,
+                Agendamento, LembreteAgendado, NotificacaoOutbox,
+            )
+        }
+
+    def test_dados_do_comerciante_ficam_no_shard(self):
+        self.assertEqual(self.comerciante._state.db, 'shard_1')
+        self.assertEqual(set(self.contagens('default').values()), {0})
+        self.assertEqual(Agendamento.objects.do_comerciante(self.comerciante.id).get(), self.agendamento)
+        self.assertEqual(self.client.get(f'/agendamento/{self.comerciante.id}/').status_code, 200)
+
+    def test_mover_comerciante(self):
+        antes = self.contagens('shard_1')
+        self.assertEqual(antes['notificacaooutbox'], 2)
+
+        call_command('mover_comerciante', self.comerciante.id, 'shard_2', stdout=io.StringIO())
+
+        self.assertEqual(self.contagens('shard_2'), antes)
+        self.assertEqual(set(self.contagens('shard_1').values()), {0})
+        self.assertEqual(
+            ShardComerciante.objects.get(comerciante_id=self.comerciante.id).shard, 'shard_2'
+        )
+        # A presença, no principal, não é alcançada pela remoção na origem
+        self.assertTrue(PresencaConexao.objects.filter(canal='canal-1').exists())
+        self.assertEqual(self.client.get(f'/agendamento/{self.comerciante.id}/').status_code, 200)
+
+    def test_mover_para_o_principal_com_foreign_keys(self):
+        call_command('mover_comerciante', self.comerciante.id, 'default', stdout=io.StringIO())
+
+        self.assertEqual(self.contagens('default')['notificacaooutbox'], 2)
+        self.assertEqual(set(self.contagens('shard_1').values()), {0})
+        with connections['default'].cursor() as cursor:
+            cursor.execute('PRAGMA foreign_key_check')
+            self.assertEqual(cursor.fetchall(), [])
+
+    def test_disponibilidade_nao_publicada_se_transacao_do_shard_falha(self):
+        # Horários antes = nenhum: qualquer horário livre vira um quadro a enviar
+        antes = {dia_agendamento(self.agendamento): []}
+        with mock.patch('agendamento.consumers.send_notifications_to_groups') as enviar:
+            with shards.usar_shard('shard_1'), self.assertRaises(RuntimeError):
+                with transaction.atomic(using='shard_1'):
+                    publicar_disponibilidade(antes, using='shard_1')
+                    raise RuntimeError
+            enviar.assert_not_called()
+
+            with shards.usar_shard('shard_1'):
+                with transaction.atomic(using='shard_1'):
+                    publicar_disponibilidade(antes, using='shard_1')
+                    enviar.assert_not_called()
+            enviar.assert_called_once()
+
+    def test_mover_agendamento_publica_apos_commit_do_shard(self):
+        def enviar(quadros):
+            # Sem o using do shard, o on_commit no principal (autocommit) rodaria aqui dentro
+            self.assertFalse(connections['shard_1'].in_atomic_block)
+
+        self.client.force_login(self.comerciante.user)
+        nova_data = timezone.localtime(self.agendamento.data_agendamento) + timedelta(days=1)
+        with mock.patch('agendamento.consumers.send_notifications_to_groups', side_effect=enviar) as envio:
+            resposta = self.client.post(
+                '/comerciante/agendamentos/mover/',
+                {'id': self.agendamento.id, 'start': nova_data.isoformat()},
+                content_type='application/json',
+            )
+        self.assertEqual(resposta.status_code, 200, resposta.content)
+        envio.assert_called_once()
+        self.assertEqual(
+            Agendamento.objects.do_comerciante(self.comerciante.id).get().data_agendamento, nova_data
+        )
@@ -6,6 +6,8 @@ class NotificationManager {
         this.maxReconnectAttempts = 5;
         this.reconnectAttempts = 0;
         this.isConnected = false;
+        // Última sequência recebida; enviada como resume_from ao reconectar
+        this.lastSeq = null;
         this.init();
     }
 
@@ -20,7 +22,10 @@ class NotificationManager {
         }
 
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws/notifications/`;
+        let wsUrl = `${protocol}//${window.location.host}/ws/notifications/`;
+        if (this.lastSeq !== null) {
+            wsUrl += `?resume_from=${this.lastSeq}`;
+        }
 
         try {
             this.socket = new WebSocket(wsUrl);
@@ -72,6 +77,44 @@ class NotificationManager {
     handleNotification(data) {
         console.log('Notificação recebida:', data);
 
+        if (data.seq !== undefined && data.seq !== null) {
+            if (data.type === 'connection_established') {
+                // Na primeira conexão, apenas registra de onde retomar
+                if (this.lastSeq === null) {
+                    this.lastSeq = data.seq;
+                }
+            } else {
+                // Descartar quadros já vistos (ex.: entregues ao vivo e também no replay)
+                if (this.lastSeq !== null && data.seq <= this.lastSeq) {
+                    return;
+                }
+                this.lastSeq = data.seq;
+            }
+        }
+
+        if (data.type === 'heartbeat') {
+            // Responder ao batimento do servidor; sem resposta o socket é fechado por ociosidade
+            this.socket.send(JSON.stringify({ type: 'heartbeat' }));
+            return;
+        }
+
+        if (data.type === 'replay_incompleto') {
+            // Perdemos mais do que o histórico guarda: a página deve recarregar seus dados
+            document.dispatchEvent(new CustomEvent('notificacoes:replay-incompleto', { detail: data }));
+            return;
+        }
+
+        if (data.agrupada) {
+            this.handleGroupedNotification(data);
+            return;
+        }
+
+        if (data.type === 'calendario_evento') {
+            // Evento atualizado para o calendário: a página que exibe o calendário aplica a mudança
+            document.dispatchEvent(new CustomEvent('notificacoes:calendario-evento', { detail: data.evento }));
+            return;
+        }
+
         switch (data.type) {
             case 'connection_established':
                 console.log('Conexão estabelecida:', data.message);
@@ -104,6 +147,28 @@ class NotificationManager {
         }
     }
 
+    handleGroupedNotification(data) {
+        // Quadro de resumo: vários agendamentos do mesmo tipo num único toast
+        const config = {
+            'novo_agendamento': ['Novos Agendamentos', 'success', null],
+            'agendamento_confirmado': ['Agendamentos Confirmados', 'info', 'confirmado'],
+            'agendamento_cancelado': ['Agendamentos Cancelados', 'warning', 'cancelado'],
+            'lembrete_agendamento': ['Lembretes', 'info', null],
+            'cliente_nao_compareceu': ['Clientes Não Compareceram', 'danger', 'nao_compareceu']
+        }[data.type] || ['Notificações', 'info', null];
+
+        const [title, type, newStatus] = config;
+        this.showNotification(title, data.message, type);
+
+        if (newStatus) {
+            (data.agendamento_ids || []).forEach(id => this.updateAgendamentosStatus(id, newStatus));
+        }
+        if (data.type === 'novo_agendamento') {
+            this.updateAgendamentosCount(data.total);
+            this.playNotificationSound();
+        }
+    }
+
     showNotification(title, message, type = 'info') {
         // Criar notificação toast
         const toastHtml = `
@@ -166,12 +231,12 @@ class NotificationManager {
         }
     }
 
-    updateAgendamentosCount() {
+    updateAgendamentosCount(increment = 1) {
         // Atualizar contador de agendamentos se existir
         const countElement = document.getElementById('agendamentos-count');
         if (countElement) {
             const currentCount = parseInt(countElement.textContent) || 0;
-            countElement.textContent = currentCount + 1;
+            countElement.textContent = currentCount + increment;
         }
     }
 